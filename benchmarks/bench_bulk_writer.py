@@ -0,0 +1,68 @@
+"""Measure DB write throughput for different bulk writer batch sizes.
+
+Needs the usual PG* environment variables. Writes synthetic reports with
+IDs from 900000000 upwards and deletes them again afterwards.
+Run from the repo root: python -m benchmarks.bench_bulk_writer
+"""
+import argparse
+import logging
+import time
+from datetime import datetime
+
+import src
+
+FIRST_ID = 900_000_000
+TABLES = ("status", "details", "location", "method", "updates", "logs")
+
+def make_report(number):
+    return {
+        "number": number,
+        "status": "Fixed",
+        "editable": False,
+        "timestamp": datetime(2025, 3, 3, 10, 32),
+        "category": "Potholes",
+        "title": "Pothole outside number 12",
+        "description": "Large pothole in the carriageway outside number 12, about a foot across.",
+        "lat": 51.4545,
+        "lon": -2.5879,
+        "council": "Bristol City Council",
+        "method": "mobile",
+        "updates": 2,
+        "latest_update": datetime(2025, 3, 4, 9, 15),
+    }
+
+def delete_benchmark_rows():
+    with src.db_cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(f"DELETE FROM {table} WHERE id >= %s", (FIRST_ID,))
+
+def bench_batch_size(batch_size, reports):
+    if batch_size > 1:
+        src.enable_bulk_writer(flush_size=batch_size, flush_interval_ms=60_000)
+
+    start = time.monotonic()
+    for number in range(FIRST_ID, FIRST_ID + reports):
+        src.SQL_insert_into_db(make_report(number))
+    src.close_bulk_writer()
+    elapsed = time.monotonic() - start
+
+    delete_benchmark_rows()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reports", type=int, default=5000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 100, 1000])
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    delete_benchmark_rows()
+
+    for batch_size in args.batch_sizes:
+        elapsed = bench_batch_size(batch_size, args.reports)
+        rows = args.reports * len(TABLES)
+        print(f"batch size {batch_size:>5}: {args.reports} reports in {elapsed:.2f}s, "
+              f"{rows / elapsed:,.0f} rows/sec")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Measure end-to-end reports/sec through main.main() against the stub server.
+
+This TRUNCATES the report tables of the database it is given, so it must be
+pointed at a throwaway database with --database. The tables are created if
+they don't exist. Run from the repo root:
+python -m benchmarks.bench_end_to_end --database fms_bench
+"""
+import argparse
+import logging
+import os
+import time
+from pathlib import Path
+
+from benchmarks.stub_server import start_stub_server
+
+SCHEMA = Path(__file__).parent / "schema.sql"
+DEFAULT_ERROR_RATES = {403: 0.01, 404: 0.05, 410: 0.02}
+
+def prepare_database(reports):
+    import src
+
+    with src.db_cursor() as cursor:
+        cursor.execute(SCHEMA.read_text())
+        if src.get_storage_layout(refresh=True) == "wide":
+            cursor.execute("TRUNCATE reports, work_leases, dead_letters, tombstones;")
+        else:
+            cursor.execute("TRUNCATE status, details, location, method, updates, logs, work_leases, dead_letters, tombstones;")
+        cursor.execute("DELETE FROM meta;")
+        cursor.execute(
+            "INSERT INTO meta (key, value) VALUES ('UPPER_NUMBER', %s), ('run_AFH', '0');",
+            (str(reports),)
+        )
+
+def bench_end_to_end(database, reports=2000, max_in_flight=32, latency_ms=20, error_rates=None):
+    # must be set before the first DB connection is made
+    os.environ["PGDATABASE"] = database
+
+    server = start_stub_server(error_rates=error_rates or DEFAULT_ERROR_RATES, latency_ms=latency_ms)
+    os.environ["FMS_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+
+    import main
+    logging.getLogger().setLevel(logging.WARNING + 1)
+    prepare_database(reports)
+
+    main.MODE = "scrape"
+    main.STRATEGY = "s"
+    main.TRUNCATE_DB_TABLES = False
+    main.ARCHIVE_PAGES = False
+    main.METRICS_FILE = os.environ.get("METRICS_FILE")
+    main.MAX_IN_FLIGHT = max_in_flight
+    main.MAX_REQUESTS_PER_SECOND = 0
+
+    start = time.monotonic()
+    main.main()
+    elapsed = time.monotonic() - start
+
+    server.shutdown()
+    return reports / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", required=True, help="throwaway database to run against")
+    parser.add_argument("--reports", type=int, default=2000)
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    reports_per_sec = bench_end_to_end(args.database, args.reports, args.max_in_flight, args.latency_ms)
+    print(f"{args.reports} reports end to end: {reports_per_sec:,.1f} reports/sec")
+
+if __name__ == "__main__":
+    main()
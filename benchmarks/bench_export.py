@@ -0,0 +1,73 @@
+"""Measure export throughput and peak memory at two DB sizes, to check
+memory stays flat as the DB grows.
+
+For each size, TRUNCATES the report tables of --database, fills them with
+synthetic reports spread over several years, then runs a full export in a
+fresh process and reports its rows/sec and peak RSS. Run from the repo root:
+python -m benchmarks.bench_export --database fms_bench --sizes 50000 200000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+
+from benchmarks.bench_end_to_end import prepare_database
+from benchmarks.bench_storage_layout import make_varied_report
+
+EXPORT_SCRIPT = """
+import json, logging, resource, sys, time
+import src
+import src.export
+logging.getLogger().setLevel(logging.WARNING)
+# the reports were only just written, export them all
+src.export.EXPORT_SAFETY_SECONDS = 0
+start = time.monotonic()
+count = src.export_reports(sys.argv[1], sys.argv[2], int(sys.argv[3]), full=True)
+elapsed = time.monotonic() - start
+print(json.dumps({"rows": count, "seconds": elapsed,
+                  "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+def fill_database(reports, batch_size=5000):
+    import src
+
+    prepare_database(reports)
+    for first in range(1, reports + 1, batch_size):
+        batch = []
+        for number in range(first, min(first + batch_size, reports + 1)):
+            data = make_varied_report(number)
+            # spread reports over about four years of months
+            data["timestamp"] -= timedelta(hours=number % 35000)
+            batch.append(data)
+        with src.db_cursor() as cursor:
+            src.SQL_upsert_reports(cursor, batch)
+
+def bench_export(database, sizes=(50000, 200000), export_format="parquet", chunk_rows=10000):
+    os.environ["PGDATABASE"] = database
+
+    for size in sizes:
+        fill_database(size)
+        with tempfile.TemporaryDirectory() as directory:
+            output = subprocess.run(
+                [sys.executable, "-c", EXPORT_SCRIPT, directory, export_format, str(chunk_rows)],
+                check=True, capture_output=True, text=True
+            ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{result['rows']:8} rows: {result['rows'] / result['seconds']:8.0f} rows/sec, "
+              f"peak RSS {result['peak_rss_mb']:.0f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", required=True, help="throwaway database to run against")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50000, 200000])
+    parser.add_argument("--format", choices=("parquet", "arrow"), default="parquet")
+    parser.add_argument("--chunk-rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    bench_export(args.database, args.sizes, args.format, args.chunk_rows)
+
+if __name__ == "__main__":
+    main()
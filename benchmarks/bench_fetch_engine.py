@@ -0,0 +1,41 @@
+"""Measure fetch engine throughput against the local stub server.
+
+Parses every page but skips the DB, so only fetch + parse is measured.
+Run from the repo root: python -m benchmarks.bench_fetch_engine
+"""
+import argparse
+import logging
+import os
+import time
+
+from benchmarks.stub_server import start_stub_server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reports", type=int, default=2000)
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument("--rate-limit", type=float, default=0, help="req/s, 0 for unlimited")
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    os.environ["FMS_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+
+    import src
+    logging.getLogger().setLevel(logging.WARNING)
+
+    def parse_only(number, response_content, reason):
+        src.process_report_content(response_content, {"number": number})
+
+    start = time.monotonic()
+    completed = src.run_fetch_engine(
+        range(1, args.reports + 1), parse_only,
+        max_in_flight=args.max_in_flight, rate_limit=args.rate_limit
+    )
+    elapsed = time.monotonic() - start
+
+    print(f"{completed} reports in {elapsed:.2f}s: {completed / elapsed:.1f} reports/sec "
+          f"(max_in_flight={args.max_in_flight}, rate_limit={args.rate_limit or 'unlimited'})")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Measure re-scraping reports that are already in the DB, with and without
+skipping pages whose content fingerprint hasn't changed.
+
+Scrapes --reports IDs from the stub server once, then runs `scrape --ids`
+over the same IDs again, parsing everything and then skipping unchanged
+pages, and compares both with fetching alone. With skipping on, a re-scrape
+of unchanged pages should run at about the fetch-only rate.
+
+Like bench_end_to_end this TRUNCATES the report tables of --database. Run
+from the repo root:
+python -m benchmarks.bench_fingerprint --database fms_bench
+"""
+import argparse
+import logging
+import os
+import time
+
+from benchmarks.bench_end_to_end import prepare_database
+from benchmarks.stub_server import start_stub_server
+
+def run_scrape(ids, skip_unchanged, max_in_flight):
+    import main
+
+    main.MODE = "scrape"
+    main.SCRAPE_IDS = ids
+    main.SKIP_UNCHANGED_PAGES = skip_unchanged
+    main.RUN_INTEGRITY_CHECK = False
+    main.RUN_AUTOFIND = False
+    main.ARCHIVE_PAGES = False
+    main.METRICS_PORT = None
+    main.MAX_IN_FLIGHT = max_in_flight
+    main.MAX_REQUESTS_PER_SECOND = 0
+
+    start = time.monotonic()
+    main.main()
+    return len(ids) / (time.monotonic() - start)
+
+def bench_fingerprint(database, reports=2000, max_in_flight=32, latency_ms=20):
+    os.environ["PGDATABASE"] = database
+
+    server = start_stub_server(error_rates={}, latency_ms=latency_ms)
+    os.environ["FMS_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+
+    import main # sets up logging, so before quietening it
+    import src
+    logging.getLogger().setLevel(logging.WARNING + 1)
+    prepare_database(reports)
+    ids = list(range(1, reports + 1))
+
+    start = time.monotonic()
+    src.run_fetch_engine(ids, lambda *args: None, max_in_flight=max_in_flight, rate_limit=0)
+    print(f"fetch only:                {reports / (time.monotonic() - start):7,.1f} reports/sec")
+
+    print(f"first scrape:              {run_scrape(ids, False, max_in_flight):7,.1f} reports/sec")
+    print(f"re-scrape, parse all:      {run_scrape(ids, False, max_in_flight):7,.1f} reports/sec")
+
+    skipped_before = src.fingerprint.UNCHANGED_PAGES.values.get((), 0)
+    rate = run_scrape(ids, True, max_in_flight)
+    skipped = src.fingerprint.UNCHANGED_PAGES.values.get((), 0) - skipped_before
+    print(f"re-scrape, skip unchanged: {rate:7,.1f} reports/sec ({skipped:.0f} of {reports} skipped)")
+
+    server.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", required=True, help="throwaway database to run against")
+    parser.add_argument("--reports", type=int, default=2000)
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    bench_fingerprint(args.database, args.reports, args.max_in_flight, args.latency_ms)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Compare fetching pages with a new connection per request (what a bare
+requests.get does, with and without gzip) against the shared keep-alive
+session used by get_report_page, on a stub server that charges a handshake
+time for every new connection. Needs no database. Run from the repo root:
+python -m benchmarks.bench_http_client --requests 300 --handshake-ms 30
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.bench_end_to_end import DEFAULT_ERROR_RATES
+from benchmarks.stub_server import start_stub_server
+
+def fetch_per_request(base_url, number):
+    response = requests.get(f"{base_url}/report/{number}", timeout=30)
+    return response.status_code, response.content
+
+def fetch_uncompressed(base_url, number):
+    response = requests.get(f"{base_url}/report/{number}", headers={"Accept-Encoding": "identity"}, timeout=30)
+    return response.status_code, response.content
+
+def fetch_with_session(base_url, number):
+    import src
+    response_content, reason = src.get_report_page(number)
+    return reason, response_content
+
+def run(server, fetch, base_url, count, max_in_flight):
+    server.connections = 0
+    server.bytes_sent = 0
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_in_flight) as executor:
+        list(executor.map(lambda number: fetch(base_url, number), range(1, count + 1)))
+    elapsed = time.monotonic() - start
+    return elapsed, server.connections, server.bytes_sent
+
+def bench_http_client(count=300, handshake_ms=30, latency_ms=5, max_in_flight=8):
+    import os
+    server = start_stub_server(error_rates=DEFAULT_ERROR_RATES, latency_ms=latency_ms, handshake_ms=handshake_ms)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["FMS_BASE_URL"] = base_url
+
+    import logging
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print(f"{count} requests, {max_in_flight} in flight, {handshake_ms} ms handshake, {latency_ms} ms latency")
+    variants = (
+        ("uncompressed, new connections", fetch_uncompressed),
+        ("new connection per request", fetch_per_request),
+        ("shared session", fetch_with_session),
+    )
+    for name, fetch in variants:
+        elapsed, connections, sent = run(server, fetch, base_url, count, max_in_flight)
+        print(f"  {name:30} {elapsed / count * max_in_flight * 1000:6.1f} ms/request, "
+              f"{connections:4} connections, {sent / count / 1024:6.1f} KiB/request sent")
+    server.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--handshake-ms", type=float, default=30)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    args = parser.parse_args()
+
+    bench_http_client(args.requests, args.handshake_ms, args.latency_ms, args.max_in_flight)
+
+if __name__ == "__main__":
+    main()
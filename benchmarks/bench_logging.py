@@ -0,0 +1,65 @@
+"""Measure what logging costs per report on the thread doing the work.
+
+Parses the fixture corpus with logging at INFO, writing to a temporary file:
+synchronously as before, and through the background QueueListener as text
+and as JSON lines. The cost is the time over a run with logging off.
+"Total" also counts waiting for the listener to finish writing. Each
+figure is the best of --repeats runs.
+Run from the repo root: python -m benchmarks.bench_logging
+"""
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+import src
+from benchmarks.bench_parser import load_corpus
+
+MODES = {
+    "sync text": {"log_format": "text", "background": False},
+    "background text": {"log_format": "text", "background": True},
+    "background json": {"log_format": "json", "background": True},
+}
+
+def run(corpus, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for number, content in enumerate(corpus):
+            src.build_report(number, content, "")
+    return time.perf_counter() - start
+
+def best_of(repeats, corpus, rounds):
+    return min(run(corpus, rounds) for _ in range(repeats))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    reports = args.rounds * len(corpus)
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_file = Path(directory) / "bench.log"
+
+        src.setup_logging(logging.WARNING + 1, log_file=log_file, background=False)
+        run(corpus, 1) # warm up
+        baseline = best_of(args.repeats, corpus, args.rounds)
+        print(f"{'logging off':>16}: {baseline / reports * 1e6:7.1f} us/report")
+
+        for name, options in MODES.items():
+            src.setup_logging(logging.INFO, log_file=log_file, **options)
+            elapsed = best_of(args.repeats, corpus, args.rounds)
+            start = time.perf_counter()
+            src.stop_logging()
+            total = elapsed + time.perf_counter() - start
+
+            lines = sum(1 for _ in open(log_file)) / args.repeats
+            log_file.unlink()
+            print(f"{name:>16}: {(elapsed - baseline) / reports * 1e6:7.1f} us/report on the parsing thread, "
+                  f"{(total - baseline) / reports * 1e6:7.1f} us/report total, {lines / reports:.0f} lines/report")
+
+if __name__ == "__main__":
+    main()
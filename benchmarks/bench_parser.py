@@ -0,0 +1,75 @@
+"""Measure process_report_content pages/sec for each parser backend over the
+fixture corpus. Run from the repo root: python -m benchmarks.bench_parser
+
+With --pages DIR it parses the .html pages in DIR instead, e.g. the slowest
+reports saved by `main.py --profile`, and also prints each page's parse time
+so a slow page can be looked at on its own:
+python -m benchmarks.bench_parser --pages profile_slow_reports
+"""
+import argparse
+import logging
+import os
+import time
+from pathlib import Path
+
+import src
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+def load_corpus():
+    return [path.read_bytes() for path in sorted(FIXTURES.glob("report_*.html"))]
+
+def load_pages(directory):
+    return {path.name: path.read_bytes() for path in sorted(Path(directory).glob("*.html"))}
+
+def bench_backend(backend, corpus, rounds):
+    os.environ["PARSER_BACKEND"] = backend
+
+    start = time.process_time()
+    for _ in range(rounds):
+        for content in corpus:
+            src.process_report_content(content, {"number": 1})
+    elapsed = time.process_time() - start
+
+    return rounds * len(corpus) / elapsed
+
+def bench_pages(backend, pages, rounds):
+    """CPU ms to parse each page, slowest first."""
+    os.environ["PARSER_BACKEND"] = backend
+    # so the first page's time doesn't include importing the backend
+    src.process_report_content(next(iter(pages.values())), {"number": 1})
+
+    times = {}
+    for name, content in pages.items():
+        start = time.process_time()
+        for _ in range(rounds):
+            src.process_report_content(content, {"number": 1})
+        times[name] = (time.process_time() - start) / rounds * 1000
+    return sorted(times.items(), key=lambda item: item[1], reverse=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--backends", nargs="+", default=["bs4", "lxml"])
+    parser.add_argument("--pages", metavar="DIR", help="parse the .html pages in DIR instead of the fixtures")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING + 1)
+    corpus = load_corpus()
+    if args.pages:
+        pages = load_pages(args.pages)
+        if not pages:
+            parser.error(f"no .html pages in {args.pages}")
+        corpus = list(pages.values())
+
+        for backend in args.backends:
+            print(f"{backend}:")
+            for name, ms in bench_pages(backend, pages, args.rounds):
+                print(f"  {name:>20}: {ms:.2f} ms")
+
+    results = {backend: bench_backend(backend, corpus, args.rounds) for backend in args.backends}
+    for backend, pages_per_sec in results.items():
+        print(f"{backend:>5}: {pages_per_sec:,.0f} pages/sec CPU ({pages_per_sec / results[args.backends[0]]:.1f}x)")
+
+if __name__ == "__main__":
+    main()
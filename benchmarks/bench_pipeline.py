@@ -0,0 +1,45 @@
+"""Measure parse throughput of the pipeline for different numbers of parser
+processes. Feeds the fixture corpus straight into the parse stage and
+discards the results, so neither the network nor the DB is involved.
+Run from the repo root: python -m benchmarks.bench_pipeline
+"""
+import argparse
+import logging
+import os
+import time
+
+import src
+from benchmarks.bench_parser import load_corpus
+
+def bench_workers(workers, corpus, pages):
+    pipeline = src.ReportPipeline(parse_workers=workers, queue_depth=4 * workers, write=lambda data: None)
+
+    # let the worker processes start before timing
+    pipeline.submit(1, corpus[0], "")
+    time.sleep(1)
+
+    start = time.monotonic()
+    for i in range(pages):
+        pipeline.submit(i, corpus[i % len(corpus)], "")
+    pipeline.close()
+
+    return pages / (time.monotonic() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING + 1)
+    corpus = load_corpus()
+    print(f"{os.cpu_count()} CPUs, parser backend {src.get_parser_backend()}")
+
+    baseline = None
+    for workers in args.workers:
+        pages_per_sec = bench_workers(workers, corpus, args.pages)
+        baseline = baseline or pages_per_sec
+        print(f"{workers:>2} workers: {pages_per_sec:,.0f} pages/sec ({pages_per_sec / baseline:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Load-test the whole fetch/parse/write pipeline from a replay store.
+
+Records --record pages from the stub server (standing in for the real site,
+with --latency-ms/--jitter-ms of latency) through `main.py`'s record
+transport, then:
+
+* replays a sample of them at 1x time scale and compares the replayed
+  latency distribution with the recorded one, and
+* runs main.main() over --reports IDs replayed with no delay and no rate
+  limit (IDs past the recording wrap around), reporting reports/sec.
+
+Like bench_end_to_end this TRUNCATES the report tables of --database. Run
+from the repo root:
+python -m benchmarks.bench_replay --database fms_bench
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.bench_end_to_end import DEFAULT_ERROR_RATES, prepare_database
+from benchmarks.stub_server import start_stub_server
+
+def quantiles(values):
+    cuts = statistics.quantiles(values, n=10)
+    return f"p10 {cuts[0] * 1000:5.1f} ms, p50 {statistics.median(values) * 1000:5.1f} ms, p90 {cuts[-1] * 1000:5.1f} ms"
+
+def record(directory, count, latency_ms, jitter_ms):
+    import src
+
+    server = start_stub_server(error_rates=DEFAULT_ERROR_RATES, latency_ms=latency_ms, jitter_ms=jitter_ms)
+    os.environ["FMS_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+
+    src.enable_recording(directory)
+    src.run_fetch_engine(range(1, count + 1), lambda *args: None, max_in_flight=16, rate_limit=0)
+    server.shutdown()
+
+def check_time_scaling(directory, sample):
+    import src
+
+    store = src.enable_replay(directory, time_scale=1)
+    numbers = store.numbers()[:sample]
+    recorded = [store.get(number)[3] for number in numbers]
+
+    replayed = []
+    for number in numbers:
+        start = time.monotonic()
+        src.get_report_page(number)
+        replayed.append(time.monotonic() - start)
+
+    print(f"recorded latency: {quantiles(recorded)}")
+    print(f"replayed at 1x:   {quantiles(replayed)}")
+
+def bench_replay(database, recorded=500, reports=20000, max_in_flight=64, latency_ms=40, jitter_ms=20):
+    os.environ["PGDATABASE"] = database
+
+    import main
+    logging.getLogger().setLevel(logging.WARNING + 1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        record(directory, recorded, latency_ms, jitter_ms)
+        check_time_scaling(directory, min(recorded, 200))
+
+        prepare_database(reports)
+        main.MODE = "scrape"
+        main.STRATEGY = "s"
+        main.TRUNCATE_DB_TABLES = False
+        main.ARCHIVE_PAGES = False
+        main.METRICS_PORT = None
+        main.MAX_IN_FLIGHT = max_in_flight
+        main.MAX_REQUESTS_PER_SECOND = 0
+        main.REPLAY_DIR = directory
+        main.REPLAY_TIME_SCALE = 0
+        main.REPLAY_MISSING = "wrap"
+
+        start = time.monotonic()
+        main.main()
+        elapsed = time.monotonic() - start
+
+    print(f"{reports} reports replayed end to end: {reports / elapsed:,.1f} reports/sec")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", required=True, help="throwaway database to run against")
+    parser.add_argument("--record", type=int, default=500, help="pages to record")
+    parser.add_argument("--reports", type=int, default=20000, help="reports to replay through main.main()")
+    parser.add_argument("--max-in-flight", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    bench_replay(args.database, args.record, args.reports, args.max_in_flight, args.latency_ms, args.jitter_ms)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Time from starting `python main.py scrape --ids ...` to its first request
+reaching the stub server, and to the process exiting.
+
+Writes to the report tables of --database (upserts, nothing is truncated).
+Run from the repo root:
+python -m benchmarks.bench_startup --database fms_bench --repeats 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_end_to_end import DEFAULT_ERROR_RATES
+from benchmarks.stub_server import start_stub_server
+
+def time_scrape(base_url, server, ids, extra_args=()):
+    server.first_request_at = None
+    env = dict(os.environ, FMS_BASE_URL=base_url, LOG_LEVEL="WARNING")
+    command = [
+        sys.executable, "main.py", "--metrics-port", "0",
+        "scrape", "--no-archive", *extra_args, "--ids", *map(str, ids)
+    ]
+
+    start = time.time()
+    subprocess.run(command, env=env, check=True)
+    end = time.time()
+
+    if server.first_request_at is None:
+        raise RuntimeError("The scrape made no requests")
+    return server.first_request_at - start, end - start
+
+def bench_startup(database, repeats=5, ids=(12345,), extra_args=()):
+    os.environ["PGDATABASE"] = database
+    server = start_stub_server(error_rates=DEFAULT_ERROR_RATES)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # the first run warms the OS file cache and writes .pyc files
+    time_scrape(base_url, server, ids, extra_args)
+    results = [time_scrape(base_url, server, ids, extra_args) for _ in range(repeats)]
+    server.shutdown()
+
+    first_request = [first for first, _ in results]
+    total = [total for _, total in results]
+    print(f"scrape --ids {' '.join(map(str, ids))} {' '.join(extra_args)}")
+    print(f"  time to first request: median {statistics.median(first_request) * 1000:.0f} ms, "
+          f"best {min(first_request) * 1000:.0f} ms")
+    print(f"  time to exit:          median {statistics.median(total) * 1000:.0f} ms, "
+          f"best {min(total) * 1000:.0f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="fms_bench", help="Postgres database to write to")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--ids", type=int, nargs="+", default=[12345])
+    parser.add_argument("--verify", action="store_true", help="also run the integrity check first")
+    args = parser.parse_args()
+
+    bench_startup(args.database, args.repeats, args.ids, ["--verify"] if args.verify else [])
+
+if __name__ == "__main__":
+    main()
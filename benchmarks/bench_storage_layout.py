@@ -0,0 +1,114 @@
+"""Compare the split (six tables) and wide (one reports table) storage layouts.
+
+Builds both layouts side by side in the bench_split and bench_wide schemas
+of --database, writes the same synthetic reports to each through
+SQL_upsert_reports, then times an analytical query: as a six-way join on
+the split tables, the same query through the compatibility views, and
+rewritten against the wide table. The schemas are dropped and recreated on
+every run. Run from the repo root:
+python -m benchmarks.bench_storage_layout --database fms_bench
+"""
+import argparse
+import logging
+import os
+import time
+
+from benchmarks.bench_bulk_writer import make_report
+from benchmarks.bench_end_to_end import SCHEMA
+
+CATEGORIES = ["Potholes", "Street lighting", "Flytipping", "Graffiti", "Abandoned vehicles"]
+COUNCILS = ["Bristol City Council", "Leeds City Council", "Camden Council", "Cardiff Council"]
+STATUSES = ["Fixed", "Open", "Investigating", "Closed"]
+
+# touches every table, so the split layout needs the full six-way join
+SPLIT_QUERY = """
+    SELECT location.council, details.category, count(*),
+           count(*) FILTER (WHERE status.status = 'Fixed'), count(*) FILTER (WHERE method.method = 'mobile'),
+           avg(updates.no_of_updates), max(logs.timestamp)
+    FROM status
+    JOIN details USING (id) JOIN location USING (id) JOIN method USING (id)
+    JOIN updates USING (id) JOIN logs USING (id)
+    GROUP BY 1, 2;
+"""
+
+WIDE_QUERY = """
+    SELECT council, category, count(*),
+           count(*) FILTER (WHERE status = 'Fixed'), count(*) FILTER (WHERE method = 'mobile'),
+           avg(no_of_updates), max(logged_timestamp)
+    FROM reports
+    GROUP BY 1, 2;
+"""
+
+def make_varied_report(number):
+    data = make_report(number)
+    data["category"] = CATEGORIES[number % len(CATEGORIES)]
+    data["council"] = COUNCILS[number % len(COUNCILS)]
+    data["status"] = STATUSES[number % len(STATUSES)]
+    data["updates"] = number % 7
+    return data
+
+def prepare_schemas():
+    import src
+
+    with src.db_cursor() as cursor:
+        cursor.execute(SCHEMA.read_text())
+        cursor.execute("DROP SCHEMA IF EXISTS bench_split, bench_wide CASCADE;")
+        cursor.execute("CREATE SCHEMA bench_split; CREATE SCHEMA bench_wide;")
+        for table in src.bulk_writer.REPORT_TABLES:
+            cursor.execute(f"CREATE TABLE bench_split.{table} (LIKE public.{table} INCLUDING ALL);")
+
+        cursor.execute("SET LOCAL search_path TO bench_wide;")
+        cursor.execute(src.storage_layout.SQL_CREATE_REPORTS_TABLE)
+        src.storage_layout.SQL_create_compatibility_views(cursor)
+
+def bench_writes(layout, reports, batch_size):
+    import src
+
+    start = time.monotonic()
+    for first in range(1, reports + 1, batch_size):
+        batch = [make_varied_report(number) for number in range(first, min(first + batch_size, reports + 1))]
+        with src.db_cursor() as cursor:
+            # public for the tombstones table the writer also touches
+            cursor.execute(f"SET LOCAL search_path TO bench_{layout}, public;")
+            src.SQL_upsert_reports(cursor, batch, layout)
+    return reports / (time.monotonic() - start)
+
+def bench_query(schema, query, repeats):
+    import src
+
+    with src.db_cursor() as cursor:
+        cursor.execute(f"SET LOCAL search_path TO {schema};")
+        cursor.execute("ANALYZE;")
+        cursor.execute(query)
+
+        start = time.monotonic()
+        for _ in range(repeats):
+            cursor.execute(query)
+            cursor.fetchall()
+        return (time.monotonic() - start) / repeats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", required=True, help="database to create the bench schemas in")
+    parser.add_argument("--reports", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    # must be set before the first DB connection is made
+    os.environ["PGDATABASE"] = args.database
+    logging.getLogger().setLevel(logging.WARNING)
+    prepare_schemas()
+
+    for layout in ("split", "wide"):
+        reports_per_sec = bench_writes(layout, args.reports, args.batch_size)
+        print(f"{layout:>5} writes: {reports_per_sec:,.0f} reports/sec (batches of {args.batch_size})")
+
+    for name, schema, query in (("split six-way join", "bench_split", SPLIT_QUERY),
+                                ("wide through views", "bench_wide", SPLIT_QUERY),
+                                ("wide table", "bench_wide", WIDE_QUERY)):
+        elapsed = bench_query(schema, query, args.repeats)
+        print(f"{name:>18}: {elapsed * 1000:,.1f} ms per query over {args.reports} reports")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Check galloping autofind against the stub server with randomly placed
+404 gaps shorter than the probe window, and count the requests it needs.
+Run from the repo root: python -m benchmarks.check_autofind
+"""
+import argparse
+import logging
+import os
+import random
+
+from benchmarks.stub_server import start_stub_server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trials", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    os.environ["FMS_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+
+    import src
+    import src.autofind_highest as autofind
+    logging.getLogger().setLevel(logging.WARNING)
+    autofind.AUTOFIND_RATE_LIMIT = 0
+
+    rng = random.Random(args.seed)
+    window = autofind.AUTOFIND_WINDOW
+    failures = 0
+
+    for trial in range(args.trials):
+        start = rng.randint(1, 10_000)
+        frontier = start + rng.randint(0, 200_000)
+
+        # sprinkle gaps of up to window - 1 missing IDs below the frontier
+        missing = set()
+        for _ in range(rng.randint(0, 2000)):
+            gap_start = rng.randint(start + 1, frontier)
+            missing.update(range(gap_start, min(gap_start + rng.randint(1, window - 1), frontier)))
+
+        server.max_id = frontier
+        server.missing_ids = frozenset(missing)
+        server.requests_served = 0
+
+        found = src.find_highest_gallop(start)
+        ok = found == frontier
+        failures += not ok
+
+        print(f"trial {trial:>2}: start {start:>6}, frontier {frontier:>6}, {len(missing):>5} gap IDs -> "
+              f"found {found:>6} in {server.requests_served:>3} requests {'ok' if ok else 'WRONG'}")
+
+    print(f"{args.trials - failures}/{args.trials} correct")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Check that several nodes using the leased strategy split the work without
+fetching the same ID twice, and that a range left behind by a killed node is
+finished by the others once its lease expires.
+
+Like bench_end_to_end this TRUNCATES the report tables of --database. Run
+from the repo root:
+python -m benchmarks.check_leases --database fms_bench --nodes 4 --kill-one
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import time
+
+from benchmarks.bench_end_to_end import DEFAULT_ERROR_RATES, prepare_database
+from benchmarks.stub_server import start_stub_server
+
+def run_node(database, base_url, range_size, lease_seconds, max_in_flight):
+    os.environ["PGDATABASE"] = database
+    os.environ["FMS_BASE_URL"] = base_url
+
+    import main
+    logging.getLogger().setLevel(logging.ERROR)
+
+    main.MODE = "scrape"
+    main.STRATEGY = "l"
+    main.TRUNCATE_DB_TABLES = False
+    main.ARCHIVE_PAGES = False
+    main.METRICS_PORT = None
+    main.USE_PIPELINE = False
+    main.LEASE_RANGE_SIZE = range_size
+    main.LEASE_SECONDS = lease_seconds
+    main.MAX_IN_FLIGHT = max_in_flight
+    main.MAX_REQUESTS_PER_SECOND = 0
+    main.main()
+
+def check_leases(database, nodes=4, reports=2000, range_size=100, lease_seconds=5, kill_one=False, latency_ms=20):
+    os.environ["PGDATABASE"] = database
+    server = start_stub_server(error_rates=DEFAULT_ERROR_RATES, latency_ms=latency_ms)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    import src
+    prepare_database(reports)
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_node, args=(database, base_url, range_size, lease_seconds, 8))
+        for _ in range(nodes)
+    ]
+    start = time.monotonic()
+    for process in processes:
+        process.start()
+
+    if kill_one:
+        # let the node get into a range before killing it
+        while server.requests_served < reports // 10:
+            time.sleep(0.05)
+        processes[0].kill()
+        print(f"Killed node {processes[0].pid} after {server.requests_served} requests")
+
+    for process in processes:
+        process.join()
+    elapsed = time.monotonic() - start
+    server.shutdown()
+
+    with src.db_cursor() as cursor:
+        cursor.execute(
+            "SELECT (SELECT count(*) FROM status WHERE id BETWEEN 1 AND %(n)s) + (SELECT count(*) FROM tombstones WHERE id BETWEEN 1 AND %(n)s);",
+            {"n": reports}
+        )
+        written = cursor.fetchone()[0]
+        cursor.execute("SELECT count(*) FROM work_leases WHERE NOT done;")
+        unfinished = cursor.fetchone()[0]
+
+    fetched_twice = sorted(number for number, hits in server.hits.items() if hits > 1)
+    print(f"{nodes} nodes, {reports} reports in {elapsed:.1f}s: {written} written, {unfinished} ranges unfinished")
+    print(f"{len(fetched_twice)} IDs fetched more than once {fetched_twice[:20]}")
+    if kill_one:
+        print("(IDs the killed node had in flight are expected to be fetched again)")
+
+    return written == reports and unfinished == 0 and (kill_one or not fetched_twice)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", required=True, help="throwaway database to run against")
+    parser.add_argument("--nodes", type=int, default=4)
+    parser.add_argument("--reports", type=int, default=2000)
+    parser.add_argument("--range-size", type=int, default=100)
+    parser.add_argument("--lease-seconds", type=int, default=5)
+    parser.add_argument("--kill-one", action="store_true", help="kill one node part way through")
+    args = parser.parse_args()
+
+    ok = check_leases(args.database, args.nodes, args.reports, args.range_size, args.lease_seconds, args.kill_one)
+    print("OK" if ok else "FAILED")
+    raise SystemExit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
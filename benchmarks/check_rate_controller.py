@@ -0,0 +1,53 @@
+"""Check that the adaptive rate controller settles near the rate the server
+tolerates. The stub server answers 429 to anything over --server-rate req/s;
+the controller is allowed up to --max-rate and should end up oscillating just
+under the server's limit with few 429s.
+Run from the repo root: python -m benchmarks.check_rate_controller
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+
+from benchmarks.stub_server import start_stub_server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server-rate", type=float, default=40)
+    parser.add_argument("--max-rate", type=float, default=200)
+    parser.add_argument("--increase", type=float, default=5, help="req/s gained per second while healthy")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    args = parser.parse_args()
+
+    server = start_stub_server(latency_ms=10, max_rate=args.server_rate)
+    os.environ["FMS_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+
+    import src
+    logging.getLogger().setLevel(logging.ERROR)
+    controller = src.enable_rate_controller(args.max_rate, 1, 1, args.increase)
+
+    deadline = time.monotonic() + args.seconds
+    def numbers():
+        number = 1
+        while time.monotonic() < deadline:
+            yield number
+            number += 1
+
+    def report():
+        while time.monotonic() < deadline:
+            time.sleep(2)
+            print(f"rate {controller.rate:6.1f} req/s, {server.rate_limited} 429s so far")
+
+    threading.Thread(target=report, daemon=True).start()
+    start = time.monotonic()
+    completed = src.run_fetch_engine(numbers(), lambda *args: None, max_in_flight=args.max_in_flight, rate_limit=0)
+    elapsed = time.monotonic() - start
+
+    print(f"{completed} reports in {elapsed:.1f}s: {completed / elapsed:.1f} reports/sec against a limit of "
+          f"{args.server_rate}, {server.rate_limited} 429s of {server.requests_served} requests")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Run the parser, DB write and end-to-end benchmarks and save the results as
+JSON under benchmarks/results/, named after the current commit, so runs can
+be compared across commits. Run from the repo root:
+python -m benchmarks.run_benchmarks --database fms_bench
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+
+RESULTS = Path(__file__).parent / "results"
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", help="throwaway database for the DB benchmarks, skipped if not given")
+    parser.add_argument("--parser-rounds", type=int, default=20)
+    parser.add_argument("--db-reports", type=int, default=5000)
+    parser.add_argument("--e2e-reports", type=int, default=2000)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ["PGDATABASE"] = args.database
+
+    from benchmarks import bench_bulk_writer, bench_end_to_end, bench_parser
+    logging.getLogger().setLevel(logging.WARNING + 1)
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+
+    corpus = bench_parser.load_corpus()
+    results["parser_pages_per_sec"] = {
+        backend: bench_parser.bench_backend(backend, corpus, args.parser_rounds) for backend in ("bs4", "lxml")
+    }
+    print(f"parser: {results['parser_pages_per_sec']}")
+
+    if args.database:
+        bench_end_to_end.prepare_database(0)
+        results["db_rows_per_sec"] = {
+            str(batch_size): args.db_reports * len(bench_bulk_writer.TABLES) / bench_bulk_writer.bench_batch_size(batch_size, args.db_reports)
+            for batch_size in (1, 100, 1000)
+        }
+        print(f"db writes: {results['db_rows_per_sec']}")
+
+        results["end_to_end_reports_per_sec"] = bench_end_to_end.bench_end_to_end(args.database, args.e2e_reports)
+        print(f"end to end: {results['end_to_end_reports_per_sec']:.1f} reports/sec")
+
+    output = args.output or RESULTS / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2) + "\n")
+    print(f"Saved results to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+-- Tables from the README, for setting up a throwaway benchmark database.
+CREATE TABLE IF NOT EXISTS "public"."details" (
+  "id" INTEGER NOT NULL,
+  "category" TEXT NULL,
+  "title" TEXT NULL,
+  "description" TEXT NULL,
+  CONSTRAINT "PK_details" PRIMARY KEY ("id")
+);
+
+CREATE TABLE IF NOT EXISTS "public"."location" (
+  "id" INTEGER NOT NULL,
+  "latitude" DOUBLE PRECISION NULL,
+  "longitude" DOUBLE PRECISION NULL,
+  "council" TEXT NULL,
+  CONSTRAINT "PK_location" PRIMARY KEY ("id")
+);
+
+CREATE TABLE IF NOT EXISTS "public"."method" (
+  "id" INTEGER NOT NULL,
+  "method" TEXT NULL,
+  CONSTRAINT "PK_method" PRIMARY KEY ("id")
+);
+
+CREATE TABLE IF NOT EXISTS "public"."status" (
+  "id" INTEGER NOT NULL,
+  "status" TEXT NULL,
+  "reported_timestamp" TIMESTAMP WITH TIME ZONE NULL,
+  "editable" BOOLEAN NULL,
+  CONSTRAINT "PK_fms" PRIMARY KEY ("id")
+);
+
+CREATE TABLE IF NOT EXISTS "public"."updates" (
+  "id" INTEGER NOT NULL,
+  "no_of_updates" INTEGER NULL,
+  "latest_timestamp" TIMESTAMP WITH TIME ZONE NULL,
+  CONSTRAINT "PK_updates" PRIMARY KEY ("id")
+);
+
+CREATE TABLE IF NOT EXISTS "public"."logs" (
+  "id" INTEGER NOT NULL,
+  "timestamp" TIMESTAMP WITH TIME ZONE NOT NULL,
+  "fingerprint" BYTEA NULL,
+  CONSTRAINT "PK_logs" PRIMARY KEY ("id")
+);
+
+CREATE TABLE IF NOT EXISTS "public"."http_cache" (
+  "id" INTEGER NOT NULL,
+  "etag" TEXT NULL,
+  "last_modified" TEXT NULL,
+  "checked_timestamp" TIMESTAMP WITH TIME ZONE NOT NULL,
+  CONSTRAINT "PK_http_cache" PRIMARY KEY ("id")
+);
+
+CREATE TABLE IF NOT EXISTS "public"."work_leases" (
+  "range_start" INTEGER NOT NULL,
+  "range_end" INTEGER NOT NULL,
+  "owner" TEXT NULL,
+  "lease_expires" TIMESTAMP WITH TIME ZONE NULL,
+  "progress" INTEGER NOT NULL,
+  "done" BOOLEAN NOT NULL DEFAULT false,
+  CONSTRAINT "PK_work_leases" PRIMARY KEY ("range_start")
+);
+
+CREATE TABLE IF NOT EXISTS "public"."meta" (
+  "key" TEXT NOT NULL,
+  "value" TEXT NULL
+);
+
+CREATE TABLE IF NOT EXISTS "public"."dead_letters" (
+  "id" INTEGER NOT NULL,
+  "stage" TEXT NOT NULL,
+  "error_class" TEXT NOT NULL,
+  "error" TEXT NOT NULL,
+  "status_code" INTEGER NULL,
+  "body" BYTEA NULL,
+  "attempts" INTEGER NOT NULL DEFAULT 1,
+  "failed_timestamp" TIMESTAMP WITH TIME ZONE NOT NULL,
+  CONSTRAINT "PK_dead_letters" PRIMARY KEY ("id")
+);
+
+CREATE TABLE IF NOT EXISTS "public"."tombstones" (
+  "id" INTEGER NOT NULL,
+  "status_code" SMALLINT NOT NULL,
+  "checked_timestamp" TIMESTAMP WITH TIME ZONE NOT NULL,
+  CONSTRAINT "PK_tombstones" PRIMARY KEY ("id")
+);
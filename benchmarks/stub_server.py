@@ -0,0 +1,243 @@
+"""Local stand-in for fixmystreet.com serving /report/<id> from the fixture corpus.
+
+Each ID always gets the same page: 403/404/410 pages are picked per ID at
+the configured rates, and everything else cycles through the report
+fixtures. Transient 503s are picked per request. Report pages carry an
+ETag and honour If-None-Match. Bodies are gzipped for clients that accept
+it. Responses can be delayed to model network latency, and each new
+connection by a handshake time to model TCP and TLS setup. With a max
+rate set, requests over it in any one second get a 429 with Retry-After,
+like a rate-limiting front end.
+
+With --replay it serves the responses in a replay store recorded with
+`main.py --record` instead, delayed by their recorded latency times
+--replay-time-scale.
+"""
+import argparse
+import collections
+import gzip
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+FIXTURES = Path(__file__).parent / "fixtures"
+REPORT_PATH = re.compile(r"^/report/(\d+)$")
+
+def load_pages():
+    reports = [path.read_bytes() for path in sorted(FIXTURES.glob("report_*.html"))]
+    errors = {status: (FIXTURES / f"error_{status}.html").read_bytes() for status in (403, 404, 410)}
+    return reports, errors
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes, which Nagle would hold up
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+        if self.server.handshake:
+            time.sleep(self.server.handshake)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests_served += 1
+            if server.first_request_at is None:
+                server.first_request_at = time.time()
+
+        if server.over_rate():
+            self.send_body(429, b"Too Many Requests", headers={"Retry-After": "1"})
+            return
+
+        if server.latency:
+            time.sleep(max(0.0, random.gauss(server.latency, server.jitter)))
+
+        match = REPORT_PATH.match(self.path)
+        if not match:
+            self.send_body(404, server.errors[404])
+            return
+
+        number = int(match.group(1))
+        with server.lock:
+            server.hits[number] += 1
+
+        if server.replay is not None:
+            self.send_replayed(number)
+            return
+
+        status = server.status_for(number)
+        if status == 200:
+            page = server.reports[number % len(server.reports)]
+            etag = f'"{zlib.crc32(page):08x}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_body(304, b"", headers={"ETag": etag})
+            else:
+                self.send_body(200, page, headers={"ETag": etag})
+        elif status == 503:
+            self.send_body(503, b"Service Unavailable")
+        else:
+            self.send_body(status, server.errors[status])
+
+    def send_replayed(self, number):
+        server = self.server
+        recorded = server.replay.find(number, server.replay_missing)
+        if recorded is None:
+            self.send_body(404, server.errors[404])
+            return
+
+        status, headers, body, latency = recorded
+        if server.replay_time_scale:
+            time.sleep(latency * server.replay_time_scale)
+
+        etag = headers.get("ETag")
+        if status == 200 and etag and self.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+        # send_body sets its own Content-Type
+        headers = {name: value for name, value in headers.items() if name.lower() != "content-type"}
+        self.send_body(status, body, headers)
+
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = self.server.gzipped(body)
+            self.send_header("Content-Encoding", "gzip")
+        with self.server.lock:
+            self.server.bytes_sent += len(body)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, max_id, missing_ids, error_rates, transient_error_rate, latency_ms, jitter_ms, max_rate,
+                 handshake_ms=0):
+        super().__init__(address, StubHandler)
+        self.lock = threading.Lock()
+        self.requests_served = 0
+        self.first_request_at = None
+        self.connections = 0
+        self.bytes_sent = 0
+        self.gzip_cache = {}
+        self.hits = collections.Counter()
+        self.reports, self.errors = load_pages()
+
+        self.max_id = max_id
+        self.missing_ids = frozenset(missing_ids)
+        self.error_rates = dict(error_rates)
+        self.transient_error_rate = transient_error_rate
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.max_rate = max_rate
+        self.handshake = handshake_ms / 1000
+        self.replay = None
+        self.replay_missing = "404"
+        self.replay_time_scale = 0
+        self.recent = collections.deque()
+        self.rate_limited = 0
+
+    def handle_error(self, request, client_address):
+        # clients going away mid-response (e.g. a killed node) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def gzipped(self, body):
+        # the corpus is small, so compress each page once
+        if body not in self.gzip_cache:
+            self.gzip_cache[body] = gzip.compress(body, 6)
+        return self.gzip_cache[body]
+
+    def over_rate(self):
+        if not self.max_rate:
+            return False
+
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and self.recent[0] < now - 1:
+                self.recent.popleft()
+            if len(self.recent) >= self.max_rate:
+                self.rate_limited += 1
+                return True
+            self.recent.append(now)
+            return False
+
+    def status_for(self, number):
+        if number > self.max_id or number in self.missing_ids:
+            return 404
+
+        if random.random() < self.transient_error_rate:
+            return 503
+
+        # seeded by the ID so the same report always gives the same answer
+        roll = random.Random(number).random()
+        for status, rate in sorted(self.error_rates.items()):
+            if roll < rate:
+                return status
+            roll -= rate
+
+        return 200
+
+def start_stub_server(port=0, max_id=1_000_000, missing_ids=(), error_rates=None,
+                      transient_error_rate=0.0, latency_ms=0, jitter_ms=0, max_rate=0, handshake_ms=0):
+    """Start the stub server in a background thread and return it. IDs above
+    max_id or in missing_ids are always 404s. error_rates maps 403/404/410 to
+    the fraction of the remaining IDs that get that status. max_rate (0 for
+    none) is the most requests per second answered before 429s. handshake_ms
+    delays the first response on each new connection. The bound
+    address is at server.server_address."""
+    server = StubServer(
+        ("127.0.0.1", port), max_id, missing_ids, error_rates or {},
+        transient_error_rate, latency_ms, jitter_ms, max_rate, handshake_ms
+    )
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-id", type=int, default=1_000_000)
+    parser.add_argument("--rate-403", type=float, default=0.01)
+    parser.add_argument("--rate-404", type=float, default=0.05)
+    parser.add_argument("--rate-410", type=float, default=0.02)
+    parser.add_argument("--rate-503", type=float, default=0.0, help="chance of a transient 503 per request")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--max-rate", type=float, default=0, help="requests/sec before answering 429")
+    parser.add_argument("--handshake-ms", type=float, default=0, help="delay on each new connection, like TCP+TLS setup")
+    parser.add_argument("--replay", metavar="DIR", help="serve the responses in this replay store")
+    parser.add_argument("--replay-time-scale", type=float, default=0, help="delay replayed responses by this times their recorded latency")
+    parser.add_argument("--replay-missing", choices=("404", "wrap"), default="404")
+    args = parser.parse_args()
+
+    server = start_stub_server(
+        args.port, args.max_id,
+        error_rates={403: args.rate_403, 404: args.rate_404, 410: args.rate_410},
+        transient_error_rate=args.rate_503, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        max_rate=args.max_rate, handshake_ms=args.handshake_ms
+    )
+    if args.replay:
+        from src.transport import ReplayStore
+        server.replay = ReplayStore(args.replay)
+        server.replay_missing = args.replay_missing
+        server.replay_time_scale = args.replay_time_scale
+
+    print(f"Serving on http://127.0.0.1:{server.server_address[1]}, Ctrl+C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,91 +1,483 @@
 import src
-import src.colourlog as colourlog
 
 from dotenv import load_dotenv
+import argparse
 import logging
 import os
-import time
+import sys
 
 load_dotenv()
 
-# Set logging variables
+# Set logging variables. LOG_FORMAT is "text" for coloured lines or "json"
+# for JSON lines tagged with report id and stage, written to LOG_FILE if set.
+# Records are written from a background thread.
 DEFAULT_LOG_LEVEL = os.environ.get("LOG_LEVEL") or logging.DEBUG
-logging.getLogger().setLevel(DEFAULT_LOG_LEVEL)
-logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s")
+LOG_FORMAT = os.environ.get("LOG_FORMAT") or "text"
+LOG_FILE = os.environ.get("LOG_FILE")
 
-colourlog.setup_logger()
+src.setup_logging(DEFAULT_LOG_LEVEL, LOG_FORMAT, LOG_FILE)
+
+# "scrape" fetches from FixMyStreet, "reparse" rebuilds the DB from ARCHIVE_DIR
+# without touching the network, "refresh" re-checks open reports,
+# "migrate_wide" moves the six report tables into one reports table,
+# "migrate_tombstones" turns old 403/404/410 placeholder reports into tombstones,
+# "export" writes reports out as Parquet or Arrow files, "retry" pushes the
+# dead letters through again
+MODE = "scrape"
 
 TRUNCATE_DB_TABLES = False
 SINGLE_NUMBER = 2
 STRATEGY = "r"
 
-def main():
-    # complete project init
-    src.fms_init_main()
+# Fetch exactly these report IDs instead of following STRATEGY (None to use
+# STRATEGY). Skips loading the scraped IDs and re-fetches IDs already in the DB.
+SCRAPE_IDS = None
+
+# Steps run before a scrape. The subcommand CLI turns both off unless asked
+# for with --verify / --autofind, as each costs DB round trips (and autofind
+# network requests) before the first report is fetched.
+RUN_INTEGRITY_CHECK = True
+RUN_AUTOFIND = True
+PERMUTATION_SEED = None # None reuses the stored seed, or picks a new one
+
+# Leased strategy: size of the ID ranges nodes claim, and how long a claim
+# lasts without a heartbeat before another node can take it over
+LEASE_RANGE_SIZE = 1000
+LEASE_SECONDS = 300
+
+# Below this many SCRAPE_IDS, parse in the fetching process instead of
+# starting the parse pool
+PIPELINE_MIN_IDS = 50
+
+# Fetch engine settings
+USE_ASYNC_ENGINE = True
+MAX_IN_FLIGHT = 8
+
+# Request pacing towards fixmystreet.com. With ADAPTIVE_RATE the rate starts
+# at MIN_REQUESTS_PER_SECOND and climbs towards MAX_REQUESTS_PER_SECOND while
+# the site keeps up, halving on 429s, 5xxs and timeouts. Without it requests
+# go at a fixed MAX_REQUESTS_PER_SECOND. 0 disables pacing.
+ADAPTIVE_RATE = True
+MIN_REQUESTS_PER_SECOND = 0.5
+MAX_REQUESTS_PER_SECOND = 4
+
+# Parse pages in a pool of PARSE_WORKERS processes (None for one per core)
+# between the fetch engine and a single DB writer. Off by default: with the
+# lxml extractor, sending each page to a worker and the report back costs
+# about as much as parsing it in-process
+USE_PIPELINE = False
+PARSE_WORKERS = None
+PIPELINE_QUEUE_DEPTH = 100
+
+# Batch DB writes: flush after this many reports or this many ms, whichever
+# comes first. A size of 1 writes every report straight away.
+BULK_WRITE_SIZE = 100
+BULK_WRITE_INTERVAL_MS = 500
+
+# Verify mode: "refetch" fetches incomplete reports again, "requeue" deletes
+# them so a later scrape picks them up, None only reports them
+INTEGRITY_REPAIR = "refetch"
+
+# Autofind mode: run even if the meta table says it isn't needed
+AUTOFIND_FORCE = False
+
+# Refresh mode: how many open reports to re-check per run, and the longest
+# an open report should go without being checked
+REFRESH_LIMIT = 1000
+REFRESH_MAX_STALENESS_HOURS = 24 * 7
+
+# When re-fetching reports already in the DB (scrape --ids, refresh), skip
+# parsing and writing pages whose content fingerprint hasn't changed
+SKIP_UNCHANGED_PAGES = True
+
+# Serve counters and histograms for each stage at http://127.0.0.1:METRICS_PORT/metrics
+# (None to turn off), and write them to METRICS_FILE at exit (None for no file)
+METRICS_PORT = 9108
+METRICS_FILE = None
+
+# Export mode: where to write, "parquet" or "arrow" (IPC files), and whether
+# to export everything instead of only reports logged since the last export.
+# Memory use is bounded by EXPORT_CHUNK_ROWS, the rows fetched at a time.
+EXPORT_DIR = "export"
+EXPORT_FORMAT = "parquet"
+EXPORT_FULL = False
+EXPORT_CHUNK_ROWS = 10000
+EXPORT_TOMBSTONES_DIR = None # also export tombstones, to this directory
+
+# Transport: RECORD_DIR saves every response (status, headers, body and
+# latency) to a replay store there. REPLAY_DIR answers every request from such
+# a store instead of the network, delayed by REPLAY_TIME_SCALE times the
+# recorded latency (0 for no delay). REPLAY_MISSING is "404" for IDs that
+# weren't recorded, or "wrap" to reuse recordings for any ID.
+RECORD_DIR = None
+REPLAY_DIR = None
+REPLAY_TIME_SCALE = 0
+REPLAY_MISSING = "404"
+
+# Sample every thread (and the parse workers) and write a flamegraph input to
+# PROFILE_FILE at exit: speedscope JSON if it ends in .json, collapsed stacks
+# otherwise (None to turn off). With it, the PROFILE_SLOW_REPORTS slowest
+# reports are saved with their stage timings to PROFILE_SLOW_REPORTS_DIR
+# (None for "<profile name>_slow_reports" next to the profile).
+PROFILE_FILE = None
+PROFILE_INTERVAL_MS = 5
+PROFILE_SLOW_REPORTS = 20
+PROFILE_SLOW_REPORTS_DIR = None
+
+# Which dead letters the retry mode picks up (None for all of them)
+RETRY_STAGE = None
+RETRY_ERROR_CLASS = None
+RETRY_LIMIT = None
+
+# Keep a compressed copy of every fetched page so it can be reparsed later
+ARCHIVE_PAGES = True
+ARCHIVE_DIR = "archive"
+
+def reparse():
+    # reparsed pages are upserted, so always go through the bulk writer
+    src.enable_bulk_writer(max(BULK_WRITE_SIZE, 1), BULK_WRITE_INTERVAL_MS)
+    try:
+        if USE_PIPELINE:
+            pipeline = src.ReportPipeline(PARSE_WORKERS, PIPELINE_QUEUE_DEPTH)
+            try:
+                src.reparse_archive(ARCHIVE_DIR, pipeline.submit)
+            finally:
+                pipeline.close()
+        else:
+            src.reparse_archive(ARCHIVE_DIR)
+    finally:
+        src.close_bulk_writer()
+
+def refresh():
+    if ARCHIVE_PAGES:
+        src.enable_archive(ARCHIVE_DIR)
+
+    # changed reports are upserted, so always go through the bulk writer
+    src.enable_bulk_writer(max(BULK_WRITE_SIZE, 1), BULK_WRITE_INTERVAL_MS)
+    try:
+        src.refresh_reports(REFRESH_LIMIT, MAX_IN_FLIGHT, get_engine_rate_limit(), REFRESH_MAX_STALENESS_HOURS, skip_unchanged=SKIP_UNCHANGED_PAGES)
+    finally:
+        src.close_bulk_writer()
+        src.close_archive()
+
+def get_engine_rate_limit():
+    # at a fixed rate the fetch engine spaces requests out itself, on its event
+    # loop, so fetch threads aren't left waiting in the rate controller. The
+    # adaptive rate can only be followed by the controller.
+    return 0 if ADAPTIVE_RATE else MAX_REQUESTS_PER_SECOND
+
+def get_strategy_generator():
+    if SCRAPE_IDS:
+        return src.ids_strategy(SCRAPE_IDS)
 
     # get upper number from DB
     upper_number = src.SQL_get_UPPER_NUMBER()
 
-    generator = None
-
-    # process truncate variable
-    src.truncate(TRUNCATE_DB_TABLES)
+    # load the IDs we already have once, strategies check against this
+    src.load_scraped_ids()
 
     # process strategy
     if STRATEGY in ("s", "sequential"):
-        generator = src.sequential_strategy(upper_number)
+        return src.sequential_strategy(upper_number)
 
     elif STRATEGY in ("r", "random"):
-        generator = src.random_strategy(upper_number)
+        return src.random_strategy(upper_number)
+
+    elif STRATEGY in ("p", "permutation"):
+        return src.permutation_strategy(upper_number, PERMUTATION_SEED)
+
+    elif STRATEGY in ("l", "leased"):
+        return src.leased_strategy(upper_number, LEASE_RANGE_SIZE, LEASE_SECONDS)
 
     elif STRATEGY in (1, "single"):
         if SINGLE_NUMBER:
-            generator = src.single_strategy(SINGLE_NUMBER)
-        else:
-            msg = f"Value of SINGLE_NUMBER not allowed. Value: {SINGLE_NUMBER}"
-            logging.critical(msg)
-            raise ValueError(msg)
-
-    else:
-        msg = f"Unknown or none strategy given. Was given: {STRATEGY}"
+            return src.single_strategy(SINGLE_NUMBER)
+        msg = f"Value of SINGLE_NUMBER not allowed. Value: {SINGLE_NUMBER}"
         logging.critical(msg)
         raise ValueError(msg)
-    
+
+    msg = f"Unknown or none strategy given. Was given: {STRATEGY}"
+    logging.critical(msg)
+    raise ValueError(msg)
+
+def scrape():
+    # complete project init
+    src.fms_init_main(RUN_INTEGRITY_CHECK, RUN_AUTOFIND)
+
+    # process truncate variable
+    if TRUNCATE_DB_TABLES:
+        src.truncate(TRUNCATE_DB_TABLES)
+
+    generator = get_strategy_generator()
+
+    if ARCHIVE_PAGES:
+        src.enable_archive(ARCHIVE_DIR)
+
+    # explicit IDs may already be in the DB, so they are always upserted
+    if BULK_WRITE_SIZE > 1 or SCRAPE_IDS:
+        src.enable_bulk_writer(max(BULK_WRITE_SIZE, 1), BULK_WRITE_INTERVAL_MS)
+
+    # starting parse processes costs more than parsing a handful of pages,
+    # and with a single ID there are no requests for the engine to overlap
+    use_pipeline = USE_PIPELINE and not (SCRAPE_IDS and len(SCRAPE_IDS) < PIPELINE_MIN_IDS)
+    use_async_engine = USE_ASYNC_ENGINE and not (SCRAPE_IDS and len(SCRAPE_IDS) == 1)
+
+    # explicit IDs are often ones we already have
+    skip_unchanged = bool(SKIP_UNCHANGED_PAGES and SCRAPE_IDS)
+    if skip_unchanged:
+        src.enable_fingerprints(SCRAPE_IDS)
+
     # process
-    for number in generator:
-        data = {"number": number}
-
-        # Get the report page
-        response_content, reason = src.get_report_page(data["number"])
-
-        # Escape if response was anything but 200
-        if response_content in ("404", "403", "410"):
-            src.SQL_insert_into_db({
-                "number": number,
-                "status": f"N/a - {response_content}",
-                "editable": False,
-                "timestamp": None,
-                "category": f"N/a - {response_content}",
-                "title": f"N/a - HTTP {response_content}, {reason}",
-                "description": f"N/a - HTTP {response_content}, {reason}",
-                "lat": 0.0,
-                "lon": 0.0,
-                "council": "N/a",
-                "method": f"N/a - {response_content}",
-                "updates": 0,
-                "latest_update": None
-                }
-            )
-            msg = f"Response code was {response_content}. Entry recorded, nothing more to process. Moving on..."
-            logging.warning(msg)
+    try:
+        if use_async_engine and use_pipeline:
+            pipeline = src.ReportPipeline(PARSE_WORKERS, PIPELINE_QUEUE_DEPTH)
+            try:
+                src.run_fetch_engine(generator, pipeline.submit, max_in_flight=MAX_IN_FLIGHT, rate_limit=get_engine_rate_limit())
+            finally:
+                pipeline.close()
+            return
+
+        if use_async_engine:
+            src.run_fetch_engine(generator, max_in_flight=MAX_IN_FLIGHT, rate_limit=get_engine_rate_limit())
+            return
+
+        for number in generator:
+            # Get the report page
+            try:
+                response_content, reason = src.get_report_page(number)
+            except src.TransientFetchError:
+                continue
+            except src.UnexpectedStatusError as e:
+                src.add_dead_letter(number, "fetch", e, e.body, e.status_code)
+                continue
+
+            # Process the page and insert into DB
+            src.handle_report_page(number, response_content, reason)
+
             src.end_of_processing()
-            continue
 
-        # Process the page and insert into DB
-        data = src.process_report_content(response_content, data)
-        src.SQL_insert_into_db(data)
+    finally:
+        # write out anything still buffered
+        src.close_bulk_writer()
+        src.close_archive()
+        if skip_unchanged:
+            src.close_fingerprints()
 
-        src.end_of_processing()
+def verify():
+    # unlike the check before a scrape, also look for IDs that are both a report and a tombstone
+    src.integrity_check(INTEGRITY_REPAIR, check_tombstones=True)
+
+def autofind():
+    src.autofind_highest_report_id(force=AUTOFIND_FORCE)
+
+def export():
+    src.export_reports(EXPORT_DIR, EXPORT_FORMAT, EXPORT_CHUNK_ROWS, EXPORT_FULL, EXPORT_TOMBSTONES_DIR)
+
+def retry():
+    # retried reports are upserted, so always go through the bulk writer
+    src.enable_bulk_writer(max(BULK_WRITE_SIZE, 1), BULK_WRITE_INTERVAL_MS)
+    try:
+        src.retry_dead_letters(RETRY_STAGE, RETRY_ERROR_CLASS, RETRY_LIMIT)
+    finally:
+        src.close_bulk_writer()
+
+MODES = {
+    "scrape": scrape,
+    "autofind": autofind,
+    "verify": verify,
+    "reparse": reparse,
+    "refresh": refresh,
+    "migrate_wide": lambda: src.migrate_to_wide_table(),
+    "migrate_tombstones": lambda: src.migrate_placeholders_to_tombstones(),
+    "export": export,
+    "retry": retry,
+}
+
+def main():
+    if MODE not in MODES:
+        msg = f"Unknown mode given. Was given: {MODE}"
+        logging.critical(msg)
+        raise ValueError(msg)
+
+    if PROFILE_FILE:
+        src.enable_profiler(PROFILE_FILE, PROFILE_INTERVAL_MS, PROFILE_SLOW_REPORTS, PROFILE_SLOW_REPORTS_DIR)
+
+    if METRICS_PORT:
+        src.start_metrics_server(METRICS_PORT)
+    if METRICS_FILE:
+        src.enable_metrics_dump(METRICS_FILE)
+
+    # before the record/replay adapters are made, they size their pools from it
+    src.set_http_pool_size(MAX_IN_FLIGHT)
+
+    if RECORD_DIR:
+        src.enable_recording(RECORD_DIR)
+    elif REPLAY_DIR:
+        src.enable_replay(REPLAY_DIR, REPLAY_TIME_SCALE, REPLAY_MISSING)
+
+    # every request below is paced by the rate controller
+    src.enable_rate_controller(MAX_REQUESTS_PER_SECOND, MIN_REQUESTS_PER_SECOND if ADAPTIVE_RATE else MAX_REQUESTS_PER_SECOND)
+
+    try:
+        MODES[MODE]()
+    finally:
+        src.log_dead_letter_summary()
+        if PROFILE_FILE:
+            src.close_profiler()
+
+def read_ids_file(path):
+    # one ID per line, blank lines and # comments ignored
+    with (sys.stdin if path == "-" else open(path)) as f:
+        return [int(line.split("#")[0]) for line in f if line.split("#")[0].strip()]
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Scrape reports from FixMyStreet into Postgres.")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="serve /metrics on this port, 0 to turn off")
+    parser.add_argument("--metrics-file", default=METRICS_FILE, help="write metrics to this file at exit")
+    parser.add_argument("--rate", type=float, help="most requests per second (default %(default)s)", default=MAX_REQUESTS_PER_SECOND)
+    parser.add_argument("--fixed-rate", action="store_true", help="don't adapt the request rate, always use --rate")
+    transport = parser.add_mutually_exclusive_group()
+    transport.add_argument("--record", metavar="DIR", default=RECORD_DIR, help="save every response to a replay store")
+    transport.add_argument("--replay", metavar="DIR", default=REPLAY_DIR,
+                           help="answer requests from a replay store instead of the network")
+    parser.add_argument("--replay-time-scale", type=float, default=REPLAY_TIME_SCALE, metavar="X",
+                        help="delay replayed responses by X times their recorded latency (default %(default)s)")
+    parser.add_argument("--replay-missing", choices=("404", "wrap"), default=REPLAY_MISSING,
+                        help="answer IDs that weren't recorded with a 404, or wrap around the recorded ones")
+    parser.add_argument("--profile", metavar="PATH", default=PROFILE_FILE,
+                        help="sample the run and write a profile here at exit, speedscope JSON if it ends in .json, collapsed stacks otherwise")
+    parser.add_argument("--profile-interval", type=float, default=PROFILE_INTERVAL_MS, metavar="MS",
+                        help="milliseconds between profile samples (default %(default)s)")
+    parser.add_argument("--slow-reports", type=int, default=PROFILE_SLOW_REPORTS, metavar="N",
+                        help="with --profile, save the N slowest reports' pages and stage timings (default %(default)s)")
+    parser.add_argument("--slow-reports-dir", default=PROFILE_SLOW_REPORTS_DIR, metavar="DIR",
+                        help="where to save them (default <profile name>_slow_reports)")
+    subparsers = parser.add_subparsers(dest="mode", required=True, metavar="command")
+
+    scrape_parser = subparsers.add_parser("scrape", help="fetch reports and store them")
+    ids = scrape_parser.add_mutually_exclusive_group()
+    ids.add_argument("--ids", type=int, nargs="+", metavar="ID", help="fetch only these report IDs")
+    ids.add_argument("--ids-file", metavar="PATH", help="fetch the report IDs listed in this file, - for stdin")
+    ids.add_argument("--strategy", default=STRATEGY, choices=("s", "sequential", "r", "random", "p", "permutation", "l", "leased"),
+                     help="order to visit IDs in (default %(default)s)")
+    scrape_parser.add_argument("--seed", type=int, default=PERMUTATION_SEED, help="seed for the permutation strategy")
+    scrape_parser.add_argument("--verify", action="store_true", help="run the DB integrity check first")
+    scrape_parser.add_argument("--autofind", action="store_true", help="look for the highest report ID first")
+    scrape_parser.add_argument("--truncate", action="store_true", help="empty the report tables first")
+    scrape_parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="concurrent requests (default %(default)s)")
+    scrape_parser.add_argument("--sync", action="store_true", help="fetch one report at a time without the async engine")
+    scrape_parser.add_argument("--pipeline", action="store_true", help="parse in a pool of worker processes")
+    scrape_parser.add_argument("--no-archive", action="store_true", help="don't keep a copy of fetched pages")
+    scrape_parser.add_argument("--parse-unchanged", action="store_true",
+                               help="parse and write --ids pages even if their fingerprint hasn't changed")
+
+    autofind_parser = subparsers.add_parser("autofind", help="find the highest report ID and store it")
+    autofind_parser.add_argument("--force", action="store_true", help="run even if the DB says it isn't needed")
+
+    verify_parser = subparsers.add_parser("verify", help="check every report is complete in the DB")
+    verify_parser.add_argument("--repair", choices=("refetch", "requeue", "none"), default=INTEGRITY_REPAIR or "none",
+                               help="what to do with incomplete reports (default %(default)s)")
+
+    reparse_parser = subparsers.add_parser("reparse", help="rebuild the DB from archived pages")
+    reparse_parser.add_argument("--pipeline", action="store_true", help="parse in a pool of worker processes")
+
+    refresh_parser = subparsers.add_parser("refresh", help="re-check open reports for changes")
+    refresh_parser.add_argument("--limit", type=int, default=REFRESH_LIMIT, help="reports to check (default %(default)s)")
+    refresh_parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="concurrent requests (default %(default)s)")
+    refresh_parser.add_argument("--no-archive", action="store_true", help="don't keep a copy of fetched pages")
+    refresh_parser.add_argument("--parse-unchanged", action="store_true",
+                                help="parse and write pages even if their fingerprint hasn't changed")
+
+    subparsers.add_parser("migrate-wide", help="move the report tables into one wide reports table")
+    subparsers.add_parser("migrate-tombstones", help="collapse old 403/404/410 placeholder reports into tombstones")
+
+    export_parser = subparsers.add_parser("export", help="write reports to month partitioned Parquet or Arrow files")
+    export_parser.add_argument("--out", default=EXPORT_DIR, help="directory to write to (default %(default)s)")
+    export_parser.add_argument("--format", choices=("parquet", "arrow"), default=EXPORT_FORMAT,
+                               help="file format (default %(default)s)")
+    export_parser.add_argument("--full", action="store_true", help="export every report, not only new ones")
+    export_parser.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS,
+                               help="rows fetched and written at a time, which bounds memory use (default %(default)s)")
+    export_parser.add_argument("--tombstones-out", default=EXPORT_TOMBSTONES_DIR, metavar="DIR",
+                               help="also write the 403/404/410 tombstones to this directory")
+
+    retry_parser = subparsers.add_parser("retry", help="push reports that failed to fetch or parse through again")
+    retry_parser.add_argument("--stage", choices=("fetch", "parse"), default=RETRY_STAGE, help="only retry failures from this stage")
+    retry_parser.add_argument("--error-class", default=RETRY_ERROR_CLASS, metavar="NAME",
+                              help="only retry failures with this exception class, e.g. MissingElementError")
+    retry_parser.add_argument("--limit", type=int, default=RETRY_LIMIT, help="retry at most this many")
+    return parser
+
+def cli(argv=None):
+    global MODE, STRATEGY, SCRAPE_IDS, PERMUTATION_SEED, RUN_INTEGRITY_CHECK, RUN_AUTOFIND
+    global TRUNCATE_DB_TABLES, MAX_IN_FLIGHT, USE_ASYNC_ENGINE, USE_PIPELINE, ARCHIVE_PAGES
+    global AUTOFIND_FORCE, INTEGRITY_REPAIR, REFRESH_LIMIT, SKIP_UNCHANGED_PAGES
+    global EXPORT_DIR, EXPORT_FORMAT, EXPORT_FULL, EXPORT_CHUNK_ROWS, EXPORT_TOMBSTONES_DIR
+    global METRICS_PORT, METRICS_FILE, MAX_REQUESTS_PER_SECOND, ADAPTIVE_RATE
+    global RECORD_DIR, REPLAY_DIR, REPLAY_TIME_SCALE, REPLAY_MISSING
+    global RETRY_STAGE, RETRY_ERROR_CLASS, RETRY_LIMIT
+    global PROFILE_FILE, PROFILE_INTERVAL_MS, PROFILE_SLOW_REPORTS, PROFILE_SLOW_REPORTS_DIR
+
+    args = build_parser().parse_args(argv)
+
+    MODE = args.mode.replace("-", "_")
+    METRICS_PORT = args.metrics_port
+    METRICS_FILE = args.metrics_file
+    MAX_REQUESTS_PER_SECOND = args.rate
+    ADAPTIVE_RATE = ADAPTIVE_RATE and not args.fixed_rate
+    RECORD_DIR = args.record
+    REPLAY_DIR = args.replay
+    REPLAY_TIME_SCALE = args.replay_time_scale
+    REPLAY_MISSING = args.replay_missing
+    PROFILE_FILE = args.profile
+    PROFILE_INTERVAL_MS = args.profile_interval
+    PROFILE_SLOW_REPORTS = args.slow_reports
+    PROFILE_SLOW_REPORTS_DIR = args.slow_reports_dir
+
+    if MODE == "scrape":
+        STRATEGY = args.strategy
+        SCRAPE_IDS = args.ids or (read_ids_file(args.ids_file) if args.ids_file else None)
+        PERMUTATION_SEED = args.seed
+        RUN_INTEGRITY_CHECK = args.verify
+        RUN_AUTOFIND = args.autofind
+        TRUNCATE_DB_TABLES = args.truncate
+        MAX_IN_FLIGHT = args.max_in_flight
+        USE_ASYNC_ENGINE = not args.sync
+
+    if MODE in ("scrape", "reparse"):
+        USE_PIPELINE = args.pipeline
+
+    if MODE in ("scrape", "refresh"):
+        ARCHIVE_PAGES = not args.no_archive
+        SKIP_UNCHANGED_PAGES = not args.parse_unchanged
+
+    if MODE == "autofind":
+        AUTOFIND_FORCE = args.force
+
+    if MODE == "verify":
+        INTEGRITY_REPAIR = None if args.repair == "none" else args.repair
+
+    if MODE == "refresh":
+        REFRESH_LIMIT = args.limit
+        MAX_IN_FLIGHT = args.max_in_flight
+
+    if MODE == "export":
+        EXPORT_DIR = args.out
+        EXPORT_FORMAT = args.format
+        EXPORT_FULL = args.full
+        EXPORT_CHUNK_ROWS = args.chunk_rows
+        EXPORT_TOMBSTONES_DIR = args.tombstones_out
+
+    if MODE == "retry":
+        RETRY_STAGE = args.stage
+        RETRY_ERROR_CLASS = args.error_class
+        RETRY_LIMIT = args.limit
 
-if __name__ == "__main__":
     main()
+
+if __name__ == "__main__":
+    # with no arguments, run MODE with the settings above as before
+    if len(sys.argv) > 1:
+        cli()
+    else:
+        main()
@@ -1,10 +1,163 @@
-from .check_number_in_db import is_number_in_db
-from .get_fms_report_page import get_report_page
-from .sql_db_actions import SQL_insert_into_db, SQL_count_number_of_rows, truncate, SQL_get_UPPER_NUMBER, SQL_update_upper_number, SQL_check_autofind_should_run
-from .get_report_contents import process_report_content
-from .get_randomnumber import get_random_number
-from .strategies import sequential_strategy, single_strategy, random_strategy
-from .db_integrity_check import integrity_check
-from .end_processing import end_of_processing
-from .autofind_highest import autofind_highest_report_id
-from .fms_init import fms_init_main
+"""Submodules are imported the first time one of their names is used, so a
+short run only pays for the dependencies (bs4, requests, psycopg2, ...) it
+actually touches."""
+import importlib
+
+# name -> submodule it lives in
+_EXPORTS = {
+    # structured_logging
+    "setup_logging": "structured_logging",
+    "stop_logging": "structured_logging",
+    "get_logging_config": "structured_logging",
+    "log_context": "structured_logging",
+    # db_pool
+    "db_cursor": "db_pool",
+    "db_connection": "db_pool",
+    "close_pool": "db_pool",
+    # metrics
+    "Counter": "metrics",
+    "Gauge": "metrics",
+    "Histogram": "metrics",
+    "render_metrics": "metrics",
+    "start_metrics_server": "metrics",
+    "enable_metrics_dump": "metrics",
+    # id_bitmap
+    "IDBitmap": "id_bitmap",
+    "load_scraped_ids": "id_bitmap",
+    "get_scraped_ids": "id_bitmap",
+    "mark_scraped": "id_bitmap",
+    # bulk_writer
+    "enable_bulk_writer": "bulk_writer",
+    "close_bulk_writer": "bulk_writer",
+    "get_bulk_writer": "bulk_writer",
+    "SQL_upsert_reports": "bulk_writer",
+    # storage_layout
+    "get_storage_layout": "storage_layout",
+    "migrate_to_wide_table": "storage_layout",
+    "SQL_upsert_wide_reports": "storage_layout",
+    # rate_controller
+    "AdaptiveRateController": "rate_controller",
+    "enable_rate_controller": "rate_controller",
+    "get_rate_controller": "rate_controller",
+    # get_fms_report_page
+    "get_report_page": "get_fms_report_page",
+    "get_report_page_if_changed": "get_fms_report_page",
+    "get_fms_base_url": "get_fms_report_page",
+    "get_session": "get_fms_report_page",
+    "set_http_pool_size": "get_fms_report_page",
+    "response_from_status": "get_fms_report_page",
+    "TransientFetchError": "get_fms_report_page",
+    "UnexpectedStatusError": "get_fms_report_page",
+    "PageTooLargeError": "get_fms_report_page",
+    # html_archive
+    "enable_archive": "html_archive",
+    "close_archive": "html_archive",
+    "archive_page": "html_archive",
+    "reparse_archive": "html_archive",
+    "iter_archive": "html_archive",
+    "load_archive_index": "html_archive",
+    "read_archived_page": "html_archive",
+    # sql_db_actions
+    "SQL_insert_into_db": "sql_db_actions",
+    "truncate": "sql_db_actions",
+    "SQL_get_UPPER_NUMBER": "sql_db_actions",
+    "SQL_update_upper_number": "sql_db_actions",
+    "SQL_check_autofind_should_run": "sql_db_actions",
+    "SQL_get_meta_value": "sql_db_actions",
+    "ensure_table": "sql_db_actions",
+    "SQL_set_meta_value": "sql_db_actions",
+    # get_report_contents
+    "process_report_content": "get_report_contents",
+    "ReportParseError": "get_report_contents",
+    "get_parser_backend": "get_report_contents",
+    # get_randomnumber
+    "get_random_number": "get_randomnumber",
+    # strategies
+    "sequential_strategy": "strategies",
+    "single_strategy": "strategies",
+    "ids_strategy": "strategies",
+    "random_strategy": "strategies",
+    "permutation_strategy": "strategies",
+    "STRATEGY_NUMBERS": "strategies",
+    # db_integrity_check
+    "integrity_check": "db_integrity_check",
+    # end_processing
+    "end_of_processing": "end_processing",
+    # autofind_highest
+    "autofind_highest_report_id": "autofind_highest",
+    "find_highest_gallop": "autofind_highest",
+    "find_highest_linear": "autofind_highest",
+    # fms_init
+    "fms_init_main": "fms_init",
+    # handle_report
+    "handle_report_page": "handle_report",
+    "WRITTEN": "handle_report",
+    "UNCHANGED": "handle_report",
+    "DEAD_LETTERED": "handle_report",
+    "build_report": "handle_report",
+    "build_report_timed": "handle_report",
+    "PARSE_SECONDS": "handle_report",
+    # fetch_engine
+    "run_fetch_engine": "fetch_engine",
+    # pipeline
+    "ReportPipeline": "pipeline",
+    # refresh
+    "refresh_reports": "refresh",
+    "SQL_mark_checked": "refresh",
+    "SQL_create_http_cache_table": "refresh",
+    # work_leases
+    "leased_strategy": "work_leases",
+    "SQL_create_work_leases_table": "work_leases",
+    "record_written": "work_leases",
+    "record_failed": "work_leases",
+    # export
+    "export_reports": "export",
+    # dead_letters
+    "add_dead_letter": "dead_letters",
+    "SQL_create_dead_letters_table": "dead_letters",
+    "retry_dead_letters": "dead_letters",
+    "log_dead_letter_summary": "dead_letters",
+    "SQL_get_dead_letter_ids": "dead_letters",
+    # fingerprint
+    "page_fingerprint": "fingerprint",
+    "enable_fingerprints": "fingerprint",
+    "is_unchanged": "fingerprint",
+    "close_fingerprints": "fingerprint",
+    # tombstones
+    "is_tombstone": "tombstones",
+    "SQL_create_tombstones_table": "tombstones",
+    "SQL_upsert_tombstones": "tombstones",
+    "SQL_delete_tombstones": "tombstones",
+    "SQL_delete_report_rows": "tombstones",
+    "migrate_placeholders_to_tombstones": "tombstones",
+    # profiling
+    "enable_profiler": "profiling",
+    "enable_worker_profiler": "profiling",
+    "get_profiler_config": "profiling",
+    "close_profiler": "profiling",
+    "record_stage": "profiling",
+    "finish_report": "profiling",
+    "discard_report": "profiling",
+    # transport
+    "ReplayStore": "transport",
+    "enable_recording": "transport",
+    "enable_replay": "transport",
+}
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        # src.<submodule> also works without importing it first
+        try:
+            return importlib.import_module(f".{name}", __name__)
+        except ModuleNotFoundError as e:
+            if e.name != f"{__name__}.{name}":
+                raise
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
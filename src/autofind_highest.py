@@ -1,26 +1,23 @@
 import logging
-import time
 
 import src
 
-def autofind_highest_report_id():
-    logging.debug("Beginning autofind highest report number...")
-
-    # check to see if we should run in the first place...
-    should_run = src.SQL_check_autofind_should_run()
-
-    if should_run is 0:
-        logging.debug("DB value is 0, not running auto-find.")
-        return
+# "gallop" finds the frontier with exponential then binary search, "linear"
+# walks up one ID at a time
+AUTOFIND_MODE = "gallop"
 
-    # log that we're running autofind
-    logging.info("Running autofind highest report number...")
+# an ID only counts as past the frontier once this many 404s follow it
+AUTOFIND_WINDOW = 5
 
-    # get upper number from DB
-    upper_number = src.SQL_get_UPPER_NUMBER()
+# probe each window concurrently through the fetch engine
+AUTOFIND_CONCURRENT = True
+AUTOFIND_MAX_IN_FLIGHT = 5
+AUTOFIND_RATE_LIMIT = 1
 
+def find_highest_linear(start: int, window: int = AUTOFIND_WINDOW):
     # set upper number to the iterator 
-    number = upper_number
+    number = start
+    new_highest = start
     consecutive_404s = 0
 
     while True:
@@ -33,14 +30,8 @@ def autofind_highest_report_id():
             logging.debug(f"Had {consecutive_404s} 404s in a row")
 
             # break if we get more than 5 404s in a row
-            if consecutive_404s >= 5:
-                # log + update db
-                logging.info(f"New highest report ID: {new_highest}")
-                src.SQL_update_upper_number(new_highest)
-
-                # break out
-                logging.debug("Returning back to main function...")
-                break
+            if consecutive_404s >= window:
+                return new_highest
 
         else:
             logging.debug(f"Resetting consecutive_404s. Previous value: {consecutive_404s}")
@@ -51,3 +42,113 @@ def autofind_highest_report_id():
         number += 1
         logging.debug(f"Now trying {number}...")
         src.end_of_processing()
+
+def probe_numbers(numbers, concurrent: bool):
+    """Request every number and return {number: response_content}."""
+    responses = {}
+
+    if concurrent:
+        def record(number, response_content, reason):
+            responses[number] = response_content
+
+        src.run_fetch_engine(numbers, record, max_in_flight=AUTOFIND_MAX_IN_FLIGHT, rate_limit=AUTOFIND_RATE_LIMIT)
+
+        # the engine skips numbers it gave up on, which would look like 404s here
+        missing = [number for number in numbers if number not in responses]
+        if missing:
+            raise src.TransientFetchError(f"Could not probe {missing}")
+    else:
+        for number in numbers:
+            responses[number], _ = src.get_report_page(number)
+            src.end_of_processing()
+
+    return responses
+
+def probe_window(start: int, window: int, concurrent: bool):
+    """Return the highest ID in start..start+window-1 that isn't a 404, or None
+    if they all are."""
+    responses = probe_numbers(range(start, start + window), concurrent)
+
+    found = [number for number, response_content in responses.items() if response_content != "404"]
+    logging.debug(f"Window {start}..{start + window - 1}: {len(found)} of {window} exist")
+    return max(found) if found else None
+
+def find_highest_gallop(start: int, window: int = AUTOFIND_WINDOW, concurrent: bool = AUTOFIND_CONCURRENT):
+    """Find the highest report ID in O(log n) window probes. Each probe asks
+    whether any of `window` IDs from a candidate exist, so gaps of fewer than
+    `window` missing IDs don't end the search early."""
+    low = start
+    step = window
+
+    # gallop upwards until a whole window is missing
+    while True:
+        candidate = low + step
+        found = probe_window(candidate, window, concurrent)
+        if found is None:
+            high = candidate
+            break
+
+        logging.info(f"Report {found} exists, galloping further...")
+        low = found
+        step *= 2
+
+    # binary search between the last window that had a report and the first that didn't
+    while high - low > window:
+        middle = (low + high) // 2
+        found = probe_window(middle, window, concurrent)
+
+        if found is None:
+            high = middle
+        else:
+            low = found
+        logging.debug(f"Frontier is between {low} and {high}")
+
+    # the frontier is now within a couple of windows, fetch them all and apply
+    # the same "followed by `window` 404s" rule as the linear mode. The window
+    # at `high` is known to be all 404s, so this always finds an answer.
+    responses = probe_numbers(range(low + 1, high + window), concurrent)
+    new_highest = low
+    consecutive_404s = 0
+
+    for number in range(low + 1, high + window):
+        if responses[number] == "404":
+            consecutive_404s += 1
+            if consecutive_404s >= window:
+                break
+        else:
+            consecutive_404s = 0
+            new_highest = number
+
+    return new_highest
+
+def autofind_highest_report_id(force: bool = False):
+    logging.debug("Beginning autofind highest report number...")
+
+    # check to see if we should run in the first place, unless forced
+    should_run = force or src.SQL_check_autofind_should_run()
+
+    if should_run == 0:
+        logging.debug("DB value is 0, not running auto-find.")
+        return
+
+    # log that we're running autofind
+    logging.info(f"Running autofind highest report number ({AUTOFIND_MODE})...")
+
+    # get upper number from DB
+    upper_number = src.SQL_get_UPPER_NUMBER()
+
+    if AUTOFIND_MODE == "gallop":
+        new_highest = find_highest_gallop(upper_number)
+    elif AUTOFIND_MODE == "linear":
+        new_highest = find_highest_linear(upper_number)
+    else:
+        msg = f"Unknown autofind mode: {AUTOFIND_MODE}"
+        logging.critical(msg)
+        raise ValueError(msg)
+
+    # log + update db
+    logging.info(f"New highest report ID: {new_highest}")
+    src.SQL_update_upper_number(new_highest)
+
+    # break out
+    logging.debug("Returning back to main function...")
@@ -0,0 +1,198 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+import src
+from .metrics import Counter, Histogram
+
+FLUSH_SECONDS = Histogram("fms_bulk_flush_seconds", "Time to write one batch of reports to the DB")
+REPORTS_FLUSHED = Counter("fms_bulk_reports_flushed_total", "Reports written to the DB by the bulk writer")
+
+# table -> (columns, function mapping a report dict to a row)
+REPORT_TABLES = {
+    "status": (("id", "status", "reported_timestamp", "editable"),
+               lambda data, now: (data["number"], data["status"], data["timestamp"], data["editable"])),
+    "details": (("id", "category", "title", "description"),
+                lambda data, now: (data["number"], data["category"], data["title"], data["description"])),
+    "location": (("id", "latitude", "longitude", "council"),
+                 lambda data, now: (data["number"], data["lat"], data["lon"], data["council"])),
+    "method": (("id", "method"),
+               lambda data, now: (data["number"], data["method"])),
+    "updates": (("id", "no_of_updates", "latest_timestamp"),
+                lambda data, now: (data["number"], data["updates"], data["latest_update"])),
+    "logs": (("id", "timestamp", "fingerprint"),
+             lambda data, now: (data["number"], now, data.get("fingerprint"))),
+}
+
+def SQL_upsert_reports(cursor, reports: list, layout=None):
+    """Write a batch of reports to all six tables with one multi-row
+    INSERT ... ON CONFLICT DO UPDATE per table, or to the reports table if
+    the DB uses the wide layout. Tombstones go to the tombstones table, and
+    each ID ends up as either a report or a tombstone, never both."""
+    # one row per id, otherwise ON CONFLICT would touch the same row twice
+    reports = list({data["number"]: data for data in reports}.values())
+    now = datetime.now(timezone.utc)
+    layout = layout or src.get_storage_layout()
+
+    tombstones = [data for data in reports if src.is_tombstone(data)]
+    if tombstones:
+        reports = [data for data in reports if not src.is_tombstone(data)]
+        src.SQL_upsert_tombstones(cursor, tombstones, now)
+        src.SQL_delete_report_rows(cursor, [data["number"] for data in tombstones], layout)
+        if not reports:
+            return
+
+    # e.g. a report that was hidden when last fetched
+    src.SQL_delete_tombstones(cursor, [data["number"] for data in reports])
+
+    if layout == "wide":
+        src.SQL_upsert_wide_reports(cursor, reports, now)
+        return
+
+    # imported here so starting the writer doesn't wait on psycopg2
+    from psycopg2.extras import execute_values # type: ignore
+
+    for table, (columns, to_row) in REPORT_TABLES.items():
+        updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns[1:])
+        execute_values(
+            cursor,
+            f"""
+            INSERT INTO {table} ({", ".join(columns)})
+            VALUES %s
+            ON CONFLICT (id) DO UPDATE SET {updates}
+            """,
+            [to_row(data, now) for data in reports],
+            page_size=len(reports)
+        )
+
+class BulkWriter:
+    """Buffers parsed reports and writes them in batches, when `flush_size`
+    reports are waiting or the oldest has waited `flush_interval_ms`."""
+
+    def __init__(self, flush_size=100, flush_interval_ms=500):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.buffer = []
+        self.oldest = None
+        self.error = None
+        self.closed = False
+        self.condition = threading.Condition()
+        # held while a batch is written, so batches go to the DB one at a time and in order
+        self.flush_lock = threading.Lock()
+
+        self.thread = threading.Thread(target=self._flush_on_timeout, name="bulk-writer", daemon=True)
+        self.thread.start()
+
+    def add(self, data):
+        with self.condition:
+            self._raise_error()
+
+            if not self.buffer:
+                self.oldest = time.monotonic()
+                self.condition.notify()
+            self.buffer.append(data)
+
+            if len(self.buffer) < self.flush_size:
+                return
+
+        # outside the condition, so other threads keep adding while this one writes
+        self._flush()
+
+    def flush(self):
+        self._flush()
+        with self.condition:
+            self._raise_error()
+
+    def close(self):
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify()
+
+        self.thread.join()
+        self._flush()
+        with self.condition:
+            self._raise_error()
+
+    def _flush(self):
+        """Write everything buffered so far. The buffer is swapped out under
+        the condition and written outside it. A batch that fails goes back
+        in front of the buffer, to be written by the next flush, and the
+        error is raised to whoever flushed."""
+        with self.flush_lock:
+            with self.condition:
+                batch, self.buffer = self.buffer, []
+            if not batch:
+                return
+
+            logging.debug(f"Flushing {len(batch)} reports to DB...")
+            start = time.perf_counter()
+            try:
+                with src.db_cursor() as cursor:
+                    SQL_upsert_reports(cursor, batch)
+            except Exception as e:
+                logging.critical(f"Failed to flush {len(batch)} reports to DB, keeping them for the next flush: {e!r}")
+                with self.condition:
+                    self.buffer[:0] = batch
+                    self.oldest = time.monotonic()
+                raise
+
+            FLUSH_SECONDS.observe(time.perf_counter() - start)
+            REPORTS_FLUSHED.inc(amount=len(batch))
+            with self.condition:
+                # a timed flush that failed has now been written after all
+                self.error = None
+            src.record_written([data["number"] for data in batch])
+
+    def _raise_error(self):
+        # caller must hold self.condition
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _flush_on_timeout(self):
+        while True:
+            with self.condition:
+                if self.closed:
+                    return
+
+                if not self.buffer:
+                    self.condition.wait()
+                    continue
+
+                remaining = self.oldest + self.flush_interval - time.monotonic()
+                if remaining > 0:
+                    self.condition.wait(remaining)
+                    continue
+
+            try:
+                self._flush()
+            except Exception as e:
+                # nobody to raise it to here, the next add, flush or close does
+                # unless a later flush writes the batch first
+                with self.condition:
+                    self.error = e
+
+_bulk_writer = None
+
+def enable_bulk_writer(flush_size=100, flush_interval_ms=500):
+    global _bulk_writer
+
+    logging.info(f"Batching DB writes: {flush_size} reports or {flush_interval_ms}ms, whichever comes first")
+    close_bulk_writer()
+    _bulk_writer = BulkWriter(flush_size, flush_interval_ms)
+    return _bulk_writer
+
+def get_bulk_writer():
+    return _bulk_writer
+
+@atexit.register
+def close_bulk_writer():
+    global _bulk_writer
+
+    if _bulk_writer is not None:
+        writer, _bulk_writer = _bulk_writer, None
+        writer.close()
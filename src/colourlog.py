@@ -23,13 +23,3 @@ def setup_logger(level=logging.DEBUG):
     if not logger.handlers:
         logger.addHandler(handler)
     logger.setLevel(level)
-
-# Now you use it
-setup_logger()
-
-# Test logs
-logging.debug('Debug message')        # No color
-logging.info('Info message')          # No color
-logging.warning('Warning message')    # Yellow
-logging.error('Error message')        # Red
-logging.critical('Critical message')  # Red + Bold
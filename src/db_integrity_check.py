@@ -1,37 +1,226 @@
 import logging
-import psycopg2 # type: ignore 
-from psycopg2.extras import DictCursor # type: ignore
+
+import src
+from .db_pool import db_cursor
+
+TABLES = ["details", "location", "logs", "method", "status", "updates"]
+
+# what to do with reports missing from some tables: None to stop with an
+# error, "requeue" to delete what there is so the strategies fetch them
+# again, "refetch" to also fetch them again straight away
+INTEGRITY_REPAIR = "refetch"
+
+def SQL_install_row_counters(tables: list):
+    """Keep a row count per table in row_counts, maintained by statement-level
+    triggers, so checking the counts doesn't need a full scan. Counting each
+    table to seed them is a one-off cost.
+
+    The triggers don't update row_counts themselves, as every writer would
+    then queue on the same six rows. Each statement adds a row to
+    row_count_deltas instead, which SQL_get_row_counts folds in."""
+    logging.warning("Installing row counters, this counts every table once...")
+
+    with db_cursor() as cursor:
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS row_counts (
+                table_name TEXT NOT NULL PRIMARY KEY,
+                row_count BIGINT NOT NULL
+            );
+
+            -- no key, so inserts from concurrent writers never wait on each other
+            CREATE TABLE IF NOT EXISTS row_count_deltas (
+                table_name TEXT NOT NULL,
+                delta BIGINT NOT NULL
+            );
+
+            CREATE OR REPLACE FUNCTION row_counts_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                INSERT INTO row_count_deltas (table_name, delta)
+                SELECT TG_TABLE_NAME, count(*) FROM changed_rows HAVING count(*) > 0;
+                RETURN NULL;
+            END $$;
+
+            CREATE OR REPLACE FUNCTION row_counts_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                INSERT INTO row_count_deltas (table_name, delta)
+                SELECT TG_TABLE_NAME, -count(*) FROM changed_rows HAVING count(*) > 0;
+                RETURN NULL;
+            END $$;
+
+            CREATE OR REPLACE FUNCTION row_counts_truncate() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                DELETE FROM row_count_deltas WHERE table_name = TG_TABLE_NAME;
+                UPDATE row_counts SET row_count = 0 WHERE table_name = TG_TABLE_NAME;
+                RETURN NULL;
+            END $$;
+            """
+        )
+
+        for table in tables:
+            # creating the triggers locks out writers until commit, so the count is exact
+            cursor.execute(
+                f"""
+                DROP TRIGGER IF EXISTS row_counts_insert ON {table};
+                DROP TRIGGER IF EXISTS row_counts_delete ON {table};
+                DROP TRIGGER IF EXISTS row_counts_truncate ON {table};
+
+                CREATE TRIGGER row_counts_insert AFTER INSERT ON {table}
+                REFERENCING NEW TABLE AS changed_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION row_counts_insert();
+
+                CREATE TRIGGER row_counts_delete AFTER DELETE ON {table}
+                REFERENCING OLD TABLE AS changed_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION row_counts_delete();
+
+                CREATE TRIGGER row_counts_truncate AFTER TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION row_counts_truncate();
+
+                DELETE FROM row_count_deltas WHERE table_name = %s;
+                INSERT INTO row_counts (table_name, row_count)
+                SELECT %s, count(*) FROM {table}
+                ON CONFLICT (table_name) DO UPDATE SET row_count = excluded.row_count;
+                """, # !! this is dangerous !! but it's not user input.
+                (table, table)
+            )
 
 def SQL_get_row_counts(tables: list):
     logging.debug("Getting row counts...")
-    row_counts = {}
 
-    with psycopg2.connect() as psql:
-        cursor = psql.cursor(cursor_factory=DictCursor)
-        for table in tables:
-            query = f"SELECT count(*) FROM {table};" # !! this is dangerous !! but it's not user input.
-            cursor.execute(query)
+    with db_cursor() as cursor:
+        # counters installed before row_count_deltas existed update row_counts directly
+        cursor.execute("SELECT to_regclass('row_counts') IS NOT NULL AND to_regclass('row_count_deltas') IS NOT NULL;")
+        if cursor.fetchone()[0]:
+            # fold the deltas written since the last check into the counts.
+            # Deltas committed while this runs aren't in its snapshot, so
+            # they stay for next time.
+            cursor.execute(
+                """
+                WITH folded AS (
+                    DELETE FROM row_count_deltas RETURNING table_name, delta
+                ), sums AS (
+                    SELECT table_name, sum(delta) AS delta FROM folded GROUP BY table_name
+                )
+                UPDATE row_counts SET row_count = row_count + sums.delta
+                FROM sums WHERE row_counts.table_name = sums.table_name;
+                """
+            )
+            cursor.execute("SELECT table_name, row_count FROM row_counts WHERE table_name = ANY(%s);", (tables,))
+            row_counts = dict(cursor.fetchall())
+        else:
+            row_counts = {}
 
-            result = cursor.fetchone()
-            row_counts[table] = result[0]
-            logging.debug(f"Table: {table}, count: {result[0]}")
+    if len(row_counts) < len(tables):
+        SQL_install_row_counters(tables)
+        return SQL_get_row_counts(tables)
 
+    for table in tables:
+        logging.debug(f"Table: {table}, count: {row_counts[table]}")
     return row_counts
-    
 
-def integrity_check():
-    logging.info("Starting DB integrity check...")
+def SQL_find_incomplete_reports(tables: list):
+    """Return {id: [tables it is missing from]} for every report that isn't
+    in all tables, in one pass over the primary keys."""
+    joins = " ".join(f"FULL JOIN {table} USING (id)" for table in tables[1:])
+    missing = ", ".join(f"{table}.id IS NULL" for table in tables)
 
-    tables = ["details", "location", "logs", "method", "status", "updates"]
-    row_counts = SQL_get_row_counts(tables)
+    with db_cursor(cursor_factory=None) as cursor:
+        cursor.execute(
+            f"""
+            SELECT id, {missing}
+            FROM {tables[0]} {joins}
+            WHERE {" OR ".join(f"{table}.id IS NULL" for table in tables)};
+            """ # !! this is dangerous !! but it's not user input.
+        )
+        return {
+            row[0]: [table for table, is_missing in zip(tables, row[1:]) if is_missing]
+            for row in cursor.fetchall()
+        }
 
-    counts = []
-    for table in tables:
-        counts.append(row_counts[table])
+def SQL_find_tombstoned_reports():
+    """IDs that are both a report and a tombstone. The writers never leave
+    one behind, so this joins the tables only when asked for, e.g. by the
+    verify command, to catch rows written some other way."""
+    src.SQL_create_tombstones_table()
+    with db_cursor(cursor_factory=None) as cursor:
+        cursor.execute("SELECT id FROM tombstones JOIN status USING (id) ORDER BY id;")
+        return [number for (number,) in cursor.fetchall()]
+
+def SQL_delete_reports(numbers: list, tables: list):
+    logging.info(f"Deleting {len(numbers)} incomplete reports...")
+    with db_cursor() as cursor:
+        for table in tables:
+            cursor.execute(f"DELETE FROM {table} WHERE id = ANY(%s);", (numbers,))
+        src.SQL_delete_tombstones(cursor, numbers)
+
+def refetch_reports(numbers: list):
+    for number in numbers:
+        try:
+            response_content, reason = src.get_report_page(number)
+        except src.TransientFetchError:
+            # it was deleted, so the strategies will pick it up again
+            continue
+        except src.UnexpectedStatusError as e:
+            src.add_dead_letter(number, "fetch", e, e.body, e.status_code)
+            continue
+        src.handle_report_page(number, response_content, reason)
+
+def find_incomplete_reports():
+    """{id: [tables it is missing from]} for every report not in all six
+    tables. Row counts come from trigger maintained counters, so this is
+    cheap however big the DB is. Only if they differ are the tables joined."""
+    if src.get_storage_layout() == "wide":
+        logging.info("Reports are in a single table, nothing to check")
+        return {}
 
-    if len(set(counts)) == 1:
+    row_counts = SQL_get_row_counts(TABLES)
+    if len(set(row_counts.values())) == 1:
         logging.info("All tables have the same row count")
-    else:
-        msg = "Tables have differing row counts"
+        return {}
+
+    logging.warning(f"Tables have differing row counts: {row_counts}. Looking for incomplete reports...")
+    incomplete = SQL_find_incomplete_reports(TABLES)
+
+    if not incomplete:
+        # every report is complete, so it is the counters that are off
+        logging.warning("No incomplete reports found, recounting rows")
+        SQL_install_row_counters(TABLES)
+
+    return incomplete
+
+def integrity_check(repair=INTEGRITY_REPAIR, check_tombstones=False):
+    """Check every report is in all tables and, with `check_tombstones`,
+    that no ID is both a report and a tombstone. That check joins tombstones
+    to status, so its cost grows with the DB and it is left out of the check
+    before a scrape. What is found is repaired according to `repair`.
+    Returns the IDs that were found."""
+    logging.info("Starting DB integrity check...")
+
+    incomplete = find_incomplete_reports()
+    for number, missing_from in list(incomplete.items())[:20]:
+        logging.warning(f"Report {number} is missing from {', '.join(missing_from)}")
+
+    tombstoned = SQL_find_tombstoned_reports() if check_tombstones else []
+    for number in tombstoned[:20]:
+        logging.warning(f"Report {number} is also a tombstone")
+
+    numbers = sorted(set(incomplete) | set(tombstoned))
+    if not numbers:
+        return []
+
+    if not repair:
+        msg = f"{len(numbers)} reports are incomplete or also tombstones, first few: {numbers[:20]}"
         logging.critical(msg)
         raise ValueError(msg)
+
+    elif repair not in ("requeue", "refetch"):
+        msg = f"Unknown integrity repair given. Was given: {repair}"
+        logging.critical(msg)
+        raise ValueError(msg)
+
+    SQL_delete_reports(numbers, TABLES)
+    if repair == "refetch":
+        logging.info(f"Fetching {len(numbers)} incomplete reports again...")
+        refetch_reports(numbers)
+
+    return numbers
@@ -0,0 +1,65 @@
+import atexit
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from psycopg2.extras import DictCursor # type: ignore
+from psycopg2.pool import ThreadedConnectionPool # type: ignore
+
+_pool = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool, _pool_slots
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                minconn = int(os.environ.get("PG_POOL_MIN") or 1)
+                maxconn = int(os.environ.get("PG_POOL_MAX") or 16)
+                logging.debug(f"Opening Postgres connection pool ({minconn}-{maxconn} connections)...")
+
+                # connection details come from the usual PG* environment variables
+                _pool = ThreadedConnectionPool(minconn, maxconn)
+
+                # ThreadedConnectionPool errors when exhausted, so make callers wait instead
+                _pool_slots = threading.BoundedSemaphore(maxconn)
+
+    return _pool
+
+@contextmanager
+def db_connection():
+    """Borrow a pooled connection for one transaction. Commits if the block
+    succeeds and rolls back if it raises. For work that needs several
+    cursors in the same transaction, otherwise use db_cursor."""
+    pool = get_pool()
+    _pool_slots.acquire()
+    psql = pool.getconn()
+
+    try:
+        with psql:
+            yield psql
+    finally:
+        # don't hand a dead connection to the next caller
+        pool.putconn(psql, close=bool(psql.closed))
+        _pool_slots.release()
+
+@contextmanager
+def db_cursor(name=None, cursor_factory=DictCursor):
+    """Borrow a pooled connection for one transaction with a single cursor.
+    Giving a `name` opens a server-side cursor, which streams results
+    instead of loading them all at once."""
+    with db_connection() as psql:
+        with psql.cursor(name=name, cursor_factory=cursor_factory) as cursor:
+            yield cursor
+
+@atexit.register
+def close_pool():
+    global _pool
+
+    if _pool is not None:
+        logging.debug("Closing Postgres connection pool...")
+        _pool.closeall()
+        _pool = None
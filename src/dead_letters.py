@@ -0,0 +1,153 @@
+import collections
+import logging
+import threading
+import time
+
+import src
+from .db_pool import db_cursor
+from .metrics import Counter
+
+DEAD_LETTERS = Counter(
+    "fms_dead_letters_total", "Reports set aside because a stage failed on them, by stage and error class",
+    ("stage", "error_class")
+)
+
+SQL_CREATE_DEAD_LETTERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS "public"."dead_letters" (
+      "id" INTEGER NOT NULL,
+      "stage" TEXT NOT NULL,
+      "error_class" TEXT NOT NULL,
+      "error" TEXT NOT NULL,
+      "status_code" INTEGER NULL,
+      "body" BYTEA NULL,
+      "attempts" INTEGER NOT NULL DEFAULT 1,
+      "failed_timestamp" TIMESTAMP WITH TIME ZONE NOT NULL,
+      CONSTRAINT "PK_dead_letters" PRIMARY KEY ("id")
+    );
+"""
+
+_run_counts = collections.Counter()
+_run_counts_lock = threading.Lock()
+
+def SQL_create_dead_letters_table():
+    src.ensure_table("dead_letters", SQL_CREATE_DEAD_LETTERS_TABLE)
+
+def add_dead_letter(number: int, stage: str, error: Exception, body=None, status_code=None):
+    """Set a report aside instead of stopping the run: record which stage
+    failed on it, the error and the raw body, so it can be retried with
+    retry_dead_letters once the cause is fixed. The report counts as scraped
+    for the rest of this run and for later ones until then."""
+    error_class = type(error).__name__
+    logging.error("Report %s failed in %s with %s: %s, added to dead letters", number, stage, error_class, error,
+                  extra={"report_id": number, "stage": stage})
+
+    if isinstance(body, str):
+        body = body.encode()
+
+    SQL_create_dead_letters_table()
+    with db_cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO dead_letters (id, stage, error_class, error, status_code, body, failed_timestamp)
+            VALUES (%s, %s, %s, %s, %s, %s, now())
+            ON CONFLICT (id) DO UPDATE SET
+                stage = EXCLUDED.stage, error_class = EXCLUDED.error_class, error = EXCLUDED.error,
+                status_code = EXCLUDED.status_code, body = EXCLUDED.body,
+                attempts = dead_letters.attempts + 1, failed_timestamp = EXCLUDED.failed_timestamp;
+            """,
+            (number, stage, error_class, str(error), status_code, body)
+        )
+
+    DEAD_LETTERS.inc(stage, error_class)
+    with _run_counts_lock:
+        _run_counts[(stage, error_class)] += 1
+    src.mark_scraped((number, ))
+    src.record_written((number, ))
+    src.discard_report(number)
+
+def SQL_get_dead_letter_ids():
+    SQL_create_dead_letters_table()
+    with db_cursor(cursor_factory=None) as cursor:
+        cursor.execute("SELECT id FROM dead_letters;")
+        return [number for (number, ) in cursor.fetchall()]
+
+def SQL_iter_dead_letters(stage=None, error_class=None, limit=None):
+    """Yield (number, stage, status_code, body) for each dead letter,
+    optionally only those from one stage or of one error class."""
+    SQL_create_dead_letters_table()
+    with db_cursor(name="dead_letters", cursor_factory=None) as cursor:
+        cursor.execute(
+            """
+            SELECT id, stage, status_code, body FROM dead_letters
+            WHERE (%(stage)s IS NULL OR stage = %(stage)s)
+              AND (%(error_class)s IS NULL OR error_class = %(error_class)s)
+            ORDER BY id
+            LIMIT %(limit)s;
+            """,
+            {"stage": stage, "error_class": error_class, "limit": limit}
+        )
+        for number, letter_stage, status_code, body in cursor:
+            yield number, letter_stage, status_code, bytes(body) if body is not None else None
+
+def SQL_delete_dead_letters(numbers: list):
+    with db_cursor() as cursor:
+        cursor.execute("DELETE FROM dead_letters WHERE id = ANY(%s);", (numbers, ))
+        return cursor.rowcount
+
+def dead_letter_summary():
+    """Dead letters added during this run, as {(stage, error_class): count}."""
+    with _run_counts_lock:
+        return dict(_run_counts)
+
+def log_dead_letter_summary():
+    counts = dead_letter_summary()
+    if not counts:
+        return
+
+    breakdown = ", ".join(
+        f"{stage}/{error_class}: {count}" for (stage, error_class), count in sorted(counts.items())
+    )
+    logging.warning(f"{sum(counts.values())} reports added to dead letters this run ({breakdown})")
+
+def retry_dead_letters(stage=None, error_class=None, limit=None):
+    """Push dead letters through the pipeline again, e.g. after fixing the
+    parser. Parse failures are reparsed from their stored body, fetch
+    failures are fetched again. Reports that succeed are written and their
+    dead letters removed; ones that fail again stay, with their new error.
+    Returns (retried, resolved)."""
+    logging.info("Retrying dead letters...")
+    start = time.monotonic()
+    resolved = []
+
+    # read them all first, retrying rewrites the rows being read
+    letters = list(SQL_iter_dead_letters(stage, error_class, limit))
+    for number, letter_stage, status_code, body in letters:
+        if letter_stage == "fetch":
+            try:
+                body, reason = src.get_report_page(number)
+            except src.UnexpectedStatusError as e:
+                add_dead_letter(number, "fetch", e, e.body, e.status_code)
+                continue
+            except src.TransientFetchError:
+                continue
+        else:
+            reason = ""
+
+        try:
+            data = src.build_report(number, body, reason)
+        except Exception as e:
+            add_dead_letter(number, "parse", e, body)
+            continue
+
+        src.SQL_insert_into_db(data)
+        resolved.append(number)
+
+    # only drop the dead letters once their reports are in the DB
+    writer = src.get_bulk_writer()
+    if writer is not None:
+        writer.flush()
+    if resolved:
+        SQL_delete_dead_letters(resolved)
+
+    logging.info(f"Retried {len(letters)} dead letters in {time.monotonic() - start:.1f}s, {len(resolved)} resolved")
+    return len(letters), len(resolved)
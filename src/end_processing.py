@@ -1,6 +1,4 @@
-import time
-
 def end_of_processing():
+    # pacing is done per request by the rate controller
     print("=" * 50)
-    time.sleep(1)
     return
@@ -0,0 +1,291 @@
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+import src
+
+try:
+    import pyarrow as pa # type: ignore
+    import pyarrow.parquet as pq # type: ignore
+except ImportError as e:
+    raise ImportError("Exporting needs pyarrow, install it with: pip install pyarrow") from e
+
+# rows fetched from the server-side cursor and written per batch
+EXPORT_CHUNK_ROWS = 10000
+
+# meta keys holding how far reports (by logs.timestamp) and tombstones (by
+# checked_timestamp) have been exported
+EXPORT_WATERMARK_KEY = "export_watermark"
+EXPORT_TOMBSTONES_WATERMARK_KEY = "export_tombstones_watermark"
+
+# an export only goes up to this long before the DB's clock. Timestamps are
+# set by the writers before they commit, so a row committed later than this,
+# or written by a host whose clock is further behind, would be missed.
+EXPORT_SAFETY_SECONDS = 60
+
+# partition for reports without a reported timestamp
+UNKNOWN_MONTH = "unknown"
+
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+CATEGORICAL = pa.dictionary(pa.int32(), pa.string())
+
+EXPORT_SCHEMA = pa.schema([
+    ("id", pa.int32()),
+    ("status", CATEGORICAL),
+    ("reported_timestamp", TIMESTAMP),
+    ("editable", pa.bool_()),
+    ("category", CATEGORICAL),
+    ("title", pa.string()),
+    ("description", pa.string()),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("council", CATEGORICAL),
+    ("method", CATEGORICAL),
+    ("no_of_updates", pa.int32()),
+    ("latest_timestamp", TIMESTAMP),
+    ("logged_timestamp", TIMESTAMP),
+])
+
+TOMBSTONE_SCHEMA = pa.schema([
+    ("id", pa.int32()),
+    ("status_code", pa.int16()),
+    ("checked_timestamp", TIMESTAMP),
+])
+
+EXPORT_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+# same columns in the same order from either layout, ordered by report month
+# so only one partition's file is open at a time. The split layout LEFT JOINs
+# from logs like the wide migration does, so a report missing from some
+# tables is still exported (with NULLs) rather than passed by the watermark.
+SQL_EXPORT_SPLIT = """
+    SELECT id, status.status, reported_timestamp, editable, category, title, description,
+           latitude, longitude, council, method.method, no_of_updates, latest_timestamp,
+           logs.timestamp
+    FROM logs
+    LEFT JOIN status USING (id) LEFT JOIN details USING (id) LEFT JOIN location USING (id)
+    LEFT JOIN method USING (id) LEFT JOIN updates USING (id)
+    WHERE logs.timestamp > %s AND logs.timestamp <= %s
+    ORDER BY date_trunc('month', reported_timestamp AT TIME ZONE 'UTC') NULLS LAST, id;
+"""
+
+SQL_EXPORT_WIDE = """
+    SELECT id, status, reported_timestamp, editable, category, title, description,
+           latitude, longitude, council, method, no_of_updates, latest_timestamp,
+           logged_timestamp
+    FROM reports
+    WHERE logged_timestamp > %s AND logged_timestamp <= %s
+    ORDER BY date_trunc('month', reported_timestamp AT TIME ZONE 'UTC') NULLS LAST, id;
+"""
+
+SQL_EXPORT_TOMBSTONES = """
+    SELECT id, status_code, checked_timestamp
+    FROM tombstones
+    WHERE checked_timestamp > %s AND checked_timestamp <= %s
+    ORDER BY id;
+"""
+
+class CategoryEncoder:
+    """Dictionary encodes one column across every batch of an export. New
+    values are only ever appended, so each batch's dictionary extends the
+    last one, which Arrow IPC files can store as deltas. Memory grows with
+    the number of distinct values, not rows."""
+
+    def __init__(self):
+        self.indices = {}
+        self.values = []
+
+    def encode(self, column):
+        codes = []
+        for value in column:
+            if value is None:
+                codes.append(None)
+                continue
+            code = self.indices.get(value)
+            if code is None:
+                code = self.indices[value] = len(self.values)
+                self.values.append(value)
+            codes.append(code)
+
+        return pa.DictionaryArray.from_arrays(
+            pa.array(codes, pa.int32()), pa.array(self.values, pa.string())
+        )
+
+def report_month(timestamp):
+    if timestamp is None:
+        return UNKNOWN_MONTH
+    return timestamp.astimezone(timezone.utc).strftime("%Y-%m")
+
+def to_record_batch(rows, encoders):
+    columns = list(zip(*rows))
+    arrays = []
+    for field, column in zip(EXPORT_SCHEMA, columns):
+        if field.name in encoders:
+            arrays.append(encoders[field.name].encode(column))
+        else:
+            arrays.append(pa.array(column, field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=EXPORT_SCHEMA)
+
+class PartitionWriter:
+    """Writes record batches to <directory>/report_month=<month>/<name>,
+    one file open at a time. Files are written under a temporary name and
+    only renamed into place once complete."""
+
+    def __init__(self, directory, export_format, name, schema=EXPORT_SCHEMA):
+        self.directory = directory
+        self.export_format = export_format
+        self.name = name + EXPORT_FORMATS[export_format]
+        self.schema = schema
+        self.month = None
+        self.path = None
+        self.writer = None
+        self.files = []
+
+    def write(self, month, batch):
+        if self.writer is None or month != self.month:
+            self.close()
+            self.open(month)
+        self.writer.write_batch(batch)
+
+    def open(self, month):
+        # month None writes straight into the directory, unpartitioned
+        partition = self.directory if month is None else os.path.join(self.directory, f"report_month={month}")
+        os.makedirs(partition, exist_ok=True)
+        self.month = month
+        self.path = os.path.join(partition, self.name)
+
+        if self.export_format == "parquet":
+            self.writer = pq.ParquetWriter(self.path + ".tmp", self.schema, compression="zstd")
+        else:
+            options = pa.ipc.IpcWriteOptions(compression="zstd", emit_dictionary_deltas=True)
+            self.writer = pa.ipc.new_file(self.path + ".tmp", self.schema, options=options)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.path + ".tmp", self.path)
+            self.files.append(self.path)
+            self.writer = None
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.remove(self.path + ".tmp")
+            self.writer = None
+
+def get_export_watermark(key=EXPORT_WATERMARK_KEY):
+    value = src.SQL_get_meta_value(key)
+    return datetime.fromisoformat(value) if value else None
+
+def SQL_start_export(connection):
+    """Make the export's transaction REPEATABLE READ, so reports and
+    tombstones are read from one snapshot, and return the DB time to export
+    up to."""
+    with connection.cursor() as cursor:
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        cursor.execute("SELECT now() - make_interval(secs => %s);", (EXPORT_SAFETY_SECONDS, ))
+        return cursor.fetchone()[0]
+
+def export_tombstones(connection, directory, export_format, run_name, since, until, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Write the tombstones checked after `since` and up to `until` to one
+    file in `directory`. Returns the number of rows written."""
+    writer = PartitionWriter(directory, export_format, run_name, TOMBSTONE_SCHEMA)
+    count = 0
+
+    try:
+        with connection.cursor(name="export_tombstones") as cursor:
+            cursor.itersize = chunk_rows
+            cursor.execute(SQL_EXPORT_TOMBSTONES, (since, until))
+
+            while rows := cursor.fetchmany(chunk_rows):
+                columns = list(zip(*rows))
+                arrays = [pa.array(column, field.type) for field, column in zip(TOMBSTONE_SCHEMA, columns)]
+                writer.write(None, pa.RecordBatch.from_arrays(arrays, schema=TOMBSTONE_SCHEMA))
+
+                count += len(rows)
+                del rows, columns, arrays
+
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+    return count
+
+def export_reports(directory, export_format="parquet", chunk_rows=EXPORT_CHUNK_ROWS, full=False, tombstones_directory=None):
+    """Stream every report logged since the last export into typed, month
+    partitioned Parquet or Arrow IPC files under `directory`, then move the
+    watermark forward. With `full` everything is exported again. Rows go
+    through a server-side cursor `chunk_rows` at a time, so memory use
+    doesn't depend on the size of the DB. Tombstones aren't reports, so they
+    are only exported if `tombstones_directory` is given, to a separate
+    unpartitioned dataset there, with their own watermark. Both are read in
+    one transaction, up to EXPORT_SAFETY_SECONDS before the DB's clock.
+    Returns the number of rows written."""
+    if export_format not in EXPORT_FORMATS:
+        msg = f"Unknown export format: {export_format}"
+        logging.critical(msg)
+        raise ValueError(msg)
+
+    beginning = datetime.min.replace(tzinfo=timezone.utc)
+    watermark = None if full else get_export_watermark()
+    since = watermark or beginning
+    if tombstones_directory:
+        src.SQL_create_tombstones_table()
+        tombstones_since = (None if full else get_export_watermark(EXPORT_TOMBSTONES_WATERMARK_KEY)) or beginning
+
+    query = SQL_EXPORT_WIDE if src.get_storage_layout() == "wide" else SQL_EXPORT_SPLIT
+    encoders = {field.name: CategoryEncoder() for field in EXPORT_SCHEMA if field.type == CATEGORICAL}
+    # one file per partition per run, named so re-runs add files next to the old ones
+    run_name = "part-" + datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    writer = PartitionWriter(directory, export_format, run_name)
+
+    start = time.monotonic()
+    count = 0
+    tombstones = 0
+
+    with src.db_connection() as connection:
+        until = SQL_start_export(connection)
+        logging.info(f"Exporting reports logged after {watermark or 'the beginning'} up to {until} to {directory} as {export_format}...")
+
+        try:
+            with connection.cursor(name="export") as cursor:
+                cursor.itersize = chunk_rows
+                cursor.execute(query, (since, until))
+
+                while rows := cursor.fetchmany(chunk_rows):
+                    # a chunk can span months, split it at each boundary
+                    first = 0
+                    for i in range(1, len(rows) + 1):
+                        if i == len(rows) or report_month(rows[i][2]) != report_month(rows[first][2]):
+                            writer.write(report_month(rows[first][2]), to_record_batch(rows[first:i], encoders))
+                            first = i
+
+                    count += len(rows)
+                    logging.debug("Exported %s rows...", count)
+
+                    # let this chunk go before fetching the next one
+                    del rows
+
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+
+        logging.info(f"Exported {count} reports to {len(writer.files)} files in {time.monotonic() - start:.1f}s")
+
+        if tombstones_directory:
+            tombstones = export_tombstones(connection, tombstones_directory, export_format, run_name,
+                                           tombstones_since, until, chunk_rows)
+            logging.info(f"Exported {tombstones} tombstones to {tombstones_directory}")
+
+    # the next export carries on from the cutoff rather than the newest row
+    # exported, so rows logged after it are picked up then even if they
+    # weren't committed yet
+    if until > since:
+        src.SQL_set_meta_value(EXPORT_WATERMARK_KEY, until.isoformat())
+    if tombstones_directory and until > tombstones_since:
+        src.SQL_set_meta_value(EXPORT_TOMBSTONES_WATERMARK_KEY, until.isoformat())
+
+    return count + tombstones
@@ -0,0 +1,101 @@
+import re
+
+try:
+    from lxml import etree # type: ignore
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+# where the parts we care about start, so the <head>, nav and map can be skipped
+SIDE_REPORT_START = re.compile(rb"<div[^>]*\bid=[\"']?side-report\b")
+UPDATES_START = re.compile(rb"<section[^>]*\bclass=[\"'][^\"']*\bfull-width\b")
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+if LXML_AVAILABLE:
+    HTML_PARSER = etree.HTMLParser(encoding="utf-8")
+
+    # the same strings BeautifulSoup's get_text() sees: no comments, scripts or styles
+    TEXT_NODES = etree.XPath(
+        "descendant-or-self::text()[not(parent::script or parent::style)]", smart_strings=False
+    )
+
+    SIDE_REPORT = etree.XPath("(//div[@id='side-report'])[1]")
+    UPDATES_SECTION = etree.XPath(f"(//section[{_has_class('full-width')}])[1]")
+    META = etree.XPath(f"(.//p[{_has_class('report_meta_info')}])[1]")
+    COUNCIL = etree.XPath(f"(.//p[{_has_class('council_sent_info')}])[1]")
+    LINK = etree.XPath("(.//a)[1]")
+    BANNER = etree.XPath(f"(.//*[{_has_class('banner')}])[1]")
+    UPDATE_FORM = etree.XPath("(.//div[@id='update_form'])[1]")
+    TITLE = etree.XPath("(.//h1)[1]")
+    DESCRIPTION = etree.XPath(f"(.//div[{_has_class('moderate-display')}])[1]")
+    PARAGRAPHS = etree.XPath(".//p")
+    PROBLEM_BACK = etree.XPath(f"(.//a[{_has_class('problem-back')}])[1]")
+    UPDATE_ITEMS = etree.XPath(f".//li[{_has_class('item-list__item--updates')}]")
+    UPDATE_META = etree.XPath(f".//p[{_has_class('meta-2')}]")
+
+def _first(xpath, element):
+    found = xpath(element)
+    return found[0] if found else None
+
+def _text(element):
+    return "".join(TEXT_NODES(element))
+
+def _stripped_text(element):
+    return "".join(text.strip() for text in TEXT_NODES(element))
+
+def _relevant_markup(content):
+    # only parse from #side-report (or the updates section if it comes first) onwards
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+
+    starts = [match.start() for match in (SIDE_REPORT_START.search(content), UPDATES_START.search(content)) if match]
+    return content[min(starts):] if starts else content
+
+def extract_with_lxml(content):
+    """lxml version of get_report_contents.extract_with_bs4. Gives the same
+    fields, computing each text once."""
+    markup = _relevant_markup(content)
+    if not markup.strip():
+        return None
+
+    root = etree.fromstring(markup, HTML_PARSER)
+    if root is None:
+        return None
+
+    side_report = _first(SIDE_REPORT, root)
+    if side_report is None:
+        return None
+
+    meta_tag = _first(META, side_report)
+    council_tag = _first(COUNCIL, side_report)
+    council_link = _first(LINK, council_tag) if council_tag is not None else None
+    updates_tag = _first(UPDATES_SECTION, root)
+    banner = _first(BANNER, side_report)
+    title_tag = _first(TITLE, side_report)
+    description_div = _first(DESCRIPTION, side_report)
+    a_tag = _first(PROBLEM_BACK, side_report)
+
+    page = {
+        "banner_classes": banner.get("class", "").split() if banner is not None else None,
+        "has_update_form": _first(UPDATE_FORM, side_report) is not None,
+        "meta_text": _stripped_text(meta_tag) if meta_tag is not None else None,
+        "council_text": _text(council_tag) if council_tag is not None else None,
+        "council_link_text": _stripped_text(council_link) if council_link is not None else None,
+        "title_text": _stripped_text(title_tag) if title_tag is not None else None,
+        "paragraphs": None,
+        "href": a_tag.get("href", "") if a_tag is not None else None,
+        "update_items": None,
+    }
+
+    if description_div is not None:
+        page["paragraphs"] = [_stripped_text(p) for p in PARAGRAPHS(description_div)]
+
+    if updates_tag is not None:
+        page["update_items"] = [
+            [_stripped_text(tag) for tag in UPDATE_META(item)]
+            for item in UPDATE_ITEMS(updates_tag)
+        ]
+
+    return page
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import src
+from .metrics import Counter, Gauge
+
+IN_FLIGHT = Gauge("fms_fetch_in_flight", "Reports being fetched or handled by the fetch engine")
+FETCH_FAILURES = Counter("fms_fetch_failures_total", "Reports the fetch engine skipped after retrying")
+
+class HostRateLimiter:
+    """Spaces requests to the same host at least 1/rate seconds apart."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = {}
+
+    async def acquire(self, host):
+        if not self.interval:
+            return
+
+        # reserve the next free slot for this host, then wait for it
+        now = time.monotonic()
+        slot = max(now, self.next_slot.get(host, now))
+        self.next_slot[host] = slot + self.interval
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+async def _run_engine(generator, handler, max_in_flight, rate_limit, fetch):
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="fetch")
+    limiter = HostRateLimiter(rate_limit)
+    host = urlparse(src.get_fms_base_url()).netloc
+    in_flight = asyncio.Semaphore(max_in_flight)
+    tasks = set()
+    IN_FLIGHT.set_function(lambda: len(tasks))
+    errors = []
+    completed = 0
+    failed = 0
+    fetching = set()
+    skipped_in_a_row = 0
+    iterator = iter(generator)
+
+    async def fetch_and_handle(number):
+        nonlocal completed, failed
+        try:
+            await limiter.acquire(host)
+            response_content, reason = await loop.run_in_executor(executor, fetch, number)
+            await loop.run_in_executor(executor, handler, number, response_content, reason)
+            completed += 1
+        except src.TransientFetchError:
+            # already retried and logged. Count it as scraped in the bitmap
+            # only, so the strategies stop handing it out this run and the
+            # next run, which loads the bitmap from the DB, tries it again
+            failed += 1
+            FETCH_FAILURES.inc()
+            src.mark_scraped((number, ))
+            src.record_failed((number, ))
+        except src.UnexpectedStatusError as e:
+            await loop.run_in_executor(executor, src.add_dead_letter, number, "fetch", e, e.body, e.status_code)
+        except Exception as e:
+            logging.critical(f"Failed while processing {number}: {e!r}", extra={"report_id": number})
+            errors.append(e)
+        finally:
+            fetching.discard(number)
+            in_flight.release()
+
+    try:
+        while not errors:
+            await in_flight.acquire()
+
+            # strategies hit the DB to skip numbers, so pull from them off the event loop
+            number = await loop.run_in_executor(executor, next, iterator, None)
+            if number is None:
+                in_flight.release()
+                break
+
+            # the random strategy can hand back a number that is still in
+            # flight. If it keeps doing so, wait for a fetch to finish rather
+            # than spin on the strategy.
+            if number in fetching:
+                in_flight.release()
+                src.STRATEGY_NUMBERS.inc("engine", "already_dispatched")
+                skipped_in_a_row += 1
+                if skipped_in_a_row >= max_in_flight and tasks:
+                    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    skipped_in_a_row = 0
+                continue
+            skipped_in_a_row = 0
+            fetching.add(number)
+
+            task = asyncio.create_task(fetch_and_handle(number))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        # let in-flight reports finish before returning
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        executor.shutdown(wait=True)
+        IN_FLIGHT.set(0)
+
+    if errors:
+        raise errors[0]
+
+    if failed:
+        logging.warning(f"{failed} reports could not be fetched and were skipped")
+
+    return completed
+
+def run_fetch_engine(generator, handler=None, max_in_flight=8, rate_limit=1.0, fetch=None):
+    """Fetch every number the generator yields with up to `max_in_flight` requests
+    at once and at most `rate_limit` requests per second to the FixMyStreet host
+    (0 or None for no limit). Each response is passed to `handler` as soon as it
+    arrives; by default it is parsed and written to the DB. `fetch` replaces
+    get_report_page for requesting each number. Numbers that fail with
+    TransientFetchError are skipped for the rest of the run, ones with an unexpected HTTP status are
+    added to the dead letters; any other error stops the run."""
+    if handler is None:
+        handler = src.handle_report_page
+    if fetch is None:
+        fetch = src.get_report_page
+
+    # one connection per request in flight, or urllib3 discards the extras
+    src.set_http_pool_size(max_in_flight)
+
+    if rate_limit:
+        pacing = f"{rate_limit} req/s"
+    else:
+        pacing = "paced by the rate controller" if src.get_rate_controller() else "unlimited req/s"
+    logging.info(f"Starting async fetch engine: {max_in_flight} in flight, {pacing}")
+    start = time.monotonic()
+    completed = asyncio.run(_run_engine(generator, handler, max_in_flight, rate_limit, fetch))
+
+    elapsed = time.monotonic() - start
+    logging.info(f"Fetch engine processed {completed} reports in {elapsed:.1f}s ({completed / max(elapsed, 1e-9):.1f}/s)")
+    return completed
@@ -0,0 +1,113 @@
+import atexit
+import hashlib
+import logging
+import re
+import threading
+
+import src
+from .fast_report_contents import SIDE_REPORT_START, UPDATES_START
+from .metrics import Counter
+
+UNCHANGED_PAGES = Counter("fms_unchanged_pages_total", "Re-fetched pages whose fingerprint matched the stored one, so weren't parsed or written")
+
+UPDATES_END = re.compile(rb"</section\s*>", re.I)
+FOOTER_START = re.compile(rb"<footer\b", re.I)
+
+# parts of the page that change between fetches without the report changing.
+# The ones not starting with "<" are only looked for when a substring check
+# finds a candidate, one pattern trying them all at every byte is ~20x slower.
+VOLATILE_TAGS = re.compile(
+    rb"<(?:script\b.*?</script\s*>|style\b.*?</style\s*>|input\b[^>]*\btype=[\"']?hidden\b[^>]*>)", # e.g. CSRF tokens
+    re.S | re.I
+)
+NONCE = re.compile(rb"\snonce=[\"'][^\"']*[\"']", re.I)
+RELATIVE_TIME = re.compile(
+    rb"\b(?:\d+|an?|a few)\s+(?:second|minute|hour|day|week|month|year)s?\s+ago\b|\bjust now\b", re.I
+)
+
+def page_fingerprint(content):
+    """Hash of a report page's #side-report and updates section markup, with
+    volatile fragments (scripts, hidden inputs, nonces, "5 minutes ago")
+    removed and whitespace collapsed, so it only changes when the report
+    does. None if the page has no report markup."""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+
+    starts = [match.start() for match in (SIDE_REPORT_START.search(content), UPDATES_START.search(content)) if match]
+    if not starts:
+        return None
+
+    # from #side-report to the end of the updates section, or the footer if there are no updates
+    start = min(starts)
+    updates = UPDATES_START.search(content, start)
+    end = UPDATES_END.search(content, updates.end()) if updates else FOOTER_START.search(content, start)
+    markup = content[start:end.end() if end else len(content)]
+
+    markup = VOLATILE_TAGS.sub(b"", markup)
+    if b"nonce=" in markup:
+        markup = NONCE.sub(b"", markup)
+    if b"ago" in markup or b"just now" in markup:
+        markup = RELATIVE_TIME.sub(b"", markup)
+
+    # collapse whitespace
+    markup = b" ".join(markup.split())
+    return hashlib.blake2b(markup, digest_size=16).digest()
+
+def SQL_get_fingerprints(numbers: list):
+    # detecting the layout adds the fingerprint column to older DBs
+    src.get_storage_layout()
+    with src.db_cursor(cursor_factory=None) as cursor:
+        cursor.execute("SELECT id, fingerprint FROM logs WHERE id = ANY(%s) AND fingerprint IS NOT NULL;", (numbers, ))
+        return {number: bytes(fingerprint) for number, fingerprint in cursor.fetchall()}
+
+_known = None
+_unchanged = []
+_lock = threading.Lock()
+
+def enable_fingerprints(numbers):
+    """Load the stored fingerprints of `numbers`, IDs about to be fetched
+    again, so is_unchanged can spot pages that haven't changed since."""
+    global _known
+
+    numbers = list(numbers)
+    close_fingerprints()
+    _known = SQL_get_fingerprints(numbers)
+    logging.info(f"Loaded fingerprints for {len(_known)} of {len(numbers)} reports, unchanged pages won't be parsed")
+
+def is_unchanged(number, response_content):
+    """True if a freshly fetched page has the fingerprint stored for its
+    report, so parsing and writing it can be skipped. Only its check time is
+    recorded, on close_fingerprints. Always False unless enable_fingerprints
+    loaded the report's fingerprint."""
+    stored = _known.get(number) if _known else None
+    if stored is None or page_fingerprint(response_content) != stored:
+        return False
+
+    logging.debug("Report %s unchanged since it was last fetched, skipping parse and write", number)
+    UNCHANGED_PAGES.inc()
+    with _lock:
+        _unchanged.append(number)
+    return True
+
+@atexit.register
+def close_fingerprints():
+    """Record the check time of every page is_unchanged skipped. Returns how
+    many there were."""
+    global _known
+
+    with _lock:
+        numbers = _unchanged[:]
+        _unchanged.clear()
+    _known = None
+
+    if numbers:
+        # SQL_mark_checked creates http_cache if this DB has never been refreshed
+        try:
+            src.SQL_mark_checked(numbers)
+        except Exception:
+            # keep them for the call at exit rather than losing the check times
+            with _lock:
+                _unchanged.extend(numbers)
+            raise
+        logging.info(f"{len(numbers)} pages were unchanged since they were last fetched, skipped parsing and writing them")
+    return len(numbers)
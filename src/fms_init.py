@@ -1,8 +1,10 @@
 import src
 
-def fms_init_main():
+def fms_init_main(integrity: bool = True, autofind: bool = True):
     # Do a DB integrity check before continuing
-    src.integrity_check()
+    if integrity:
+        src.integrity_check()
 
     # Do autofind the highest report ID
-    src.autofind_highest_report_id()
\ No newline at end of file
+    if autofind:
+        src.autofind_highest_report_id()
@@ -1,35 +1,299 @@
+import atexit
 import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
 import requests
 
 import src
+from .metrics import Counter, Histogram
+from .structured_logging import log_context
+
+DEFAULT_FMS_BASE_URL = "https://www.fixmystreet.com"
+
+# seconds to wait for the connection, and between bytes of the response
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+# responses that mean "try again later" rather than anything about the report
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# statuses that mean the report itself is missing, hidden or removed
+ERROR_PAGE_STATUS_CODES = (403, 404, 410)
+MAX_RETRIES = 5
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+MAX_RETRY_AFTER = 300
+
+# connections kept open to the host. set_http_pool_size raises it to the
+# number of requests the fetch engine can have in flight.
+HTTP_POOL_SIZE = 16
+
+# pages bigger than this (after decompression) are abandoned and the report
+# added to the dead letters. Bodies of error responses up to DRAIN_BYTES are read and thrown
+# away so the connection can be reused, bigger ones close it instead.
+MAX_BODY_BYTES = 5 * 1024 * 1024
+DRAIN_BYTES = 64 * 1024
+BODY_CHUNK_SIZE = 64 * 1024
+
+REQUEST_SECONDS = Histogram(
+    "fms_request_seconds", "Time to get a response from FixMyStreet, by HTTP status or error", ("status",)
+)
+RESPONSE_BYTES = Counter(
+    "fms_response_bytes_total", "Response body bytes read from FixMyStreet, as sent (compressed) and after decoding",
+    ("form",)
+)
+
+_session = None
+_session_lock = threading.Lock()
+
+class TransientFetchError(Exception):
+    """A report could not be fetched even after retrying. Nothing is written
+    for it, so a later run will pick it up again."""
+
+class UnexpectedStatusError(ValueError):
+    """The site answered with a status code we don't know what to do with."""
+
+    def __init__(self, msg, status_code, body=b""):
+        super().__init__(msg)
+        self.status_code = status_code
+        self.body = body
+
+    def __reduce__(self):
+        return type(self), (str(self), self.status_code, self.body)
+
+class PageTooLargeError(UnexpectedStatusError):
+    """A page is over MAX_BODY_BYTES. Retrying won't make it smaller, so
+    it goes to the dead letters like an unexpected status. The body isn't
+    kept."""
+
+def get_fms_base_url():
+    # overridable so runs can be pointed at a local stub server
+    return (os.environ.get("FMS_BASE_URL") or DEFAULT_FMS_BASE_URL).rstrip("/")
+
+def get_session():
+    """The requests.Session shared by every fetch thread, so connections to
+    the host are kept alive and reused instead of paying a TCP and TLS
+    handshake per report. Accepts gzip, and brotli if Brotli is installed."""
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers["Accept-Encoding"] = requests.utils.DEFAULT_ACCEPT_ENCODING
+
+                # requests rereads proxy settings from the whole environment on
+                # every request. Every request goes to the same host, so read
+                # them once here instead.
+                session.trust_env = False
+                session.proxies.update(requests.utils.get_environ_proxies(get_fms_base_url()))
+                session.verify = os.environ.get("REQUESTS_CA_BUNDLE") or os.environ.get("CURL_CA_BUNDLE") or True
+                logging.debug("Opened HTTP session (%s connections, Accept-Encoding: %s)",
+                              HTTP_POOL_SIZE, session.headers["Accept-Encoding"])
+                _session = session
+
+    return _session
+
+def set_http_pool_size(size: int):
+    """Keep at least `size` connections open to the host, one per request
+    that can be in flight, so urllib3 doesn't throw connections away with
+    "Connection pool is full". Only ever grows the pool, including the
+    pools of adapters already mounted on the session."""
+    global HTTP_POOL_SIZE
+
+    with _session_lock:
+        if size <= HTTP_POOL_SIZE:
+            return
+        HTTP_POOL_SIZE = size
+
+        if _session is not None:
+            for adapter in {id(adapter): adapter for adapter in _session.adapters.values()}.values():
+                adapter.poolmanager.clear()
+                adapter.init_poolmanager(adapter._pool_connections, size, block=adapter._pool_block)
+    logging.debug("HTTP connection pool grown to %s connections", size)
+
+@atexit.register
+def close_session():
+    global _session
+
+    if _session is not None:
+        _session.close()
+        _session = None
+
+def read_body(response, number, limit=None):
+    """Read a streamed response body, decompressed, giving up with a
+    PageTooLargeError once it passes `limit` bytes (MAX_BODY_BYTES by
+    default)."""
+    limit = limit or MAX_BODY_BYTES
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit() and int(length) > limit:
+        response.close()
+        raise PageTooLargeError(f"Page for {number} is {length} bytes, over the {limit} byte limit", response.status_code)
+
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(BODY_CHUNK_SIZE):
+        size += len(chunk)
+        if size > limit:
+            response.close()
+            raise PageTooLargeError(f"Page for {number} is over the {limit} byte limit, abandoned", response.status_code)
+        chunks.append(chunk)
+
+    RESPONSE_BYTES.inc("wire", amount=response.raw.tell())
+    RESPONSE_BYTES.inc("decoded", amount=size)
+    return b"".join(chunks)
+
+def discard_body(response):
+    """Skip the body of a response we only need the status of. A short body
+    is read so the connection goes back to the pool, anything longer (or of
+    unknown length) is cut off by closing the connection."""
+    length = response.headers.get("Content-Length")
+    if response.status_code == 304 or (length and length.isdigit() and int(length) <= DRAIN_BYTES):
+        response.content # read to the end, which hands the connection back
+        RESPONSE_BYTES.inc("wire", amount=response.raw.tell())
+    response.close()
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header, which is either a number of
+    seconds or an HTTP date. None if missing or unreadable."""
+    if not value:
+        return None
+
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+
+    return min(max(seconds, 0), MAX_RETRY_AFTER)
+
+def backoff_delay(attempt):
+    # "full jitter", so threads that failed together don't retry together
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+def request_report(random_number, headers=None):
+    """Request a report page, retrying transient failures. The response is
+    streamed, so its body has not been read yet."""
+    FMS_REPORT_URL = f"{get_fms_base_url()}/report/{random_number}"
+    logging.debug("Constructed URL: %s", FMS_REPORT_URL)
+
+    controller = src.get_rate_controller()
+
+    for attempt in range(MAX_RETRIES + 1):
+        if controller:
+            controller.acquire()
+
+        logging.info("Requesting URL: %s", FMS_REPORT_URL)
+        start = time.monotonic()
+        try:
+            response = get_session().get(
+                FMS_REPORT_URL, headers=headers, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), stream=True
+            )
+        except (requests.Timeout, requests.ConnectionError) as e:
+            REQUEST_SECONDS.observe(time.monotonic() - start, type(e).__name__)
+            problem = f"{type(e).__name__} requesting {random_number}"
+            retry_after = None
+        else:
+            REQUEST_SECONDS.observe(time.monotonic() - start, str(response.status_code))
+            logging.info("Response status: %s", response.status_code)
+            if response.status_code not in RETRY_STATUS_CODES:
+                if controller:
+                    controller.record_success(time.monotonic() - start)
+                return response
+
+            problem = f"Got {response.status_code} for {random_number}"
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            discard_body(response)
+
+        if controller:
+            controller.record_congestion(problem)
+            if retry_after:
+                controller.pause(retry_after)
+
+        if attempt == MAX_RETRIES:
+            break
+
+        delay = max(retry_after or 0, backoff_delay(attempt))
+        logging.warning("%s, retrying in %.1fs (%s/%s)", problem, delay, attempt + 1, MAX_RETRIES)
+        time.sleep(delay)
+
+    msg = f"{problem}, giving up after {MAX_RETRIES} retries"
+    logging.error(msg)
+    raise TransientFetchError(msg)
+
+def get_body(response, number):
+    # only report pages are parsed, known error pages are known from their
+    # status. Unexpected ones are kept for the dead letters.
+    if response.status_code not in ERROR_PAGE_STATUS_CODES:
+        return read_body(response, number)
+
+    discard_body(response)
+    return b""
 
 def get_report_page(random_number):
-    data = {}
-    FMS_REPORT_URL = f"https://www.fixmystreet.com/report/{random_number}"
-    logging.debug(f"Constructed URL: {FMS_REPORT_URL}")
+    with log_context(random_number, "fetch"):
+        start = time.perf_counter()
+        response = request_report(random_number)
+        body = get_body(response, random_number)
+        src.record_stage(random_number, "fetch", time.perf_counter() - start)
+
+        response_content, reason = response_from_status(response.status_code, body)
+        src.archive_page(random_number, response.status_code, body)
+        return response_content, reason
+
+def get_report_page_if_changed(random_number, etag=None, last_modified=None):
+    """Conditional version of get_report_page. Sends the validators from the
+    last fetch and returns ("304", "Not Modified") if the page hasn't changed.
+    Also returns the page's new (etag, last_modified)."""
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    with log_context(random_number, "fetch"):
+        start = time.perf_counter()
+        response = request_report(random_number, headers)
 
-    logging.info(f"Requesting URL: {FMS_REPORT_URL}")
-    response = requests.get(FMS_REPORT_URL)
-    logging.info(f"Response status: {response.status_code}")
+        if response.status_code == 304:
+            logging.info("Response was 304, page unchanged")
+            discard_body(response)
+            return "304", "Not Modified", etag, last_modified
 
-    data["number"] = random_number
+        body = get_body(response, random_number)
+        src.record_stage(random_number, "fetch", time.perf_counter() - start)
+        response_content, reason = response_from_status(response.status_code, body)
+        src.archive_page(random_number, response.status_code, body)
+        return response_content, reason, response.headers.get("ETag"), response.headers.get("Last-Modified")
 
-    if response.status_code == 200:
-        return response.content, ""
+def response_from_status(status_code, content):
+    """Turn an HTTP status and body into the (content, reason) pair the rest
+    of the pipeline expects. Non-200 responses become the status as a string."""
+    if status_code == 200:
+        return content, ""
 
-    elif response.status_code == 404:
+    elif status_code == 404:
         logging.warning("Response was 404")
         return "404", "Not Found"
     
-    elif response.status_code == 403:
+    elif status_code == 403:
         logging.warning("Response was 403")
         return "403", "Forbidden"
 
-    elif response.status_code == 410:
+    elif status_code == 410:
         logging.warning("Response was 410")     
         return "410", "Gone"
 
     else:
-        msg = f"Got unexpected response code: {response.status_code}"
+        msg = f"Got unexpected response code: {status_code}"
         logging.critical(msg)
-        raise ValueError
+        raise UnexpectedStatusError(msg, status_code, content)
@@ -1,14 +1,35 @@
-from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 import logging
+import os
 import re
 
-def get_status(side_report, data):
+from . import fast_report_contents
+
+# compiled once, these run for every report
+FULL_TIMESTAMP = re.compile(r"at (\d{1,2}:\d{2},\s(?:\w+)\s+\d{1,2}\s+\w+\s+\d{4})")
+PARTIAL_TIMESTAMP = re.compile(r"at (\d{1,2}:\d{2}),\s(\w+)")
+CATEGORY = re.compile(r"Reported(?: via \w+)? in the (.*?) category")
+COUNCIL_SENT_TO = re.compile(r"Sent to\s*(.+?)\s+(?:\d+|less than a minute|\w+ minutes|\w+ hours|\w+ days|FixMyStreet)")
+COUNCIL_FROM_META = re.compile(r"by (.+?) at")
+LAT_LON = re.compile(r"lat=([-\d.]+)&lon=([-\d.]+)")
+LON_LAT = re.compile(r"lon=([-\d.]+)&lat=([-\d.]+)")
+METHOD = re.compile(r"Reported via (\w+)")
+UPDATE_FULL_TIMESTAMP = re.compile(r"(\d{1,2}:\d{2}),\s+(\w{3,9})\s+(\d{1,2})\s+(\w+)\s+(\d{4})")
+
+class ReportParseError(ValueError):
+    """A report page isn't shaped the way the parser expects."""
+
+class MissingElementError(ReportParseError):
+    """An element the parser needs isn't on the page."""
+
+class UnexpectedContentError(ReportParseError):
+    """An element is there but its contents can't be understood."""
+
+def get_status(banner_classes, data):
     logging.debug("Getting status...")
-    banner = side_report.find(class_="banner")
 
-    if banner:
-        classes = banner.get("class", [])
+    if banner_classes is not None:
+        classes = banner_classes
         if "banner--unknown" in classes:
             logging.info("Report status is UNKNOWN")
             data["status"] = "Unknown"
@@ -24,7 +45,7 @@ def get_status(side_report, data):
         else:
             msg = f"Unexpected banner status class: {classes}"
             logging.critical(msg)
-            raise ValueError(msg)
+            raise UnexpectedContentError(msg)
     else:
         msg = "No status banner found on the page"
         logging.warning(msg)
@@ -32,13 +53,12 @@ def get_status(side_report, data):
 
     return data
 
-def get_editable(side_report, data):
+def get_editable(has_update_form, data):
     logging.debug("Checking if report is editable...")
 
-    update_form = side_report.find("div", id="update_form")
-    data["editable"] = update_form is not None
+    data["editable"] = has_update_form
 
-    logging.info(f"Editable: {data['editable']}")
+    logging.info("Editable: %s", data['editable'])
     return data
 
 def get_previous_weekday(target_weekday):
@@ -52,7 +72,7 @@ def get_previous_weekday(target_weekday):
     try:
         target_index = weekdays.index(target_weekday)
     except ValueError:
-        raise ValueError(f"Unknown weekday name: {target_weekday}")
+        raise UnexpectedContentError(f"Unknown weekday name: {target_weekday}")
 
     today_index = today.weekday()
     days_difference = (today_index - target_index) % 7
@@ -61,67 +81,66 @@ def get_previous_weekday(target_weekday):
 
     return today - timedelta(days=days_difference)
 
-def get_timestamp(meta_tag, data):
+def get_timestamp(meta_text, data):
     logging.debug("Getting timestamp...")
 
-    text = meta_tag.get_text(strip=True)
+    text = meta_text
 
     # Try full datetime first
-    match = re.search(r"at (\d{1,2}:\d{2},\s(?:\w+)\s+\d{1,2}\s+\w+\s+\d{4})", text)
+    match = FULL_TIMESTAMP.search(text)
     if match:
         time_str = match.group(1)
-        logging.debug(f"Reported timestamp (raw): {time_str}")
+        logging.debug("Reported timestamp (raw): %s", time_str)
         try:
             parsed_time = datetime.strptime(time_str, "%H:%M, %A %d %B %Y")
         except ValueError:
             parsed_time = datetime.strptime(time_str, "%H:%M, %a %d %B %Y")
-        logging.info(f"Parsed timestamp: {parsed_time}")
+        logging.info("Parsed timestamp: %s", parsed_time)
         data["timestamp"] = parsed_time
         return data
 
     # Handle partial timestamp like "at 10:32, Monday"
-    match_partial = re.search(r"at (\d{1,2}:\d{2}),\s(\w+)", text)
+    match_partial = PARTIAL_TIMESTAMP.search(text)
     if match_partial:
         time_part, weekday = match_partial.groups()
-        logging.debug(f"Partial timestamp found: {time_part}, {weekday}")
+        logging.debug("Partial timestamp found: %s, %s", time_part, weekday)
         try:
             date_part = get_previous_weekday(weekday)
             time_obj = datetime.strptime(time_part, "%H:%M").time()
             full_datetime = datetime.combine(date_part.date(), time_obj)
-            logging.info(f"Resolved partial timestamp to: {full_datetime}")
+            logging.info("Resolved partial timestamp to: %s", full_datetime)
             data["timestamp"] = full_datetime
             return data
         except Exception as e:
-            logging.critical(f"Failed to resolve partial timestamp: {e}")
+            logging.critical("Failed to resolve partial timestamp: %s", e)
             data["timestamp"] = None
             return data
 
-    raise ValueError(f"Could not parse timestamp from meta info text: {text}")
+    raise UnexpectedContentError(f"Could not parse timestamp from meta info text: {text}")
 
-def get_category(meta_tag, data):
+def get_category(meta_text, data):
     logging.debug("Getting category...")
 
-    text = meta_tag.get_text(strip=True)
+    text = meta_text
     
     # Allow optional "via ... " part
-    match = re.search(r"Reported(?: via \w+)? in the (.*?) category", text)
+    match = CATEGORY.search(text)
     if not match:
-        logging.warning(f"Category not found in meta info")
-        logging.debug(f"Text: {text}")
+        logging.warning("Category not found in meta info")
+        logging.debug("Text: %s", text)
         data["category"] = "N/a"
         return data
         
     category = match.group(1)
-    logging.info(f"Category: {category}")
+    logging.info("Category: %s", category)
 
     data["category"] = category
     return data
 
-def get_council_sentto(council_tag, data, meta_tag=None):
+def get_council_sentto(council_text, council_link_text, data, meta_text=None):
     logging.debug("Getting the council the report was sent to...")
 
-    text = council_tag.get_text()
-    text = " ".join(text.split())  # Normalize whitespace
+    text = " ".join(council_text.split())  # Normalize whitespace
 
     # Edge case: not reported
     if "Not reported to council" in text:
@@ -133,68 +152,63 @@ def get_council_sentto(council_tag, data, meta_tag=None):
     if "Council ref:" in text and "Sent to" not in text:
         council_ref = text.split("Council ref:")[1].strip()
         council_name = f"Council ref: {council_ref}"
-        logging.info(f"Council ref detected: {council_name}")
+        logging.info("Council ref detected: %s", council_name)
         data["council"] = council_name
         return data
 
     # Edge case: council name in hyperlink
-    a_tag = council_tag.find("a")
-    if a_tag:
-        council_name = a_tag.get_text(strip=True)
-        logging.info(f"Council (via link): {council_name}")
+    if council_link_text is not None:
+        council_name = council_link_text
+        logging.info("Council (via link): %s", council_name)
         data["council"] = council_name
         return data
 
     # Fallback regex if no <a> tag
-    match = re.search(r"Sent to\s*(.+?)\s+(?:\d+|less than a minute|\w+ minutes|\w+ hours|\w+ days|FixMyStreet)", text)
+    match = COUNCIL_SENT_TO.search(text)
     if match:
         council_name = match.group(1).strip()
-        logging.info(f"Council (via regex): {council_name}")
+        logging.info("Council (via regex): %s", council_name)
         data["council"] = council_name
         return data
 
     # new: fallback from meta_tag
-    if meta_tag:
-        meta_text = meta_tag.get_text(strip=True)
-        meta_match = re.search(r"by (.+?) at", meta_text)
+    if meta_text is not None:
+        meta_match = COUNCIL_FROM_META.search(meta_text)
         if meta_match:
             council_name = meta_match.group(1).strip()
-            logging.info(f"Council (via report_meta_info): {council_name}")
+            logging.info("Council (via report_meta_info): %s", council_name)
             data["council"] = council_name
             return data
 
     # Fail if all else fails
     msg = f"Could not extract council name from text: {text}"
     logging.critical(msg)
-    raise ValueError(msg)
+    raise UnexpectedContentError(msg)
 
 
-def get_title(side_report, data):
+def get_title(title_text, data):
     logging.debug("Getting the report title...")
 
-    title_tag = side_report.find("h1")
-    if not title_tag:
+    if title_text is None:
         msg = "Could not find <h1> inside #side-report"
         logging.critical(msg)
-        raise ValueError(msg)
+        raise MissingElementError(msg)
 
-    title = title_tag.get_text(strip=True)
-    logging.info(f"Title: {title}")
+    title = title_text
+    logging.info("Title: %s", title)
 
     data["title"] = title
     return data
 
-def get_description(side_report, data):
+def get_description(paragraphs, data):
     logging.debug("Getting the report description...")
 
-    description_div = side_report.find("div", class_="moderate-display")
-    if not description_div:
+    # paragraphs is None when there's no description div at all
+    if paragraphs is None:
         msg = "No <div class='moderate-display'> found inside #side-report"
         logging.critical(msg)
-        raise ValueError(msg)
+        raise MissingElementError(msg)
 
-    # Get all <p> tags inside it
-    paragraphs = description_div.find_all("p")
     if not paragraphs:
         msg = "No <p> tags found inside <div class='moderate-display'>"
         logging.warning(msg)
@@ -202,167 +216,223 @@ def get_description(side_report, data):
         return data
 
     # Join all paragraphs into one block of text
-    description_text = "\n\n".join(p.get_text(strip=True) for p in paragraphs)
+    description_text = "\n\n".join(paragraphs)
     
-    logging.info(f"Extracted description: {description_text[:20]}...")  # preview first 20 chars
+    logging.info("Extracted description: %s...", description_text[:20])  # preview first 20 chars
     data["description"] = description_text
     return data
 
-def get_lat_lon(side_report, data):
+def get_lat_lon(href, data):
     logging.debug("Extracting latitude and longitude...")
 
-    a_tag = side_report.find("a", class_="problem-back")
-    if not a_tag:
-        raise ValueError("Could not find the 'problem-back' <a> tag in side-report.")
+    if href is None:
+        raise MissingElementError("Could not find the 'problem-back' <a> tag in side-report.")
 
-    href = a_tag.get("href", "")
-    match = re.search(r"lat=([-\d.]+)&lon=([-\d.]+)", href)
+    match = LAT_LON.search(href)
     if not match:
-        match = re.search(r"lon=([-\d.]+)&lat=([-\d.]+)", href)  # sometimes lon might come first
+        match = LON_LAT.search(href)  # sometimes lon might come first
         if not match:
-            raise ValueError(f"Could not extract lat/lon from href: {href}")
+            raise UnexpectedContentError(f"Could not extract lat/lon from href: {href}")
         lon, lat = match.groups()
     else:
         lat, lon = match.groups()
 
     data["lat"] = float(lat)
     data["lon"] = float(lon)
-    logging.info(f"Extracted lat/lon: {data['lat']}, {data['lon']}")
+    logging.info("Extracted lat/lon: %s, %s", data['lat'], data['lon'])
 
     return data
 
-def get_method(meta_tag, data):
+def get_method(meta_text, data):
     logging.debug("Getting report method...")
 
-    text = meta_tag.get_text(strip=True)
+    text = meta_text
 
-    match = re.search(r"Reported via (\w+)", text)
+    match = METHOD.search(text)
     if match:
         method = match.group(1)
-        logging.info(f"Report method: {method}")
+        logging.info("Report method: %s", method)
         data["method"] = method
     else:
-        logging.warning(f"No report method found in meta info")
-        logging.debug(f"Text: {text}")
+        logging.warning("No report method found in meta info")
+        logging.debug("Text: %s", text)
         data["method"] = "N/a"
 
     return data
 
-def get_update_count(updates_tag):
+def get_update_count(update_items):
     logging.debug("Counting update items...")
-    update_items = updates_tag.find_all("li", class_="item-list__item--updates")
     count = len(update_items)
-    logging.info(f"Found {count} update(s).")
+    logging.info("Found %s update(s).", count)
     return count
 
-def get_update_timestamp(updates_tag):
+def get_update_timestamp(update_items):
     logging.debug("Looking for the latest update timestamp...")
 
-    update_items = updates_tag.find_all("li", class_="item-list__item--updates")
-
+    # each item is the list of its <p class="meta-2"> texts
     for item in reversed(update_items):
-        meta_tags = item.find_all("p", class_="meta-2")
-        for tag in reversed(meta_tags):
-            text = tag.get_text(strip=True)
-            logging.debug(f"Checking update meta text: {text}")
+        for text in reversed(item):
+            logging.debug("Checking update meta text: %s", text)
 
             # Try full timestamp first
-            match = re.search(r"(\d{1,2}:\d{2}),\s+(\w{3,9})\s+(\d{1,2})\s+(\w+)\s+(\d{4})", text)
+            match = UPDATE_FULL_TIMESTAMP.search(text)
             if match:
                 time_str = f"{match.group(1)}, {match.group(2)} {match.group(3)} {match.group(4)} {match.group(5)}"
                 try:
                     parsed_time = datetime.strptime(time_str, "%H:%M, %a %d %B %Y")
-                    logging.info(f"Latest update timestamp parsed: {parsed_time}")
+                    logging.info("Latest update timestamp parsed: %s", parsed_time)
                     return parsed_time
                 except ValueError:
                     try:
                         parsed_time = datetime.strptime(time_str, "%H:%M, %A %d %B %Y")
-                        logging.info(f"Latest update timestamp parsed: {parsed_time}")
+                        logging.info("Latest update timestamp parsed: %s", parsed_time)
                         return parsed_time
                     except Exception as e2:
-                        logging.warning(f"Failed to parse timestamp '{time_str}': {e2}")
+                        logging.warning("Failed to parse timestamp '%s': %s", time_str, e2)
                         continue
 
             # Try partial timestamp: e.g. "at 10:32, Monday"
-            match_partial = re.search(r"at (\d{1,2}:\d{2}),\s(\w+)", text)
+            match_partial = PARTIAL_TIMESTAMP.search(text)
             if match_partial:
                 time_part, weekday = match_partial.groups()
-                logging.debug(f"Partial update timestamp found: {time_part}, {weekday}")
+                logging.debug("Partial update timestamp found: %s, %s", time_part, weekday)
                 try:
                     date_part = get_previous_weekday(weekday)
                     time_obj = datetime.strptime(time_part, "%H:%M").time()
                     full_datetime = datetime.combine(date_part.date(), time_obj)
-                    logging.info(f"Resolved update partial timestamp to: {full_datetime}")
+                    logging.info("Resolved update partial timestamp to: %s", full_datetime)
                     return full_datetime
                 except Exception as e:
-                    logging.critical(f"Failed to resolve partial update timestamp: {e}")
+                    logging.critical("Failed to resolve partial update timestamp: %s", e)
                     continue
 
     msg = "No valid update timestamp found in updates."
     logging.critical(msg)
-    raise ValueError(msg)
+    raise UnexpectedContentError(msg)
 
-def get_updates(updates_tag, data):
+def get_updates(update_items, data):
     logging.debug("Getting updates...")
 
-    if not updates_tag:
+    # update_items is None when the page has no updates section
+    if update_items is None:
         logging.warning("No updates_tag provided. Defaulting to 0 updates.")
         data["updates"] = 0
         data["latest_update"] = None
         return data
 
-    count = get_update_count(updates_tag)
+    count = get_update_count(update_items)
     if count is None:
         msg = "Updates count is 'None'"
         logging.critical(msg)
-        raise ValueError(msg)
+        raise UnexpectedContentError(msg)
 
     data["updates"] = count
-    data["latest_update"] = get_update_timestamp(updates_tag)
+    data["latest_update"] = get_update_timestamp(update_items)
 
     return data
 
 
-def process_report_content(content, data):
-    logging.debug("Processing contents...")
+def extract_with_bs4(content):
+    # imported here, bs4 is slow to import and only needed for this backend
+    from bs4 import BeautifulSoup
 
     soup = BeautifulSoup(content, 'html.parser')
 
     side_report = soup.find("div", id="side-report")
     if not side_report:
-        msg = "Could not get dev 'side-report'"
-        logging.critical(msg)
-        return RuntimeError(msg)
+        return None
 
     meta_tag = side_report.find("p", class_="report_meta_info")
-    if not meta_tag:
-        msg = "No <p class='report_meta_info'> found inside #side-report"
+    council_tag = side_report.find("p", class_="council_sent_info")
+    council_link = council_tag.find("a") if council_tag else None
+    updates_tag = soup.find("section", class_="full-width")
+    banner = side_report.find(class_="banner")
+    title_tag = side_report.find("h1")
+    description_div = side_report.find("div", class_="moderate-display")
+    a_tag = side_report.find("a", class_="problem-back")
+
+    page = {
+        "banner_classes": banner.get("class", []) if banner else None,
+        "has_update_form": side_report.find("div", id="update_form") is not None,
+        "meta_text": meta_tag.get_text(strip=True) if meta_tag else None,
+        "council_text": council_tag.get_text() if council_tag else None,
+        "council_link_text": council_link.get_text(strip=True) if council_link else None,
+        "title_text": title_tag.get_text(strip=True) if title_tag else None,
+        "paragraphs": None,
+        "href": a_tag.get("href", "") if a_tag else None,
+        "update_items": None,
+    }
+
+    if description_div:
+        page["paragraphs"] = [p.get_text(strip=True) for p in description_div.find_all("p")]
+
+    if updates_tag:
+        page["update_items"] = [
+            [tag.get_text(strip=True) for tag in item.find_all("p", class_="meta-2")]
+            for item in updates_tag.find_all("li", class_="item-list__item--updates")
+        ]
+
+    return page
+
+def get_parser_backend():
+    backend = os.environ.get("PARSER_BACKEND") or "lxml"
+
+    if backend == "lxml" and not fast_report_contents.LXML_AVAILABLE:
+        logging.warning("lxml is not installed, falling back to the bs4 parser backend")
+        os.environ["PARSER_BACKEND"] = backend = "bs4"
+
+    return backend
+
+def extract_page(content):
+    """Pull the raw fields the getters need out of the page with the selected
+    backend. Returns None if there's no #side-report."""
+    backend = get_parser_backend()
+
+    if backend == "lxml":
+        return fast_report_contents.extract_with_lxml(content)
+    elif backend == "bs4":
+        return extract_with_bs4(content)
+    else:
+        msg = f"Unknown parser backend: {backend}"
         logging.critical(msg)
         raise ValueError(msg)
+
+def process_report_content(content, data):
+    logging.debug("Processing contents...")
+
+    page = extract_page(content)
+
+    if page is None:
+        msg = "Could not get div 'side-report'"
+        logging.critical(msg)
+        raise MissingElementError(msg)
+
+    if page["meta_text"] is None:
+        msg = "No <p class='report_meta_info'> found inside #side-report"
+        logging.critical(msg)
+        raise MissingElementError(msg)
     
-    council_tag = side_report.find("p", class_="council_sent_info")
-    if not council_tag:
+    if page["council_text"] is None:
         msg = "No <p class='council_sent_info'> found inside #side-report"
         logging.critical(msg)
-        raise ValueError(msg)
+        raise MissingElementError(msg)
     
-    updates_tag = soup.find("section", class_="full-width")
-    if not updates_tag:
+    if page["update_items"] is None:
         msg = "No <section class='full-width'> (updates section) found"
         logging.warning(msg)
         data["updates"] = 0
         data["latest_update"] = None
    
-    data = get_status(side_report, data)
-    data = get_editable(side_report, data)
-    data = get_timestamp(meta_tag, data)
-    data = get_category(meta_tag, data)
-    data = get_council_sentto(council_tag, data, meta_tag)
-    data = get_title(side_report, data)
-    data = get_description(side_report, data)
-    data = get_lat_lon(side_report, data)
-    data = get_method(meta_tag, data)
-    data = get_updates(updates_tag, data)
-
-    logging.debug(f"Returning data: {data}")
+    data = get_status(page["banner_classes"], data)
+    data = get_editable(page["has_update_form"], data)
+    data = get_timestamp(page["meta_text"], data)
+    data = get_category(page["meta_text"], data)
+    data = get_council_sentto(page["council_text"], page["council_link_text"], data, page["meta_text"])
+    data = get_title(page["title_text"], data)
+    data = get_description(page["paragraphs"], data)
+    data = get_lat_lon(page["href"], data)
+    data = get_method(page["meta_text"], data)
+    data = get_updates(page["update_items"], data)
+
+    logging.debug("Returning data: %s", data)
     return data
@@ -0,0 +1,62 @@
+import logging
+import time
+
+import src
+from .metrics import FAST_BUCKETS, Histogram
+from .structured_logging import log_context
+
+PARSE_SECONDS = Histogram("fms_parse_seconds", "Time to turn a fetched page into a report", buckets=FAST_BUCKETS)
+
+# what handle_report_page did with a page
+WRITTEN = "written"
+UNCHANGED = "unchanged"
+DEAD_LETTERED = "dead_lettered"
+
+def build_report(number, response_content, reason):
+    """Turn a fetched page into the report dict SQL_insert_into_db expects,
+    or a tombstone for an ID that is missing, hidden or removed."""
+    with log_context(number, "parse"):
+        data = {"number": number}
+
+        # Escape if response was anything but 200
+        if response_content in ("404", "403", "410"):
+            msg = f"Response code was {response_content}. Recording a tombstone, nothing more to process. Moving on..."
+            logging.warning(msg)
+            # stored as one tombstones row, see src/tombstones.py
+            return {"number": number, "tombstone": int(response_content)}
+
+        # Process the page
+        data = src.process_report_content(response_content, data)
+        data["fingerprint"] = src.page_fingerprint(response_content)
+        return data
+
+def build_report_timed(number, response_content, reason):
+    """build_report, also returning how long it took. Used by the parser
+    processes, whose own metrics never reach the main process."""
+    start = time.perf_counter()
+    data = build_report(number, response_content, reason)
+    return data, time.perf_counter() - start
+
+def handle_report_page(number, response_content, reason):
+    """Parse a fetched page and write it. Returns WRITTEN, or UNCHANGED if
+    its fingerprint says it was skipped, or DEAD_LETTERED if it failed to
+    parse."""
+    if src.is_unchanged(number, response_content):
+        src.discard_report(number)
+        return UNCHANGED
+
+    try:
+        data, elapsed = build_report_timed(number, response_content, reason)
+    except Exception as e:
+        # one odd page shouldn't stop the run
+        src.add_dead_letter(number, "parse", e, response_content)
+        return DEAD_LETTERED
+
+    PARSE_SECONDS.observe(elapsed)
+    src.record_stage(number, "parse", elapsed, response_content)
+
+    start = time.perf_counter()
+    src.SQL_insert_into_db(data)
+    src.record_stage(number, "write", time.perf_counter() - start)
+    src.finish_report(number)
+    return WRITTEN
@@ -0,0 +1,156 @@
+import atexit
+import logging
+import struct
+import threading
+import time
+from pathlib import Path
+
+import zstandard # type: ignore
+
+import src
+
+# index record: report id, HTTP status, offset into the segment, compressed length
+INDEX_RECORD = struct.Struct("<IHQI")
+
+# start a new segment once the current one is bigger than this
+SEGMENT_MAX_BYTES = 256 * 1024 * 1024
+
+def load_dictionary(dictionary_path):
+    if not dictionary_path.exists():
+        return None
+    return zstandard.ZstdCompressionDict(dictionary_path.read_bytes(), dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+class HTMLArchive:
+    """Append-only archive of fetched pages. Each body is its own zstd frame in
+    a segment-NNNNNN.zst file, with a fixed-size record per page appended to
+    the matching .idx file once the frame is on disk.
+
+    Pages share most of their markup, so the first page written to a segment
+    is saved as segment-NNNNNN.dict and used as a zstd dictionary for every
+    frame in it. That keeps frames independently readable while compressing
+    far better than each page on its own."""
+
+    def __init__(self, directory, level=3):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.level = level
+        self.lock = threading.Lock()
+
+        # carry on appending to the newest segment
+        segments = sorted(self.directory.glob("segment-*.zst"))
+        self.segment_number = int(segments[-1].stem.split("-")[1]) if segments else 1
+        self._open_segment()
+
+    def _open_segment(self):
+        name = f"segment-{self.segment_number:06d}"
+        self.dictionary_path = self.directory / f"{name}.dict"
+        self.data_file = open(self.directory / f"{name}.zst", "ab")
+        self.index_file = open(self.directory / f"{name}.idx", "ab")
+        self._set_dictionary(load_dictionary(self.dictionary_path))
+
+    def _set_dictionary(self, dictionary):
+        self.dictionary = dictionary
+        self.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+
+    def add(self, number: int, status: int, body: bytes):
+        with self.lock:
+            if self.data_file.tell() > SEGMENT_MAX_BYTES:
+                self.close()
+                self.segment_number += 1
+                self._open_segment()
+
+            # the first real page of a segment becomes its dictionary
+            if self.dictionary is None and status == 200 and body:
+                self.dictionary_path.write_bytes(body)
+                self._set_dictionary(load_dictionary(self.dictionary_path))
+
+            frame = self.compressor.compress(body or b"")
+
+            offset = self.data_file.tell()
+            self.data_file.write(frame)
+            self.data_file.flush()
+
+            # index last, so a crash never leaves an index entry pointing at half a frame
+            self.index_file.write(INDEX_RECORD.pack(number, status, offset, len(frame)))
+            self.index_file.flush()
+
+    def close(self):
+        self.data_file.close()
+        self.index_file.close()
+
+def iter_index(index_path):
+    with open(index_path, "rb") as index_file:
+        while True:
+            record = index_file.read(INDEX_RECORD.size)
+            if len(record) < INDEX_RECORD.size:
+                return # ignore a partly written last record
+            yield INDEX_RECORD.unpack(record)
+
+def get_decompressor(index_path):
+    return zstandard.ZstdDecompressor(dict_data=load_dictionary(index_path.with_suffix(".dict")))
+
+def iter_archive(directory):
+    """Yield (number, status, body) for every archived page, oldest first."""
+    for index_path in sorted(Path(directory).glob("segment-*.idx")):
+        logging.info(f"Reading archive segment {index_path.stem}...")
+        decompressor = get_decompressor(index_path)
+        with open(index_path.with_suffix(".zst"), "rb") as data_file:
+            for number, status, offset, length in iter_index(index_path):
+                data_file.seek(offset)
+                yield number, status, decompressor.decompress(data_file.read(length))
+
+def load_archive_index(directory):
+    """Return {number: (index path, status, offset, length)} for the newest
+    copy of every archived page."""
+    index = {}
+    for index_path in sorted(Path(directory).glob("segment-*.idx")):
+        for number, status, offset, length in iter_index(index_path):
+            index[number] = (index_path, status, offset, length)
+    return index
+
+def read_archived_page(entry):
+    index_path, status, offset, length = entry
+    with open(index_path.with_suffix(".zst"), "rb") as data_file:
+        data_file.seek(offset)
+        return status, get_decompressor(index_path).decompress(data_file.read(length))
+
+_archive = None
+
+def enable_archive(directory):
+    global _archive
+
+    logging.info(f"Archiving fetched pages to {directory}")
+    close_archive()
+    _archive = HTMLArchive(directory)
+    return _archive
+
+def archive_page(number: int, status: int, body: bytes):
+    if _archive is not None:
+        _archive.add(number, status, body)
+
+@atexit.register
+def close_archive():
+    global _archive
+
+    if _archive is not None:
+        archive, _archive = _archive, None
+        archive.close()
+
+def reparse_archive(directory, handler=None):
+    """Push every archived page back through parsing and into the DB, without
+    touching the network. Later copies of a page overwrite earlier ones."""
+    if handler is None:
+        handler = src.handle_report_page
+
+    logging.info(f"Reparsing archived pages from {directory}...")
+    start = time.monotonic()
+    count = 0
+
+    for number, status, body in iter_archive(directory):
+        response_content, reason = src.response_from_status(status, body)
+        handler(number, response_content, reason)
+        count += 1
+
+    elapsed = time.monotonic() - start
+    logging.info(f"Reparsed {count} archived pages in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f}/s)")
+    return count
@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+
+import src
+from .db_pool import db_cursor
+
+class IDBitmap:
+    """Set of positive report IDs stored as one bit per ID."""
+
+    def __init__(self, size=0):
+        self.bits = bytearray((size >> 3) + 1)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def add(self, number: int):
+        byte, bit = number >> 3, 1 << (number & 7)
+
+        with self.lock:
+            if byte >= len(self.bits):
+                # grow to at least double so repeated adds stay cheap
+                self.bits.extend(bytes(max(byte + 1, len(self.bits) * 2) - len(self.bits)))
+
+            if not self.bits[byte] & bit:
+                self.bits[byte] |= bit
+                self.count += 1
+
+    def add_many(self, numbers):
+        numbers = list(numbers)
+        if not numbers:
+            return
+
+        with self.lock:
+            needed = (max(numbers) >> 3) + 1
+            if needed > len(self.bits):
+                self.bits.extend(bytes(max(needed, len(self.bits) * 2) - len(self.bits)))
+
+            bits = self.bits
+            for number in numbers:
+                bits[number >> 3] |= 1 << (number & 7)
+
+            # recounting in C is cheaper than checking every bit before setting it
+            self.count = int.from_bytes(bits, "little").bit_count()
+
+    def __contains__(self, number: int):
+        byte = number >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (number & 7)))
+
+    def __len__(self):
+        return self.count
+
+    def count_range(self, start: int, stop: int):
+        """How many IDs in start..stop (inclusive) are in the set."""
+        if stop < start:
+            return 0
+
+        with self.lock:
+            first, last = start >> 3, min(stop >> 3, len(self.bits) - 1)
+            if first > last:
+                return 0
+            chunk = int.from_bytes(self.bits[first:last + 1], "little")
+
+        # drop the bits below start and above stop
+        chunk = (chunk >> (start & 7)) & ((1 << (stop - start + 1)) - 1)
+        return chunk.bit_count()
+
+    def missing(self, start: int, stop: int):
+        """Yield every ID in start..stop (inclusive) that is not in the set,
+        checked lazily so IDs added while iterating are skipped too."""
+        number = start
+        while number <= stop:
+            byte = number >> 3
+
+            # skip over whole bytes of IDs we already have
+            if byte < len(self.bits) and self.bits[byte] == 0xFF and number & 7 == 0:
+                number += 8
+                continue
+
+            if number not in self:
+                yield number
+            number += 1
+
+def SQL_load_scraped_ids(itersize=100_000):
+    logging.info("Loading already scraped IDs from DB...")
+    start = time.monotonic()
+    bitmap = IDBitmap()
+    src.SQL_create_tombstones_table()
+
+    # stream through a server-side cursor so millions of IDs never sit in memory at once
+    with db_cursor(name="scraped_ids", cursor_factory=None) as cursor:
+        cursor.itersize = itersize
+        cursor.execute("SELECT id FROM status UNION ALL SELECT id FROM tombstones;")
+
+        while True:
+            rows = cursor.fetchmany(itersize)
+            if not rows:
+                break
+            bitmap.add_many(number for (number,) in rows)
+
+    # dead letters wait for retry_dead_letters rather than being fetched again
+    bitmap.add_many(src.SQL_get_dead_letter_ids())
+
+    logging.info(f"Loaded {len(bitmap)} scraped IDs in {time.monotonic() - start:.2f}s")
+    return bitmap
+
+_scraped_ids = None
+
+def load_scraped_ids():
+    global _scraped_ids
+    _scraped_ids = SQL_load_scraped_ids()
+    return _scraped_ids
+
+def get_scraped_ids():
+    # loaded on first use if main didn't load it already
+    if _scraped_ids is None:
+        return load_scraped_ids()
+    return _scraped_ids
+
+def mark_scraped(numbers):
+    # only track once loaded, the initial load will pick these up from the DB otherwise
+    if _scraped_ids is not None:
+        for number in numbers:
+            _scraped_ids.add(number)
@@ -0,0 +1,149 @@
+import atexit
+import bisect
+import logging
+import threading
+
+# every metric registers itself here when created
+REGISTRY = []
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            lines.extend(self._render_value(labels, value))
+        return lines
+
+    def _render_value(self, labels, value):
+        return [f"{self.name}{format_labels(self.label_names, labels)} {value}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    """A value that goes up and down. set_function() makes it read the value
+    from a callable whenever the metrics are rendered."""
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+    def set_function(self, function, *labels):
+        self.set(function, *labels)
+
+    def remove(self, *labels):
+        with self.lock:
+            self.values.pop(labels, None)
+
+    def _render_value(self, labels, value):
+        return super()._render_value(labels, value() if callable(value) else value)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                # one count per bucket plus +Inf, then the sum
+                counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def _render_value(self, labels, counts):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += count
+            le = f'le="{bound}"'
+            lines.append(f"{self.name}_bucket{format_labels(self.label_names, labels, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {counts[-1]}")
+        lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+_metrics_server = None
+_metrics_file = None
+
+def start_metrics_server(port: int, host: str = "127.0.0.1"):
+    """Serve /metrics from a background thread."""
+    global _metrics_server
+
+    # http.server is only imported when metrics are actually served
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+
+            body = render_metrics().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            return
+
+    if _metrics_server is None:
+        try:
+            _metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            # e.g. another node on this host already has the port, don't stop the run over it
+            logging.warning(f"Could not serve metrics on port {port}: {e}")
+            return None
+        _metrics_server.daemon_threads = True
+        threading.Thread(target=_metrics_server.serve_forever, name="metrics", daemon=True).start()
+        logging.info(f"Serving metrics on http://{host}:{_metrics_server.server_address[1]}/metrics")
+    return _metrics_server
+
+def enable_metrics_dump(path):
+    """Write the metrics to `path` when the program exits."""
+    global _metrics_file
+    _metrics_file = path
+
+@atexit.register
+def dump_metrics():
+    if _metrics_file:
+        with open(_metrics_file, "w") as file:
+            file.write(render_metrics())
+        logging.info(f"Wrote metrics to {_metrics_file}")
@@ -0,0 +1,49 @@
+import hashlib
+
+MASK_64 = (1 << 64) - 1
+
+class FeistelPermutation:
+    """Keyed bijection on 0..size-1. A balanced Feistel network shuffles the
+    smallest even-bit power of two covering `size`, and values that land
+    outside the domain are walked through the cipher again until they fall
+    inside it. Uses constant memory whatever the size."""
+
+    def __init__(self, size: int, seed: int, rounds: int = 6):
+        self.size = size
+
+        bits = max(2, (size - 1).bit_length())
+        bits += bits % 2
+        self.half_bits = bits // 2
+        self.half_mask = (1 << self.half_bits) - 1
+
+        # derive one 64-bit key per round from the seed
+        self.keys = [
+            int.from_bytes(hashlib.blake2b(f"{seed}:{size}:{i}".encode(), digest_size=8).digest(), "little")
+            for i in range(rounds)
+        ]
+
+    def _round(self, value: int, key: int):
+        # multiply-xorshift mix, the top bits are the best mixed so use those
+        value = ((value ^ key) * 0x9E3779B97F4A7C15) & MASK_64
+        value ^= value >> 32
+        value = (value * 0xBF58476D1CE4E5B9) & MASK_64
+        return value >> (64 - self.half_bits)
+
+    def _encrypt(self, value: int):
+        left, right = value >> self.half_bits, value & self.half_mask
+        for key in self.keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self.half_bits) | right
+
+    def __getitem__(self, index: int):
+        if not 0 <= index < self.size:
+            raise IndexError(f"Index {index} out of range for permutation of size {self.size}")
+
+        # cycle-walk, the domain is at most 4x size so this takes a few steps on average
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    def __len__(self):
+        return self.size
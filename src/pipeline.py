@@ -0,0 +1,208 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import src
+from .metrics import Gauge
+
+QUEUE_DEPTH = Gauge("fms_pipeline_queue_depth", "Items waiting between pipeline stages", ("queue",))
+
+# how often each stage's throughput is logged
+STATS_INTERVAL = 10
+
+def _init_parse_worker(logging_config, profiler_config):
+    # spawned workers start with a blank logging config
+    src.setup_logging(**logging_config)
+    if profiler_config:
+        src.enable_worker_profiler(**profiler_config)
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, n=1):
+        with self.lock:
+            self.count += n
+
+    def rate(self):
+        return self.count / max(time.monotonic() - self.start, 1e-9)
+
+    def __str__(self):
+        return f"{self.name} {self.count} ({self.rate():.1f}/s)"
+
+class ReportPipeline:
+    """fetch -> parse -> write pipeline. Pages handed to submit() go through a
+    bounded queue to a pool of parser processes, and the parsed reports go
+    through a second bounded queue to a single writer thread. A full queue
+    blocks the stage feeding it, so a slow stage throttles the ones before it."""
+
+    def __init__(self, parse_workers=None, queue_depth=100, write=None):
+        self.queue_depth = queue_depth
+        self.write = write or src.SQL_insert_into_db
+        self.parse_queue = queue.Queue(maxsize=queue_depth)
+        self.write_queue = queue.Queue(maxsize=queue_depth)
+        self.error = None
+
+        # spawn rather than fork, the parent has threads and open DB connections
+        self.executor = ProcessPoolExecutor(
+            max_workers=parse_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_parse_worker,
+            initargs=(src.get_logging_config(), src.get_profiler_config())
+        )
+
+        self.stats = [StageStats("fetched"), StageStats("parsed"), StageStats("written")]
+        self.fetched, self.parsed, self.written = self.stats
+
+        QUEUE_DEPTH.set_function(self.parse_queue.qsize, "parse")
+        QUEUE_DEPTH.set_function(self.write_queue.qsize, "write")
+
+        self.stopped = threading.Event()
+        self.threads = [
+            threading.Thread(target=self._dispatch, name="pipeline-parse", daemon=True),
+            threading.Thread(target=self._write, name="pipeline-write", daemon=True),
+            threading.Thread(target=self._report, name="pipeline-stats", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, number, response_content, reason):
+        """Fetch stage handler, blocks while the parse queue is full. Raises
+        the error that stopped the pipeline, if one did."""
+        self._raise_error()
+        self.fetched.add()
+        if src.is_unchanged(number, response_content):
+            src.discard_report(number)
+            return
+        self._put((number, response_content, reason, time.perf_counter()))
+
+    def close(self):
+        self._put(None, raise_error=False)
+        self.threads[0].join()
+        self.threads[1].join()
+        self.stopped.set()
+
+        # a worker started while the pool was breaking is never stopped, and
+        # shutdown waits on it forever (fixed in Python 3.12)
+        if isinstance(self.error, BrokenProcessPool):
+            for process in list((self.executor._processes or {}).values()):
+                process.terminate()
+        self.executor.shutdown()
+
+        logging.info(f"Pipeline finished: {self.summary()}")
+        self._raise_error()
+
+    def _put(self, item, raise_error=True):
+        # wait in short steps, so a failure while we wait is seen
+        while True:
+            if raise_error:
+                self._raise_error()
+            try:
+                self.parse_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if not self.threads[0].is_alive():
+                    return
+
+    def summary(self):
+        return ", ".join(str(stats) for stats in self.stats)
+
+    def _fail(self, error):
+        logging.critical(f"Pipeline stage failed: {error!r}")
+        if self.error is None:
+            self.error = error
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def _dispatch(self):
+        # future -> (number, page, when it was queued), the page kept so
+        # failed pages can be dead-lettered
+        pending = {}
+        reading = True
+
+        try:
+            while reading or pending:
+                # keep up to queue_depth pages in the parser pool
+                while reading and len(pending) < self.queue_depth:
+                    try:
+                        item = self.parse_queue.get(timeout=0.05 if pending else None)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        reading = False
+                        break
+
+                    # keep draining after a failure so submit and close never block on us
+                    if self.error is not None:
+                        continue
+
+                    number, response_content, reason, queued = item
+                    try:
+                        future = self.executor.submit(src.build_report_timed, number, response_content, reason)
+                    except Exception as e:
+                        # BrokenProcessPool once a worker has died
+                        self._fail(e)
+                        continue
+                    pending[future] = (number, response_content, queued)
+
+                if not pending:
+                    continue
+
+                done, _ = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+                for future in done:
+                    number, response_content, queued = pending.pop(future)
+                    try:
+                        data, elapsed = future.result()
+                    except BrokenProcessPool as e:
+                        self._fail(e)
+                        continue
+                    except Exception as e:
+                        src.add_dead_letter(number, "parse", e, response_content)
+                        continue
+                    src.PARSE_SECONDS.observe(elapsed)
+                    # waiting for and in the parser pool, besides parsing itself
+                    src.record_stage(number, "parse_queue", time.perf_counter() - queued - elapsed)
+                    src.record_stage(number, "parse", elapsed, response_content)
+                    self.parsed.add()
+                    self.write_queue.put(data)
+        except Exception as e:
+            self._fail(e)
+            while reading:
+                reading = self.parse_queue.get() is not None
+        finally:
+            self.write_queue.put(None)
+
+    def _write(self):
+        while True:
+            data = self.write_queue.get()
+            if data is None:
+                return
+
+            # keep draining after a failure so the parse stage never blocks on us
+            if self.error is not None:
+                continue
+
+            try:
+                start = time.perf_counter()
+                self.write(data)
+                src.record_stage(data["number"], "write", time.perf_counter() - start)
+                src.finish_report(data["number"])
+                self.written.add()
+            except Exception as e:
+                self._fail(e)
+
+    def _report(self):
+        while not self.stopped.wait(STATS_INTERVAL):
+            logging.info(
+                f"Pipeline: {self.summary()}, "
+                f"queues: parse {self.parse_queue.qsize()}/{self.queue_depth}, write {self.write_queue.qsize()}/{self.queue_depth}"
+            )
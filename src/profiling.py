@@ -0,0 +1,289 @@
+import atexit
+import collections
+import heapq
+import json
+import logging
+import os
+import re
+import sys
+import sysconfig
+import threading
+import time
+from pathlib import Path
+
+# thread pools name their threads fetch_0, fetch_1, ..., which are folded
+# together (as are Thread-1, Thread-2, ...) so the flamegraph has one tower
+# per kind of thread
+THREAD_NUMBER = re.compile(r"[-_]\d+(?= \(|$)")
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler. A background thread looks at every other
+    thread's stack each `interval` seconds and counts how often each stack is
+    seen, so a function's share of the samples is its share of the time,
+    waiting included (e.g. fetch threads blocked on the network). Costs one
+    stack walk per thread per sample, nothing on the profiled threads."""
+
+    def __init__(self, interval=0.005, process="main"):
+        self.interval = interval
+        self.process = process
+        self.stacks = collections.Counter()
+        self.labels = {}
+        self.thread_names = {}
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self.start_time = time.monotonic()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.elapsed = time.monotonic() - self.start_time
+
+    def _label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = f"{code.co_qualname} ({short_path(code.co_filename)}:{code.co_firstlineno})"
+            self.labels[code] = label
+        return label
+
+    def _thread_name(self, ident):
+        name = self.thread_names.get(ident)
+        if name is None:
+            self.thread_names = {
+                thread.ident: THREAD_NUMBER.sub("", thread.name) for thread in threading.enumerate()
+            }
+            name = self.thread_names.get(ident, "unknown")
+        return name
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(self._thread_name(ident))
+                stack.append(self.process)
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+STDLIB = sysconfig.get_paths()["stdlib"] + os.sep
+
+def short_path(filename):
+    # .../site-packages/bs4/element.py -> bs4/element.py, .../lib/python3.11/queue.py
+    # -> queue.py, and the repo's own files relative to it
+    parts = Path(filename).parts
+    for marker in ("site-packages", "dist-packages"):
+        if marker in parts:
+            return "/".join(parts[parts.index(marker) + 1:])
+    if filename.startswith(STDLIB):
+        return filename[len(STDLIB):]
+    if filename.startswith(os.getcwd() + os.sep):
+        return os.path.relpath(filename)
+    return filename
+
+def write_collapsed(stacks, path):
+    """One "frame;frame;frame count" line per stack, the input flamegraph.pl,
+    inferno and speedscope all take."""
+    with open(path, "w") as file:
+        for stack, count in sorted(stacks.items()):
+            file.write(f"{';'.join(stack)} {count}\n")
+
+def read_collapsed(path):
+    stacks = collections.Counter()
+    with open(path) as file:
+        for line in file:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack:
+                stacks[tuple(stack.split(";"))] += int(count)
+    return stacks
+
+def write_speedscope(stacks, path, interval):
+    """speedscope's own JSON format, with one profile per process and thread,
+    weighted in milliseconds."""
+    frames = {}
+    profiles = collections.defaultdict(lambda: {"samples": [], "weights": []})
+    for stack, count in sorted(stacks.items()):
+        process, thread, *calls = stack
+        profile = profiles[f"{process} {thread}"]
+        profile["samples"].append([frames.setdefault(call, len(frames)) for call in calls])
+        profile["weights"].append(count * interval * 1000)
+
+    document = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": [{"name": name} for name in frames]},
+        "profiles": [
+            {
+                "type": "sampled", "name": name, "unit": "milliseconds",
+                "startValue": 0, "endValue": sum(profile["weights"]), **profile
+            }
+            for name, profile in profiles.items()
+        ],
+        "name": Path(path).name,
+        "exporter": "fms-scraper",
+    }
+    with open(path, "w") as file:
+        json.dump(document, file)
+
+class SlowReports:
+    """Keeps the `keep` reports that took longest from fetch to write, with
+    how long each stage took and the fetched page. Stages of a report in
+    flight are added up as they are recorded and finish() ranks it.
+    discard() drops a report that will never be written."""
+
+    def __init__(self, keep):
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.slowest = [] # min-heap of (total, sequence, number, stages, page)
+        self.finished = 0
+
+    def record(self, number, stage, seconds, page=None):
+        with self.lock:
+            stages, stored_page = self.in_flight.get(number, ({}, None))
+            stages[stage] = stages.get(stage, 0) + seconds
+            self.in_flight[number] = (stages, stored_page if page is None else page)
+
+    def finish(self, number):
+        with self.lock:
+            stages, page = self.in_flight.pop(number, ({}, None))
+            # the sequence number breaks ties, so stages and pages are never compared
+            self.finished += 1
+            entry = (sum(stages.values()), self.finished, number, stages, page)
+            if len(self.slowest) < self.keep:
+                heapq.heappush(self.slowest, entry)
+            elif entry[0] > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def discard(self, number):
+        with self.lock:
+            self.in_flight.pop(number, None)
+
+    def save(self, directory):
+        """Write each kept page to `directory`/<number>.html, and their stage
+        timings, slowest first, to `directory`/slow_reports.json."""
+        with self.lock:
+            slowest = sorted(self.slowest, reverse=True)
+
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        summary_path = directory / "slow_reports.json"
+
+        # drop the pages an earlier run saved here, so the directory only
+        # holds this run's
+        if summary_path.exists():
+            with open(summary_path) as file:
+                for entry in json.load(file):
+                    if "page" in entry:
+                        (directory / entry["page"]).unlink(missing_ok=True)
+
+        summary = []
+        for total, _, number, stages, page in slowest:
+            entry = {"number": number, "total_seconds": round(total, 6),
+                     "stages": {stage: round(seconds, 6) for stage, seconds in stages.items()}}
+            # tombstones only have their status code, e.g. "404", no page
+            if isinstance(page, bytes):
+                page_path = directory / f"{number}.html"
+                page_path.write_bytes(page)
+                entry["page"] = page_path.name
+            summary.append(entry)
+
+        with open(summary_path, "w") as file:
+            json.dump(summary, file, indent=2)
+        return len(summary)
+
+_profiler = None
+_profile_path = None
+_part_path = None
+_slow_reports = None
+_slow_reports_dir = None
+
+def enable_profiler(path, interval_ms=5, slow_reports=0, slow_reports_dir=None):
+    """Sample every thread from here on and write the stacks to `path` on
+    close_profiler, as speedscope JSON if it ends in .json and collapsed
+    stacks otherwise. Parse pool workers started after this sample
+    themselves too, see get_profiler_config. With `slow_reports` also keep
+    that many of the slowest reports in `slow_reports_dir`."""
+    global _profiler, _profile_path, _slow_reports, _slow_reports_dir
+
+    close_profiler()
+    _profile_path = str(path)
+    _profiler = SamplingProfiler(interval_ms / 1000).start()
+    if slow_reports:
+        _slow_reports = SlowReports(slow_reports)
+        # profile.speedscope.json -> profile_slow_reports/
+        _slow_reports_dir = slow_reports_dir or Path(path).with_name(f"{Path(path).name.split('.')[0]}_slow_reports")
+    logging.info(f"Profiling every {interval_ms}ms to {path}")
+
+def get_profiler_config():
+    """What a parse pool worker needs to profile itself, None when not
+    profiling. The pool passes it to its workers' initializer."""
+    if _profiler is None:
+        return None
+    return {"path": _profile_path, "interval_ms": _profiler.interval * 1000}
+
+def enable_worker_profiler(path, interval_ms):
+    """Profile this worker process into a part file next to `path`, which
+    close_profiler in the main process merges in."""
+    global _profiler, _part_path
+
+    _part_path = f"{path}.{os.getpid()}.part"
+    _profiler = SamplingProfiler(interval_ms / 1000, process="parse-worker").start()
+
+def record_stage(number, stage, seconds, page=None):
+    """Add `seconds` to a report's time in `stage`, for the slow report
+    capture. Pass the fetched page with one of its stages to keep it."""
+    if _slow_reports is not None:
+        _slow_reports.record(number, stage, seconds, page)
+
+def finish_report(number):
+    """A report has been written, rank it by its total time across stages."""
+    if _slow_reports is not None:
+        _slow_reports.finish(number)
+
+def discard_report(number):
+    """A report won't be written, e.g. it was unchanged or dead-lettered, so
+    forget its stages."""
+    if _slow_reports is not None:
+        _slow_reports.discard(number)
+
+@atexit.register
+def close_profiler():
+    """Stop sampling and write the profile, merged with the parse workers'
+    ones, and the slowest reports."""
+    global _profiler, _slow_reports
+
+    if _profiler is None:
+        return
+    profiler, _profiler = _profiler, None
+    profiler.stop()
+
+    if _part_path is not None:
+        write_collapsed(profiler.stacks, _part_path)
+        return
+
+    # workers have written theirs by now, the pool shuts down before this
+    stacks = profiler.stacks
+    for part in Path(_profile_path).parent.glob(f"{Path(_profile_path).name}.*.part"):
+        stacks.update(read_collapsed(part))
+        part.unlink()
+
+    if _profile_path.endswith(".json"):
+        write_speedscope(stacks, _profile_path, profiler.interval)
+    else:
+        write_collapsed(stacks, _profile_path)
+    logging.info(f"Wrote {profiler.samples} samples over {profiler.elapsed:.1f}s to {_profile_path}")
+
+    if _slow_reports is not None:
+        slow_reports, _slow_reports = _slow_reports, None
+        saved = slow_reports.save(_slow_reports_dir)
+        logging.info(f"Saved the {saved} slowest reports to {_slow_reports_dir}")
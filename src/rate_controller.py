@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+
+from .metrics import Gauge
+
+REQUEST_RATE = Gauge("fms_request_rate", "Requests per second the rate controller currently allows")
+
+class AdaptiveRateController:
+    """AIMD request pacing shared by every fetch thread.
+
+    While requests succeed and latency stays within `latency_tolerance` times
+    the best latency seen, the rate climbs by about `increase` requests/sec
+    every second. A 429, 5xx or timeout halves it (at most once per
+    `cooldown` seconds, so one burst of failures from in-flight requests only
+    counts once). The rate stays between min_rate and max_rate."""
+
+    def __init__(self, max_rate, min_rate=None, start_rate=None, increase=0.1, decrease=0.5,
+                 latency_tolerance=2.0, cooldown=2.0):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate or max_rate, max_rate)
+        self.rate = min(max(start_rate or self.min_rate, self.min_rate), max_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.latency = None
+        self.best_latency = None
+
+    def acquire(self):
+        """Block until this thread may send its next request."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                slot = max(self.next_slot, self.paused_until)
+                if slot <= now:
+                    # only take one free slot at a time, so a rate change
+                    # applies straight away rather than after a queue of
+                    # reservations made at the old rate
+                    interval = 1 / self.rate
+                    self.next_slot = max(self.next_slot, now - interval) + interval
+                    return
+
+            time.sleep(slot - now)
+
+    def record_success(self, latency):
+        with self.lock:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            self.best_latency = self.latency if self.best_latency is None else min(self.best_latency, self.latency)
+
+            # a slowing server is the first sign of trouble, stop climbing
+            if self.latency > self.best_latency * self.latency_tolerance:
+                return
+
+            # per request, so the rate grows by ~increase per second
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def record_congestion(self, reason):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_decrease < self.cooldown:
+                return
+
+            self.last_decrease = now
+            new_rate = max(self.min_rate, self.rate * self.decrease)
+            if new_rate == self.rate:
+                return
+            logging.warning(f"{reason}, slowing down from {self.rate:.2f} to {new_rate:.2f} req/s")
+            self.rate = new_rate
+
+    def pause(self, seconds):
+        """Hold back every request for `seconds`, e.g. for a Retry-After."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+_rate_controller = None
+
+def enable_rate_controller(max_rate, min_rate=None, start_rate=None, increase=0.1):
+    """Pace every request to the FixMyStreet host. With min_rate equal to
+    max_rate the rate is fixed."""
+    global _rate_controller
+
+    if not max_rate:
+        _rate_controller = None
+        REQUEST_RATE.remove()
+        return None
+
+    _rate_controller = AdaptiveRateController(max_rate, min_rate, start_rate, increase)
+    REQUEST_RATE.set_function(lambda: _rate_controller.rate)
+    logging.info(f"Pacing requests between {_rate_controller.min_rate} and {max_rate} req/s")
+    return _rate_controller
+
+def get_rate_controller():
+    return _rate_controller
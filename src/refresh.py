@@ -0,0 +1,144 @@
+import logging
+import threading
+from datetime import datetime, timezone
+
+from psycopg2.extras import execute_values # type: ignore
+
+import src
+from .db_pool import db_cursor
+
+SQL_CREATE_HTTP_CACHE_TABLE = """
+    CREATE TABLE IF NOT EXISTS "public"."http_cache" (
+      "id" INTEGER NOT NULL,
+      "etag" TEXT NULL,
+      "last_modified" TEXT NULL,
+      "checked_timestamp" TIMESTAMP WITH TIME ZONE NOT NULL,
+      CONSTRAINT "PK_http_cache" PRIMARY KEY ("id")
+    );
+"""
+
+def SQL_create_http_cache_table():
+    src.ensure_table("http_cache", SQL_CREATE_HTTP_CACHE_TABLE)
+
+def SQL_get_refresh_candidates(limit: int, max_staleness_hours: float, min_interval_hours: float):
+    """Open reports due a re-check, most urgent first, as (id, etag, last_modified).
+
+    A report is open if it's editable or its status is Investigating/Unknown.
+    Anything not checked for max_staleness_hours comes first. After that,
+    reports are ranked by time since last check divided by time since their
+    last activity (latest update, or when reported), so recently active
+    reports are re-checked more often than ones that have gone quiet."""
+    logging.debug("Getting reports due a refresh...")
+    SQL_create_http_cache_table()
+    with db_cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT s.id, h.etag, h.last_modified
+            FROM status s
+            JOIN logs l ON l.id = s.id
+            LEFT JOIN updates u ON u.id = s.id
+            LEFT JOIN http_cache h ON h.id = s.id
+            WHERE (s.status IN ('Investigating', 'Unknown') OR s.editable)
+              AND s.status NOT LIKE 'N/a%%'
+              AND GREATEST(l.timestamp, h.checked_timestamp) < now() - make_interval(secs => %(min_interval)s)
+            ORDER BY
+              GREATEST(l.timestamp, h.checked_timestamp) < now() - make_interval(secs => %(max_staleness)s) DESC,
+              EXTRACT(EPOCH FROM now() - GREATEST(l.timestamp, h.checked_timestamp))
+                / (EXTRACT(EPOCH FROM now() - COALESCE(u.latest_timestamp, s.reported_timestamp, l.timestamp)) + 86400) DESC
+            LIMIT %(limit)s;
+            """,
+            {"limit": limit, "max_staleness": max_staleness_hours * 3600, "min_interval": min_interval_hours * 3600}
+        )
+        return [tuple(row) for row in cursor.fetchall()]
+
+def SQL_save_validators(number: int, etag, last_modified):
+    SQL_create_http_cache_table()
+    with db_cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO http_cache (id, etag, last_modified, checked_timestamp)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (id) DO UPDATE
+            SET etag = EXCLUDED.etag, last_modified = EXCLUDED.last_modified, checked_timestamp = EXCLUDED.checked_timestamp;
+            """,
+            (number, etag, last_modified, datetime.now(timezone.utc))
+        )
+
+def SQL_mark_checked(numbers: list):
+    if not numbers:
+        return
+
+    logging.debug(f"Recording {len(numbers)} unchanged reports as checked...")
+    timestamp = datetime.now(timezone.utc)
+    SQL_create_http_cache_table()
+    with db_cursor() as cursor:
+        execute_values(
+            cursor,
+            """
+            INSERT INTO http_cache (id, checked_timestamp)
+            VALUES %s
+            ON CONFLICT (id) DO UPDATE SET checked_timestamp = EXCLUDED.checked_timestamp;
+            """,
+            [(number, timestamp) for number in numbers]
+        )
+
+class Refresher:
+    """Fetch and handler pair for the fetch engine. Sends each report's stored
+    validators, drops 304s before they get near the parser, and stores the new
+    validators once a changed page has been handed to the writer. A page that
+    failed to parse or was skipped as unchanged keeps its old validators, so
+    the next refresh gets it in full again rather than a 304."""
+
+    def __init__(self, candidates):
+        self.validators = {number: (etag, last_modified) for number, etag, last_modified in candidates}
+        self.new_validators = {}
+        self.unchanged = []
+        self.changed = 0
+        self.lock = threading.Lock()
+
+    def fetch(self, number):
+        etag, last_modified = self.validators.get(number, (None, None))
+        response_content, reason, etag, last_modified = src.get_report_page_if_changed(number, etag, last_modified)
+        self.new_validators[number] = (etag, last_modified)
+        return response_content, reason
+
+    def handle(self, number, response_content, reason):
+        etag, last_modified = self.new_validators.pop(number)
+
+        if response_content == "304":
+            with self.lock:
+                self.unchanged.append(number)
+            return
+
+        if src.handle_report_page(number, response_content, reason) != src.WRITTEN:
+            return
+
+        SQL_save_validators(number, etag, last_modified)
+        with self.lock:
+            self.changed += 1
+
+def refresh_reports(limit=1000, max_in_flight=8, rate_limit=1.0, max_staleness_hours=24 * 7, min_interval_hours=6,
+                    skip_unchanged=True):
+    """Re-fetch up to `limit` open reports, most likely to have changed first.
+    Needs the bulk writer enabled, since changed reports are upserted. With
+    `skip_unchanged`, pages sent in full whose fingerprint hasn't changed
+    aren't parsed or written either."""
+    candidates = SQL_get_refresh_candidates(limit, max_staleness_hours, min_interval_hours)
+    logging.info(f"Refreshing {len(candidates)} open reports...")
+
+    if skip_unchanged:
+        src.enable_fingerprints(number for number, _, _ in candidates)
+
+    refresher = Refresher(candidates)
+    try:
+        src.run_fetch_engine(
+            (number for number, _, _ in candidates), refresher.handle,
+            max_in_flight=max_in_flight, rate_limit=rate_limit, fetch=refresher.fetch
+        )
+    finally:
+        same_content = src.close_fingerprints()
+    SQL_mark_checked(refresher.unchanged)
+
+    changed, unchanged = refresher.changed, len(refresher.unchanged) + same_content
+    logging.info(f"Refresh done: {changed} changed, {unchanged} unchanged ({same_content} sent in full but with the same fingerprint)")
+    return changed, unchanged
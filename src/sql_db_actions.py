@@ -1,27 +1,61 @@
 import logging
-import psycopg2 # type: ignore 
-from psycopg2.extras import DictCursor # type: ignore
 import time
 from datetime import datetime, timezone
 
+import src
+from .bulk_writer import get_bulk_writer
+from .db_pool import db_cursor
+from .id_bitmap import mark_scraped
+from .metrics import FAST_BUCKETS, Histogram
+from .structured_logging import log_context
+from .storage_layout import WIDE_COLUMNS, wide_row
+
+WRITE_SECONDS = Histogram(
+    "fms_write_seconds", "Time SQL_insert_into_db takes per report, written directly or into the bulk writer's buffer",
+    ("path",), buckets=FAST_BUCKETS
+)
+
+# tables ensure_table has already created, or found, in this process
+_tables_ready = set()
+
+def ensure_table(name: str, ddl: str):
+    """Run `ddl`, a CREATE TABLE IF NOT EXISTS, the first time `name` is
+    needed in this process, so tables that aren't in the README's schema
+    are created on first use without a round trip every time after."""
+    if name not in _tables_ready:
+        with db_cursor() as cursor:
+            cursor.execute(ddl)
+        _tables_ready.add(name)
+
 def truncate(bool):
     if bool:
         logging.warning("TRUNCATING TB TABLES in 3 seconds...")
         time.sleep(3)
-        with psycopg2.connect() as psql:
-            cursor = psql.cursor(cursor_factory=DictCursor)
+        with db_cursor() as cursor:
+            if src.get_storage_layout() == "wide":
+                cursor.execute('TRUNCATE TABLE "public"."reports";')
+            else:
+                cursor.execute(
+                    """
+                    TRUNCATE TABLE "public"."details";
+                    TRUNCATE TABLE "public"."status";
+                    TRUNCATE TABLE "public"."location";
+                    TRUNCATE TABLE "public"."method";
+                    TRUNCATE TABLE "public"."updates";
+                    TRUNCATE TABLE "public"."logs";
+                    """,
+                    ()
+                )
+            src.SQL_create_tombstones_table()
+            src.SQL_create_work_leases_table()
             cursor.execute(
                 """
-                TRUNCATE TABLE "public"."details";
-                TRUNCATE TABLE "public"."status";
-                TRUNCATE TABLE "public"."location";
-                TRUNCATE TABLE "public"."method";
-                TRUNCATE TABLE "public"."updates";
-                TRUNCATE TABLE "public"."logs";
+                TRUNCATE TABLE "public"."tombstones";
+                TRUNCATE TABLE "public"."work_leases";
+                DELETE FROM "public"."meta" WHERE key = 'permutation_state';
                 """,
                 ()
             )
-            psql.commit()
         logging.info("DB TABLES TRUNCATED")
         logging.debug("Waiting for 3 seconds before continuing...")
         time.sleep(3)
@@ -30,115 +64,136 @@ def truncate(bool):
     else:
         return None
 
-def insert_status(number: int, status: str, timestamp, editable):
+def insert_status(cursor, number: int, status: str, timestamp, editable):
     logging.debug("Writing status to DB...")
-    with psycopg2.connect() as psql:
-        cursor = psql.cursor(cursor_factory=DictCursor)
-        cursor.execute(
-            """
-            INSERT INTO status (id, status, reported_timestamp, editable)
-            VALUES (%s, %s, %s, %s)
-            """,
-            (number, status, timestamp, editable)
-        )
-        psql.commit()
+    cursor.execute(
+        """
+        INSERT INTO status (id, status, reported_timestamp, editable)
+        VALUES (%s, %s, %s, %s)
+        """,
+        (number, status, timestamp, editable)
+    )
     return None
 
-def insert_details(number: int, category: str, title: str, description: str):
+def insert_details(cursor, number: int, category: str, title: str, description: str):
     logging.debug("Writing details to DB...")
-    with psycopg2.connect() as psql:
-        cursor = psql.cursor(cursor_factory=DictCursor)
-        cursor.execute(
-            """
-            INSERT INTO details (id, category, title, description)
-            VALUES (%s, %s, %s, %s)
-            """,
-            (number, category, title, description)
-        )
-        psql.commit()
+    cursor.execute(
+        """
+        INSERT INTO details (id, category, title, description)
+        VALUES (%s, %s, %s, %s)
+        """,
+        (number, category, title, description)
+    )
     return None
 
-def insert_location(number: int, lat: int, lon: int, council: str):
+def insert_location(cursor, number: int, lat: int, lon: int, council: str):
     logging.debug("Writing location to DB...")
-    with psycopg2.connect() as psql:
-        cursor = psql.cursor(cursor_factory=DictCursor)
-        cursor.execute(
-            """
-            INSERT INTO location (id, latitude, longitude, council)
-            VALUES (%s, %s, %s, %s)
-            """,
-            (number, lat, lon, council)
-        )
+    cursor.execute(
+        """
+        INSERT INTO location (id, latitude, longitude, council)
+        VALUES (%s, %s, %s, %s)
+        """,
+        (number, lat, lon, council)
+    )
 
-def insert_methods(number: int, method: str):
+def insert_methods(cursor, number: int, method: str):
     logging.debug("Writing method to DB...")
-    with psycopg2.connect() as psql:
-        cursor = psql.cursor(cursor_factory=DictCursor)
-        cursor.execute(
-            """
-            INSERT INTO method (id, method)
-            VALUES (%s, %s)
-            """,
-            (number, method)
-        )
+    cursor.execute(
+        """
+        INSERT INTO method (id, method)
+        VALUES (%s, %s)
+        """,
+        (number, method)
+    )
 
-def insert_updates(number: int, no_of_updates, latest_update):
+def insert_updates(cursor, number: int, no_of_updates, latest_update):
     logging.debug("Writing updates to DB...")
-    with psycopg2.connect() as psql:
-        cursor = psql.cursor(cursor_factory=DictCursor)
-        cursor.execute(
-            """
-            INSERT INTO updates (id, no_of_updates, latest_timestamp)
-            VALUES (%s, %s, %s)
-            """,
-            (number, no_of_updates, latest_update)
-        )
+    cursor.execute(
+        """
+        INSERT INTO updates (id, no_of_updates, latest_timestamp)
+        VALUES (%s, %s, %s)
+        """,
+        (number, no_of_updates, latest_update)
+    )
 
-def insert_log(number: int):
+def insert_log(cursor, number: int, fingerprint=None):
     logging.debug("Writing log to DB...")
 
     # get timestamp
     timestamp = datetime.now(timezone.utc)
 
     # write to db
-    with psycopg2.connect() as psql:
-        cursor = psql.cursor(cursor_factory=DictCursor)
-        cursor.execute(
-            """
-            INSERT INTO logs (id, timestamp)
-            VALUES (%s, %s)
-            """,
-            (number, timestamp)
-        )
+    cursor.execute(
+        """
+        INSERT INTO logs (id, timestamp, fingerprint)
+        VALUES (%s, %s, %s)
+        """,
+        (number, timestamp, fingerprint)
+    )
+
+def insert_report(cursor, data):
+    logging.debug("Writing report to DB...")
+    cursor.execute(
+        f"""
+        INSERT INTO reports ({", ".join(WIDE_COLUMNS)})
+        VALUES ({", ".join(["%s"] * len(WIDE_COLUMNS))})
+        """,
+        wide_row(data, datetime.now(timezone.utc))
+    )
 
 def SQL_insert_into_db(data):
-    
-    insert_status(data["number"], data["status"], data["timestamp"], data["editable"])
-    insert_details(data["number"], data["category"], data["title"], data["description"])
-    insert_location(data["number"], data["lat"], data["lon"], data["council"])
-    insert_methods(data["number"], data["method"])
-    insert_updates(data["number"], data["updates"], data["latest_update"])
-    insert_log(data["number"])
+    with log_context(data["number"], "write"):
+        start = time.perf_counter()
 
-    return None
+        # hand off to the batching writer if one is running
+        bulk_writer = get_bulk_writer()
+        if bulk_writer is not None:
+            bulk_writer.add(data)
 
-def SQL_count_number_of_rows():
-    logging.debug("Counting the number of rows in the DB...")
-    with psycopg2.connect() as psql:
-        cursor = psql.cursor(cursor_factory=DictCursor)
-        cursor.execute(
-            """
-            SELECT count(*) FROM status
-            """,
-            ()
-        )
-        result = cursor.fetchone()
-        return result[0]
+            # mark it now so strategies don't hand it out again while it sits in
+            # the buffer, a failed flush keeps it buffered for the next one
+            mark_scraped((data["number"],))
+            WRITE_SECONDS.observe(time.perf_counter() - start, "buffered")
+            return None
+
+        if src.is_tombstone(data):
+            with db_cursor() as cursor:
+                src.SQL_upsert_tombstones(cursor, [data], datetime.now(timezone.utc))
+
+            mark_scraped((data["number"],))
+            src.record_written((data["number"],))
+            WRITE_SECONDS.observe(time.perf_counter() - start, "direct")
+            return None
+
+        if src.get_storage_layout() == "wide":
+            with db_cursor() as cursor:
+                insert_report(cursor, data)
+                src.SQL_delete_tombstones(cursor, [data["number"]])
+
+            mark_scraped((data["number"],))
+            src.record_written((data["number"],))
+            WRITE_SECONDS.observe(time.perf_counter() - start, "direct")
+            return None
+
+        # all six rows go in one transaction, so a report is either fully written or not at all
+        with db_cursor() as cursor:
+            insert_status(cursor, data["number"], data["status"], data["timestamp"], data["editable"])
+            insert_details(cursor, data["number"], data["category"], data["title"], data["description"])
+            insert_location(cursor, data["number"], data["lat"], data["lon"], data["council"])
+            insert_methods(cursor, data["number"], data["method"])
+            insert_updates(cursor, data["number"], data["updates"], data["latest_update"])
+            insert_log(cursor, data["number"], data.get("fingerprint"))
+            # an ID is either a report or a tombstone, like in the bulk writer
+            src.SQL_delete_tombstones(cursor, [data["number"]])
+
+        mark_scraped((data["number"],))
+        src.record_written((data["number"],))
+        WRITE_SECONDS.observe(time.perf_counter() - start, "direct")
+        return None
 
 def SQL_get_UPPER_NUMBER():
     logging.debug("Getting UPPER_NUMBER from DB...")
-    with psycopg2.connect() as psql:
-        cursor = psql.cursor(cursor_factory=DictCursor)
+    with db_cursor() as cursor:
         cursor.execute(
             """
             SELECT value FROM meta
@@ -148,13 +203,12 @@ def SQL_get_UPPER_NUMBER():
         )
         result = cursor.fetchone()
         
-        logging.info(f"Got {result[0]} as UPPER_NUMBER from DB...")
+        logging.info("Got %s as UPPER_NUMBER from DB...", result[0])
         return int(result[0])
 
 def SQL_update_upper_number(new_upper_number: int):
-    logging.info(f"Updating UPPER_NUMBER in DB to {new_upper_number}... ")
-    with psycopg2.connect() as psql:
-        cursor = psql.cursor(cursor_factory=DictCursor)
+    logging.info("Updating UPPER_NUMBER in DB to %s... ", new_upper_number)
+    with db_cursor() as cursor:
         cursor.execute(
             """
             UPDATE meta
@@ -164,9 +218,7 @@ def SQL_update_upper_number(new_upper_number: int):
             (new_upper_number, )
         )
     
-    logging.info("Updating run_AFH to 0 as we've just done a run...")
-    with psycopg2.connect() as psql:
-        cursor = psql.cursor(cursor_factory=DictCursor)
+        logging.info("Updating run_AFH to 0 as we've just done a run...")
         cursor.execute(
             """
             UPDATE meta
@@ -178,8 +230,7 @@ def SQL_update_upper_number(new_upper_number: int):
 
 def SQL_check_autofind_should_run():
     logging.debug("Getting run_AFH value from DB...")
-    with psycopg2.connect() as psql:
-        cursor = psql.cursor(cursor_factory=DictCursor)
+    with db_cursor() as cursor:
         cursor.execute(
             """
             SELECT value FROM meta
@@ -189,5 +240,39 @@ def SQL_check_autofind_should_run():
         )
         result = cursor.fetchone()
         
-        logging.info(f"Got {result[0]} as run_AFH from DB...")
+        logging.info("Got %s as run_AFH from DB...", result[0])
         return int(result[0])
+
+def SQL_get_meta_value(key: str):
+    logging.debug("Getting %s from meta table...", key)
+    with db_cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT value FROM meta
+            WHERE key = %s;
+            """,
+            (key, )
+        )
+        result = cursor.fetchone()
+        return result[0] if result else None
+
+def SQL_set_meta_value(key: str, value: str):
+    logging.debug("Setting %s in meta table...", key)
+    with db_cursor() as cursor:
+        # meta has no primary key to upsert on
+        cursor.execute(
+            """
+            UPDATE meta
+            SET value = %s
+            WHERE key = %s;
+            """,
+            (value, key)
+        )
+        if cursor.rowcount == 0:
+            cursor.execute(
+                """
+                INSERT INTO meta (key, value)
+                VALUES (%s, %s);
+                """,
+                (key, value)
+            )
@@ -0,0 +1,169 @@
+import logging
+import time
+
+from psycopg2.extras import execute_values # type: ignore
+
+from .bulk_writer import REPORT_TABLES
+from .db_pool import db_cursor
+
+# the one column whose name would clash or mislead in a single table
+WIDE_RENAMES = {("logs", "timestamp"): "logged_timestamp"}
+
+# (table, column in that table, column in reports) for every non-id column
+WIDE_COLUMN_MAP = [
+    (table, column, WIDE_RENAMES.get((table, column), column))
+    for table, (columns, _) in REPORT_TABLES.items()
+    for column in columns[1:]
+]
+WIDE_COLUMNS = ("id",) + tuple(wide for _, _, wide in WIDE_COLUMN_MAP)
+
+SQL_CREATE_REPORTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS "reports" (
+      "id" INTEGER NOT NULL,
+      "status" TEXT NULL,
+      "reported_timestamp" TIMESTAMP WITH TIME ZONE NULL,
+      "editable" BOOLEAN NULL,
+      "category" TEXT NULL,
+      "title" TEXT NULL,
+      "description" TEXT NULL,
+      "latitude" DOUBLE PRECISION NULL,
+      "longitude" DOUBLE PRECISION NULL,
+      "council" TEXT NULL,
+      "method" TEXT NULL,
+      "no_of_updates" INTEGER NULL,
+      "latest_timestamp" TIMESTAMP WITH TIME ZONE NULL,
+      "logged_timestamp" TIMESTAMP WITH TIME ZONE NOT NULL,
+      "fingerprint" BYTEA NULL,
+      CONSTRAINT "PK_reports" PRIMARY KEY ("id")
+    );
+"""
+
+def wide_row(data, now):
+    row = [data["number"]]
+    for _, to_row in REPORT_TABLES.values():
+        row.extend(to_row(data, now)[1:])
+    return tuple(row)
+
+def SQL_upsert_wide_reports(cursor, reports: list, now):
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in WIDE_COLUMNS[1:])
+    execute_values(
+        cursor,
+        f"""
+        INSERT INTO reports ({", ".join(WIDE_COLUMNS)})
+        VALUES %s
+        ON CONFLICT (id) DO UPDATE SET {updates}
+        """,
+        [wide_row(data, now) for data in reports],
+        page_size=len(reports)
+    )
+
+_layout = None
+
+def get_storage_layout(refresh: bool = False):
+    """"wide" once the report tables have been migrated into the single
+    reports table (the old names are then views), otherwise "split"."""
+    global _layout
+
+    if _layout is None or refresh:
+        with db_cursor() as cursor:
+            cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('status');")
+            result = cursor.fetchone()
+            _layout = "wide" if result and result[0] == "v" else "split"
+            SQL_add_fingerprint_column(cursor, _layout)
+        logging.debug(f"Storage layout is {_layout}")
+
+    return _layout
+
+def compatibility_view(table):
+    selected = ", ".join(
+        column if wide == column else f"{wide} AS {column}"
+        for mapped_table, column, wide in WIDE_COLUMN_MAP if mapped_table == table
+    )
+    return f"SELECT id, {selected} FROM reports"
+
+def SQL_create_compatibility_views(cursor):
+    for table in REPORT_TABLES:
+        cursor.execute(f"CREATE VIEW {table} AS {compatibility_view(table)};")
+
+def SQL_add_fingerprint_column(cursor, layout):
+    """Add logs.fingerprint (reports.fingerprint in the wide layout) to DBs
+    created before it existed."""
+    cursor.execute(
+        "SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = 'logs' AND column_name = 'fingerprint';"
+    )
+    if cursor.fetchone():
+        return
+
+    logging.warning("Adding the fingerprint column to logs...")
+    if layout == "wide":
+        cursor.execute('ALTER TABLE reports ADD COLUMN IF NOT EXISTS "fingerprint" BYTEA NULL;')
+        # a new last column is the one change CREATE OR REPLACE VIEW allows
+        cursor.execute(f"CREATE OR REPLACE VIEW logs AS {compatibility_view('logs')};")
+    else:
+        cursor.execute('ALTER TABLE logs ADD COLUMN IF NOT EXISTS "fingerprint" BYTEA NULL;')
+
+def SQL_copy_batch_to_wide(cursor, after_id: int, limit=None):
+    """Copy reports with IDs above after_id from the six tables into reports,
+    in ID order. Returns the IDs copied."""
+    selected = ", ".join(
+        f"COALESCE({table}.{column}, now())" if wide == "logged_timestamp" else f"{table}.{column}"
+        for table, column, wide in WIDE_COLUMN_MAP
+    )
+    joins = " ".join(f"LEFT JOIN {table} ON {table}.id = status.id" for table in REPORT_TABLES if table != "status")
+
+    cursor.execute(
+        f"""
+        INSERT INTO reports ({", ".join(WIDE_COLUMNS)})
+        SELECT status.id, {selected}
+        FROM status {joins}
+        WHERE status.id > %s
+        ORDER BY status.id
+        {"LIMIT %s" if limit else ""}
+        RETURNING id;
+        """,
+        (after_id, limit) if limit else (after_id,)
+    )
+    return [number for (number,) in cursor.fetchall()]
+
+def migrate_to_wide_table(batch_size: int = 50_000):
+    """Move the six report tables into the single reports table. Rows are
+    copied in batches of batch_size, each in its own transaction, so it can
+    be stopped and run again. The last step swaps the old tables for views
+    with the same names, and keeps them as <name>_split. Don't scrape while
+    this runs, updates to already-copied reports would be lost."""
+    if get_storage_layout(refresh=True) == "wide":
+        logging.info("Reports are already in the wide table")
+        return
+
+    logging.info("Migrating report tables into the wide reports table...")
+    start = time.monotonic()
+
+    with db_cursor() as cursor:
+        cursor.execute(SQL_CREATE_REPORTS_TABLE)
+        cursor.execute("SELECT COALESCE(max(id), 0) FROM reports;")
+        last_id = cursor.fetchone()[0]
+
+    copied = 0
+    while True:
+        with db_cursor() as cursor:
+            numbers = SQL_copy_batch_to_wide(cursor, last_id, batch_size)
+        if not numbers:
+            break
+
+        copied += len(numbers)
+        last_id = max(numbers)
+        logging.info(f"Copied {copied} reports, up to {last_id} ({copied / (time.monotonic() - start):.0f}/s)")
+
+    with db_cursor() as cursor:
+        tables = ", ".join(REPORT_TABLES)
+        cursor.execute(f"LOCK TABLE {tables} IN ACCESS EXCLUSIVE MODE;")
+
+        # anything written since the last batch
+        copied += len(SQL_copy_batch_to_wide(cursor, last_id))
+
+        for table in REPORT_TABLES:
+            cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_split;")
+        SQL_create_compatibility_views(cursor)
+
+    get_storage_layout(refresh=True)
+    logging.info(f"Migrated {copied} reports in {time.monotonic() - start:.1f}s. The old tables are kept as *_split")
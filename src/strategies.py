@@ -1,21 +1,41 @@
+import json
 import logging
+import random
+
 import src
+from .metrics import Counter
+from .permutation import FeistelPermutation
+
+# how often the permutation strategy saves its position to the meta table
+PERMUTATION_CHECKPOINT_EVERY = 1000
+
+STRATEGY_NUMBERS = Counter(
+    "fms_strategy_numbers_total", "Numbers a strategy handed out, or skipped because they were already scraped",
+    ("strategy", "result")
+)
 
 def is_done(highest_number: int):
-    return src.SQL_count_number_of_rows() == highest_number
+    """True once every ID in 1..highest_number is scraped. The bitmap also
+    holds IDs above highest_number (from --ids or earlier runs), so only
+    the ones in range are counted."""
+    return src.get_scraped_ids().count_range(1, highest_number) >= highest_number
 
 def sequential_strategy(highest_number: int):
     logging.info("Using sequential number sequence")
     start = 1
+    previous = start - 1
 
-    for number in range(start, highest_number + 1):
-        # Check if number is already in db
-        if src.is_number_in_db(number):
-            logging.info("Skipping this number...")
-            print("=" * 80)
-            continue # skip number
+    # numbers already in the db are skipped by the bitmap
+    for number in src.get_scraped_ids().missing(start, highest_number):
+        if number > previous + 1:
+            STRATEGY_NUMBERS.inc("sequential", "skipped", amount=number - previous - 1)
+        previous = number
 
-        yield number # else return/yield
+        STRATEGY_NUMBERS.inc("sequential", "yielded")
+        yield number
+
+    if highest_number > previous:
+        STRATEGY_NUMBERS.inc("sequential", "skipped", amount=highest_number - previous)
     return
 
 
@@ -23,12 +43,91 @@ def single_strategy(single_number: int):
     logging.info("Only processing 1 number")
     yield single_number
 
+def ids_strategy(numbers):
+    """Yield each of the given numbers once, in the order given. Numbers
+    already in the DB are fetched again, so pair this with the bulk writer
+    which upserts them."""
+    logging.info("Processing a given list of numbers")
+    for number in dict.fromkeys(numbers):
+        STRATEGY_NUMBERS.inc("ids", "yielded")
+        yield number
+
 def random_strategy(highest_number: int):
-    while not is_done(highest_number):
+    scraped_ids = src.get_scraped_ids()
+
+    # is_done counts the bitmap, too slow to call for every number. len() is
+    # cheap, so check that against the IDs outside the range, counted once,
+    # and only call is_done once it says we might be done.
+    outside = len(scraped_ids) - scraped_ids.count_range(1, highest_number)
+
+    while True:
+        if len(scraped_ids) - outside >= highest_number:
+            if is_done(highest_number):
+                return
+            # more IDs outside the range were added since
+            outside = len(scraped_ids) - scraped_ids.count_range(1, highest_number)
+
         number = src.get_random_number(highest_number)
 
         # check if number is in db
-        if src.is_number_in_db(number):
+        if number in scraped_ids:
+            STRATEGY_NUMBERS.inc("random", "skipped")
             continue # skip number
 
+        STRATEGY_NUMBERS.inc("random", "yielded")
         yield number
+
+def load_permutation_state(highest_number: int, seed=None):
+    state = src.SQL_get_meta_value("permutation_state")
+
+    if state is None or (seed is not None and json.loads(state)["seed"] != seed):
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(63)
+        logging.info(f"Starting new permutation with seed {seed}")
+        return {"seed": seed, "segments": [[1, highest_number, 0]]}
+
+    state = json.loads(state)
+
+    # UPPER_NUMBER went up since last run, shuffle the new IDs as their own segment
+    last_high = state["segments"][-1][1]
+    if highest_number > last_high:
+        logging.info(f"Extending permutation with {last_high + 1}..{highest_number}")
+        state["segments"].append([last_high + 1, highest_number, 0])
+
+    return state
+
+def save_permutation_state(state):
+    src.SQL_set_meta_value("permutation_state", json.dumps(state))
+
+def permutation_strategy(highest_number: int, seed=None):
+    """Visit every number in 1..highest_number once, in a shuffled order that
+    is reproducible from the seed and resumes where the last run stopped."""
+    logging.info("Using permutation number sequence")
+    scraped_ids = src.get_scraped_ids()
+    state = load_permutation_state(highest_number, seed)
+    logging.info(f"Permutation seed: {state['seed']}")
+
+    for segment in state["segments"]:
+        low, high, position = segment
+        permutation = FeistelPermutation(high - low + 1, f"{state['seed']}:{low}")
+
+        while position < len(permutation):
+            number = low + permutation[position]
+            position += 1
+
+            if position % PERMUTATION_CHECKPOINT_EVERY == 0:
+                segment[2] = position
+                save_permutation_state(state)
+
+            if number in scraped_ids:
+                STRATEGY_NUMBERS.inc("permutation", "skipped")
+                continue # skip number
+
+            STRATEGY_NUMBERS.inc("permutation", "yielded")
+            yield number
+
+        segment[2] = position
+        save_permutation_state(state)
+
+    # pick up anything handed out before a crash but never written
+    yield from sequential_strategy(highest_number)
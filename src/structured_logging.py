@@ -0,0 +1,133 @@
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from .colourlog import ColorFormatter
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# (report id, stage) of whatever this thread or task is working on
+_log_context = contextvars.ContextVar("log_context", default=(None, None))
+
+class log_context:
+    """Tag log records made inside the block with a report id and stage."""
+    __slots__ = ("report_id", "stage", "token")
+
+    def __init__(self, report_id=None, stage=None):
+        self.report_id = report_id
+        self.stage = stage
+
+    def __enter__(self):
+        self.token = _log_context.set((self.report_id, self.stage))
+        return self
+
+    def __exit__(self, *exc_info):
+        _log_context.reset(self.token)
+
+class ContextFilter(logging.Filter):
+    # runs on the logging thread, before the record is queued
+    def filter(self, record):
+        report_id, stage = _log_context.get()
+        if not hasattr(record, "report_id"):
+            record.report_id = report_id
+        if not hasattr(record, "stage"):
+            record.stage = stage
+        return True
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the report id and stage when known."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "report_id", None) is not None:
+            entry["report_id"] = record.report_id
+        if getattr(record, "stage", None) is not None:
+            entry["stage"] = record.stage
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class DeferredQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # QueueHandler formats a copy of every record here, on the calling
+        # thread. Queue the record as it is instead and leave merging the
+        # args, the timestamp, colours or JSON to the listener, so log
+        # arguments must not change after the call.
+        return record
+
+class BatchingQueueListener(QueueListener):
+    """QueueListener that, once the queue is empty, waits `interval` seconds
+    before looking again rather than waking up for each record, so the
+    writing thread takes the GIL a few times a second instead of once per
+    log line."""
+
+    def __init__(self, log_queue, *handlers, interval=0.05):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.interval = interval
+
+    def dequeue(self, block):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            time.sleep(self.interval)
+            return self.queue.get(block)
+
+_listener = None
+_config = {}
+
+def setup_logging(level=logging.DEBUG, log_format="text", log_file=None, background=True):
+    """Send the root logger to stderr, or log_file, as coloured text lines or
+    JSON lines ("json"). With background on, records are queued and written
+    by a QueueListener thread, so the threads doing the work never wait on
+    formatting or I/O."""
+    global _listener, _config
+
+    stop_logging()
+    _config = {"level": level, "log_format": log_format, "log_file": log_file, "background": background}
+
+    handler = logging.FileHandler(log_file) if log_file else logging.StreamHandler()
+    handler.setFormatter(JSONFormatter() if log_format == "json" else ColorFormatter(TEXT_FORMAT))
+
+    if background:
+        log_queue = queue.SimpleQueue()
+        front = DeferredQueueHandler(log_queue)
+        _listener = BatchingQueueListener(log_queue, handler)
+        _listener.start()
+    else:
+        front = handler
+    front.addFilter(ContextFilter())
+
+    # neither format uses thread or process info, so skip collecting it for
+    # every record (see "Optimization" in the logging docs)
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(front)
+    root.setLevel(level)
+
+def get_logging_config():
+    """Arguments for setup_logging that reproduce the current setup, e.g. in
+    a worker process."""
+    return {**_config, "level": logging.getLogger().level} if _config else {"level": logging.getLogger().level}
+
+@atexit.register
+def stop_logging():
+    # writes out anything still queued
+    global _listener
+
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
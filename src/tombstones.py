@@ -0,0 +1,123 @@
+import logging
+import time
+
+from psycopg2.extras import execute_values # type: ignore
+
+import src
+from .db_pool import db_cursor
+from .metrics import Counter
+
+TOMBSTONES_WRITTEN = Counter("fms_tombstones_total", "IDs recorded as missing, hidden or removed, by HTTP status", ("status_code",))
+
+# statuses recorded as a tombstone instead of a report
+TOMBSTONE_STATUS_CODES = (403, 404, 410)
+
+SQL_CREATE_TOMBSTONES_TABLE = """
+    CREATE TABLE IF NOT EXISTS "public"."tombstones" (
+      "id" INTEGER NOT NULL,
+      "status_code" SMALLINT NOT NULL,
+      "checked_timestamp" TIMESTAMP WITH TIME ZONE NOT NULL,
+      CONSTRAINT "PK_tombstones" PRIMARY KEY ("id")
+    );
+"""
+
+# the status build_report used to give these IDs, e.g. "N/a - 404"
+PLACEHOLDER_STATUS = r"^N/a - (\d{3})$"
+
+def SQL_create_tombstones_table():
+    src.ensure_table("tombstones", SQL_CREATE_TOMBSTONES_TABLE)
+
+def is_tombstone(data):
+    """build_report returns {"number": ..., "tombstone": <status code>} for
+    IDs that answered with one of TOMBSTONE_STATUS_CODES. SQL_insert_into_db
+    and the bulk writer store those as one tombstones row instead of rows in
+    the report tables."""
+    return "tombstone" in data
+
+def SQL_upsert_tombstones(cursor, tombstones: list, now):
+    SQL_create_tombstones_table()
+    execute_values(
+        cursor,
+        """
+        INSERT INTO tombstones (id, status_code, checked_timestamp)
+        VALUES %s
+        ON CONFLICT (id) DO UPDATE SET status_code = EXCLUDED.status_code, checked_timestamp = EXCLUDED.checked_timestamp
+        """,
+        [(data["number"], data["tombstone"], now) for data in tombstones],
+        page_size=len(tombstones)
+    )
+    for data in tombstones:
+        TOMBSTONES_WRITTEN.inc(str(data["tombstone"]))
+
+def SQL_delete_tombstones(cursor, numbers: list):
+    SQL_create_tombstones_table()
+    cursor.execute("DELETE FROM tombstones WHERE id = ANY(%s);", (numbers, ))
+
+def SQL_delete_report_rows(cursor, numbers: list, layout=None):
+    """Remove the report rows of IDs that are now tombstones, e.g. a report
+    that has since been hidden or removed."""
+    if (layout or src.get_storage_layout()) == "wide":
+        cursor.execute("DELETE FROM reports WHERE id = ANY(%s);", (numbers, ))
+        return
+
+    for table in src.bulk_writer.REPORT_TABLES:
+        cursor.execute(f"DELETE FROM {table} WHERE id = ANY(%s);", (numbers, ))
+
+def SQL_count_tombstones():
+    SQL_create_tombstones_table()
+    with db_cursor(cursor_factory=None) as cursor:
+        cursor.execute("SELECT status_code, count(*) FROM tombstones GROUP BY status_code ORDER BY status_code;")
+        return dict(cursor.fetchall())
+
+def SQL_move_placeholder_batch(cursor, after_id: int, limit: int):
+    """Turn up to `limit` placeholder reports with IDs above after_id into
+    tombstones and delete their report rows, in ID order. Returns the IDs
+    moved."""
+    # a placeholder's only real information is its status code and when it was fetched
+    if src.get_storage_layout() == "wide":
+        source = "SELECT id, status, logged_timestamp AS checked FROM reports"
+    else:
+        source = "SELECT id, status, logs.timestamp AS checked FROM status LEFT JOIN logs USING (id)"
+
+    cursor.execute(
+        f"""
+        INSERT INTO tombstones (id, status_code, checked_timestamp)
+        SELECT id, substring(status FROM %(pattern)s)::SMALLINT, COALESCE(checked, now())
+        FROM ({source}) AS placeholders
+        WHERE id > %(after_id)s AND status ~ %(pattern)s
+        ORDER BY id
+        LIMIT %(limit)s
+        ON CONFLICT (id) DO UPDATE SET checked_timestamp = GREATEST(tombstones.checked_timestamp, EXCLUDED.checked_timestamp)
+        RETURNING id;
+        """,
+        {"pattern": PLACEHOLDER_STATUS, "after_id": after_id, "limit": limit}
+    )
+    numbers = [number for (number, ) in cursor.fetchall()]
+    if numbers:
+        SQL_delete_report_rows(cursor, numbers)
+    return numbers
+
+def migrate_placeholders_to_tombstones(batch_size: int = 50_000):
+    """Collapse the six placeholder rows written for 403/404/410 IDs by older
+    versions ("N/a - 404" etc.) into one tombstones row each. Each batch is
+    moved in its own transaction, so it can be stopped and run again, and
+    scrapers can keep running. Returns the number of IDs moved."""
+    logging.info("Moving placeholder reports into the tombstones table...")
+    SQL_create_tombstones_table()
+    start = time.monotonic()
+
+    moved = 0
+    last_id = 0
+    while True:
+        with db_cursor() as cursor:
+            numbers = SQL_move_placeholder_batch(cursor, last_id, batch_size)
+        if not numbers:
+            break
+
+        moved += len(numbers)
+        last_id = max(numbers)
+        logging.info(f"Moved {moved} placeholders, up to {last_id} ({moved / (time.monotonic() - start):.0f}/s)")
+
+    counts = ", ".join(f"{status_code}: {count}" for status_code, count in SQL_count_tombstones().items())
+    logging.info(f"Moved {moved} placeholders in {time.monotonic() - start:.1f}s. Tombstones now: {counts or 'none'}")
+    return moved
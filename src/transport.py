@@ -0,0 +1,216 @@
+import atexit
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+import requests
+import urllib3
+import zstandard # type: ignore
+
+import src
+
+REPORT_PATH = re.compile(r"/report/(\d+)")
+
+# headers that describe the bytes on the wire, which no longer apply once a
+# body is stored decoded
+WIRE_HEADERS = ("content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive")
+
+class ReplayStore:
+    """Recorded responses, keyed by report number. Bodies are stored
+    decoded, each as its own zstd frame in responses.zst, with one JSON line
+    per response in responses.jsonl giving its status, headers, latency and
+    where its frame is. Later recordings of a number replace earlier ones."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.index_path = self.directory / "responses.jsonl"
+        self.data_path = self.directory / "responses.zst"
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.data_file = None
+        self.index_file = None
+        self.sorted_numbers = None
+
+        if self.index_path.exists():
+            with open(self.index_path) as index_file:
+                for line in index_file:
+                    if line.endswith("\n"): # ignore a partly written last line
+                        entry = json.loads(line)
+                        self.entries[entry["number"]] = entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def numbers(self):
+        return sorted(self.entries)
+
+    def open_data_file(self):
+        if self.data_file is None:
+            with self.lock:
+                if self.data_file is None:
+                    self.directory.mkdir(parents=True, exist_ok=True)
+                    self.data_file = open(self.data_path, "a+b")
+        return self.data_file
+
+    def add(self, number, status, headers, body, latency):
+        headers = {name: value for name, value in headers.items() if name.lower() not in WIRE_HEADERS}
+        frame = zstandard.ZstdCompressor(level=3).compress(body)
+        data_file = self.open_data_file()
+
+        with self.lock:
+            if self.index_file is None:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self.index_file = open(self.index_path, "a")
+
+            data_file.seek(0, os.SEEK_END)
+            offset = data_file.tell()
+            data_file.write(frame)
+            data_file.flush()
+
+            entry = {"number": number, "status": status, "headers": headers, "latency": latency,
+                     "offset": offset, "length": len(frame)}
+            # index last, so an entry never points at half a frame
+            self.index_file.write(json.dumps(entry) + "\n")
+            self.index_file.flush()
+            self.entries[number] = entry
+
+    def get(self, number):
+        """Return (status, headers, body, latency) for a number, or None if it
+        was never recorded."""
+        entry = self.entries.get(number)
+        if entry is None:
+            return None
+
+        # pread doesn't move the shared file position, so threads needn't lock
+        frame = os.pread(self.open_data_file().fileno(), entry["length"], entry["offset"])
+        return entry["status"], entry["headers"], zstandard.decompress(frame), entry["latency"]
+
+    def find(self, number, missing="404"):
+        """get(), except that with `missing` set to "wrap" a number that was
+        never recorded gets the recording at the same position modulo the
+        store size, so any range of IDs can be replayed from a small store."""
+        recorded = self.get(number)
+        if recorded is None and missing == "wrap" and self.entries:
+            if self.sorted_numbers is None:
+                self.sorted_numbers = self.numbers()
+            recorded = self.get(self.sorted_numbers[number % len(self.sorted_numbers)])
+        return recorded
+
+    def close(self):
+        with self.lock:
+            for f in (self.data_file, self.index_file):
+                if f is not None:
+                    f.close()
+            self.data_file = self.index_file = None
+
+def report_number(url):
+    match = REPORT_PATH.search(url)
+    return int(match.group(1)) if match else None
+
+class RecordingAdapter(requests.adapters.HTTPAdapter):
+    """Sends requests for real and saves every report response, with its
+    headers and how long it took, to a ReplayStore."""
+
+    def __init__(self, store, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+
+    def send(self, request, **kwargs):
+        start = time.monotonic()
+        response = super().send(request, **kwargs)
+        # the whole response, so the latency covers the body too
+        body = response.content
+        latency = time.monotonic() - start
+
+        number = report_number(request.url)
+        # 304s only mean something for the validators this run sent
+        if number is not None and response.status_code != 304:
+            self.store.add(number, response.status_code, dict(response.headers), body, latency)
+        return response
+
+class ReplayAdapter(requests.adapters.HTTPAdapter):
+    """Answers requests from a ReplayStore without touching the network.
+
+    Each response is delayed by its recorded latency times `time_scale`, so
+    1 reproduces the original latency distribution and 0 replays as fast as
+    possible. `missing` is as for ReplayStore.find, numbers it finds nothing
+    for get an empty 404."""
+
+    def __init__(self, store, time_scale=0, missing="404", **kwargs):
+        super().__init__(**kwargs)
+        if missing not in ("404", "wrap"):
+            msg = f"Unknown replay missing mode: {missing}"
+            logging.critical(msg)
+            raise ValueError(msg)
+
+        self.store = store
+        self.time_scale = time_scale
+        self.missing = missing
+
+    def send(self, request, **kwargs):
+        number = report_number(request.url)
+        recorded = self.store.find(number, self.missing) if number is not None else None
+        if recorded is None:
+            status, headers, body, latency = 404, {}, b"", 0
+        else:
+            status, headers, body, latency = recorded
+
+        etag = headers.get("ETag")
+        if status == 200 and etag and request.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+
+        if latency and self.time_scale:
+            time.sleep(latency * self.time_scale)
+
+        raw = urllib3.HTTPResponse(
+            body=io.BytesIO(body), headers={**headers, "Content-Length": str(len(body))},
+            status=status, preload_content=False, decode_content=False
+        )
+        return self.build_response(request, raw)
+
+_store = None
+
+def enable_recording(directory):
+    """Save every response from here on to a replay store in `directory`."""
+    global _store
+
+    logging.info(f"Recording responses to {directory}")
+    close_transport()
+    _store = ReplayStore(directory)
+    adapter = RecordingAdapter(_store, pool_connections=1, pool_maxsize=src.get_fms_report_page.HTTP_POOL_SIZE)
+    session = src.get_session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return _store
+
+def enable_replay(directory, time_scale=0, missing="404"):
+    """Answer every request from the replay store in `directory` instead of
+    the network."""
+    global _store
+
+    close_transport()
+    _store = ReplayStore(directory)
+    if not len(_store):
+        msg = f"No recorded responses in {directory}"
+        logging.critical(msg)
+        raise ValueError(msg)
+
+    logging.info(f"Replaying {len(_store)} recorded responses from {directory} at {time_scale}x recorded latency")
+    adapter = ReplayAdapter(_store, time_scale, missing)
+    session = src.get_session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return _store
+
+@atexit.register
+def close_transport():
+    global _store
+
+    if _store is not None:
+        _store.close()
+        _store = None
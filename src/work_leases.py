@@ -0,0 +1,262 @@
+import logging
+import os
+import socket
+import threading
+
+import src
+from .db_pool import db_cursor
+from .strategies import STRATEGY_NUMBERS
+
+SQL_CREATE_WORK_LEASES_TABLE = """
+    CREATE TABLE IF NOT EXISTS "public"."work_leases" (
+      "range_start" INTEGER NOT NULL,
+      "range_end" INTEGER NOT NULL,
+      "owner" TEXT NULL,
+      "lease_expires" TIMESTAMP WITH TIME ZONE NULL,
+      "progress" INTEGER NOT NULL,
+      "done" BOOLEAN NOT NULL DEFAULT false,
+      CONSTRAINT "PK_work_leases" PRIMARY KEY ("range_start")
+    );
+"""
+
+def SQL_create_work_leases_table():
+    src.ensure_table("work_leases", SQL_CREATE_WORK_LEASES_TABLE)
+
+def get_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def SQL_create_work_ranges(highest_number: int, range_size: int):
+    """Split 1..highest_number into ranges of range_size, adding only the ones
+    past the end of the existing ranges. Safe to run from several nodes."""
+    with db_cursor() as cursor:
+        cursor.execute("SELECT COALESCE(max(range_end), 0) FROM work_leases;")
+        start = cursor.fetchone()[0] + 1
+
+        ranges = [(low, min(low + range_size - 1, highest_number), low) for low in range(start, highest_number + 1, range_size)]
+        if ranges:
+            logging.info(f"Adding {len(ranges)} work ranges for {start}..{highest_number}")
+            cursor.executemany(
+                """
+                INSERT INTO work_leases (range_start, range_end, progress)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (range_start) DO NOTHING;
+                """,
+                ranges
+            )
+
+def SQL_claim_range(worker_id: str, lease_seconds: int):
+    """Lease the lowest unfinished range nobody holds, or whose lease expired.
+    Returns (range_start, range_end, progress) or None if nothing is left."""
+    with db_cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE work_leases
+            SET owner = %(worker_id)s, lease_expires = now() + make_interval(secs => %(lease_seconds)s)
+            WHERE range_start = (
+                SELECT range_start FROM work_leases
+                WHERE NOT done AND (lease_expires IS NULL OR lease_expires < now())
+                ORDER BY range_start
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING range_start, range_end, progress;
+            """,
+            {"worker_id": worker_id, "lease_seconds": lease_seconds}
+        )
+        result = cursor.fetchone()
+        return tuple(result) if result else None
+
+def SQL_heartbeat_range(worker_id: str, range_start: int, progress: int, lease_seconds: int):
+    """Extend our lease and save progress. Returns False if the lease has been
+    taken over by another node."""
+    with db_cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE work_leases
+            SET lease_expires = now() + make_interval(secs => %s), progress = %s
+            WHERE range_start = %s AND owner = %s AND NOT done;
+            """,
+            (lease_seconds, progress, range_start, worker_id)
+        )
+        return cursor.rowcount == 1
+
+def SQL_finish_range(worker_id: str, range_start: int, progress: int):
+    with db_cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE work_leases
+            SET done = true, progress = %s, lease_expires = NULL
+            WHERE range_start = %s AND owner = %s;
+            """,
+            (progress, range_start, worker_id)
+        )
+        return cursor.rowcount == 1
+
+def SQL_get_ids_in_range(range_start: int, range_end: int):
+    """IDs in the range that are written to the DB, as reports, tombstones
+    or dead letters."""
+    src.SQL_create_tombstones_table()
+    src.SQL_create_dead_letters_table()
+    with db_cursor(cursor_factory=None) as cursor:
+        cursor.execute(
+            """
+            SELECT id FROM status WHERE id BETWEEN %(start)s AND %(end)s
+            UNION ALL
+            SELECT id FROM tombstones WHERE id BETWEEN %(start)s AND %(end)s
+            UNION ALL
+            SELECT id FROM dead_letters WHERE id BETWEEN %(start)s AND %(end)s;
+            """,
+            {"start": range_start, "end": range_end}
+        )
+        return [number for (number,) in cursor.fetchall()]
+
+class Lease:
+    """Keeps a claimed range alive from a background thread until every ID
+    handed out from it has been written. `outstanding` holds the ones still
+    being fetched or waiting in the bulk writer, and progress only goes past
+    an ID once it is in the DB."""
+
+    def __init__(self, worker_id, range_start, range_end, progress, lease_seconds):
+        self.worker_id = worker_id
+        self.range_start = range_start
+        self.range_end = range_end
+        self.progress = progress
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self.released = threading.Event()
+
+        self.outstanding = set()
+        self.handed_out = range_start - 1
+        self.yielding = True
+        self.incomplete = False
+
+        self.thread = threading.Thread(target=self._heartbeat, name=f"lease-{range_start}", daemon=True)
+        self.thread.start()
+
+    def _heartbeat(self):
+        while not self.released.wait(self.lease_seconds / 3):
+            if not SQL_heartbeat_range(self.worker_id, self.range_start, self.progress, self.lease_seconds):
+                logging.warning(f"Lost lease on range starting {self.range_start}")
+                self.lost = True
+                return
+
+    def hand_out(self, number):
+        # caller must hold _leases_lock
+        self.outstanding.add(number)
+        self.handed_out = number
+
+    def settle(self, number, failed=False):
+        # caller must hold _leases_lock
+        self.outstanding.discard(number)
+        self.incomplete = self.incomplete or failed
+        # everything below the lowest outstanding ID has been handed out and written
+        self.progress = min(self.outstanding, default=self.handed_out + 1) - 1
+
+    def is_settled(self):
+        return not self.yielding and not self.outstanding
+
+    def release(self):
+        self.released.set()
+        self.thread.join()
+
+# ranges this node holds that still have IDs being fetched or written
+_open_leases = []
+_leases_lock = threading.Lock()
+
+def _close_lease(lease):
+    """Finish a range whose IDs are all written. One with IDs that failed to
+    fetch, or that was stopped before handing out all of them, is left to
+    expire instead, so another node (or a later claim) tries them again."""
+    lease.release()
+    if lease.lost:
+        return
+
+    if lease.incomplete:
+        logging.info(f"Leaving range {lease.range_start}..{lease.range_end} to expire, not every ID in it was written")
+        return
+
+    SQL_finish_range(lease.worker_id, lease.range_start, lease.range_end + 1)
+    logging.info(f"Finished range {lease.range_start}..{lease.range_end}")
+
+def _settle(numbers, failed=False):
+    if not _open_leases:
+        return
+
+    settled = []
+    with _leases_lock:
+        for number in numbers:
+            for lease in _open_leases:
+                if lease.range_start <= number <= lease.range_end:
+                    lease.settle(number, failed)
+                    break
+
+        for lease in list(_open_leases):
+            if lease.is_settled() or lease.lost:
+                _open_leases.remove(lease)
+                settled.append(lease)
+
+    for lease in settled:
+        _close_lease(lease)
+
+def record_written(numbers):
+    """IDs that are now in the DB, as a report, tombstone or dead letter. The
+    bulk writer calls this once a batch is committed, the direct write paths
+    once their transaction is."""
+    _settle(numbers)
+
+def record_failed(numbers):
+    """IDs that will not be written this run, e.g. after failing to fetch."""
+    _settle(numbers, failed=True)
+
+def leased_strategy(highest_number: int, range_size: int = 1000, lease_seconds: int = 300):
+    """Process 1..highest_number in ranges leased from the work_leases table, so
+    several nodes can share the work without fetching the same IDs. A range
+    whose owner stops heartbeating is picked up by another node. A range is
+    only marked done once every ID in it has been written, not as soon as
+    the last one is handed out."""
+    worker_id = get_worker_id()
+    logging.info(f"Using leased number ranges as {worker_id}")
+
+    scraped_ids = src.get_scraped_ids()
+    SQL_create_work_leases_table()
+    SQL_create_work_ranges(highest_number, range_size)
+
+    while True:
+        claimed = SQL_claim_range(worker_id, lease_seconds)
+        if claimed is None:
+            logging.info("No work ranges left to claim")
+            return
+
+        range_start, range_end, progress = claimed
+        logging.info(f"Claimed range {range_start}..{range_end} (progress {progress})")
+
+        # go by what is in the DB rather than the bitmap, which also holds IDs
+        # this node failed to fetch or hasn't flushed yet. Other nodes may
+        # have written IDs here since it was loaded, too.
+        written = SQL_get_ids_in_range(range_start, range_end)
+        scraped_ids.add_many(written)
+        written = set(written)
+
+        lease = Lease(worker_id, range_start, range_end, progress, lease_seconds)
+        with _leases_lock:
+            _open_leases.append(lease)
+
+        handed_out_all = False
+        try:
+            # scan the whole range, anything a crashed owner never wrote is still missing
+            for number in range(range_start, range_end + 1):
+                if number in written:
+                    continue
+                if lease.lost:
+                    break
+                with _leases_lock:
+                    lease.hand_out(number)
+                STRATEGY_NUMBERS.inc("leased", "yielded")
+                yield number
+            handed_out_all = not lease.lost
+        finally:
+            # finished once the IDs handed out are written, see record_written
+            with _leases_lock:
+                lease.yielding = False
+                lease.incomplete = lease.incomplete or not handed_out_all
+            _settle(())